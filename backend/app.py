@@ -1,13 +1,55 @@
-from flask import Flask, request, jsonify
+from flask import Flask, g, request, jsonify
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 import pandas as pd
-from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS, TfidfVectorizer
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.decomposition import TruncatedSVD
 from sklearn.metrics.pairwise import cosine_similarity
+import scipy.sparse as sp
 from datetime import datetime
 import numpy as np
-from collections import defaultdict
+from collections import Counter, OrderedDict, defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from array import array
+import atexit
+import base64
+import bisect
+import functools
+import gzip
+import hashlib
+import hmac
 import json
+import multiprocessing
+from multiprocessing import shared_memory
 import os
+import queue
+import random
+import re
+import shutil
+import signal
+import sqlite3
+import sys
+import threading
+import time
+import traceback
+import unicodedata
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: không có flock, log lịch sử search chỉ an toàn với một process ghi
+    fcntl = None
 
 app = Flask(__name__)
 
@@ -26,17 +68,702 @@ def after_request(response):
     response.headers.add('Access-Control-Allow-Credentials', 'true')
     return response
 
+# ==================== INSTRUMENTATION ====================
+# INSTRUMENTATION=off tắt span, histogram và log theo request (chỉ còn log warning/error)
+INSTRUMENTATION = os.environ.get('INSTRUMENTATION', 'on').lower() not in ('0', 'off', 'false', 'no')
+
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                   0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class Histogram:
+    """Histogram bucket cố định theo bộ label, xuất ra dạng Prometheus"""
+    
+    def __init__(self, name, help_text, label_names, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+    
+    def observe(self, labels, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+    
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = [(labels, list(counts), total) for labels, (counts, total) in self._series.items()]
+        for labels, counts, total in sorted(series):
+            label_text = ','.join(f'{name}="{value}"' for name, value in zip(self.label_names, labels))
+            prefix = label_text + ',' if label_text else ''
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{label_text}}} {total}')
+            lines.append(f'{self.name}_count{{{label_text}}} {cumulative}')
+        return lines
+
+class MetricsRegistry:
+    """Các histogram cùng gauge đọc từ stats() của các thành phần khác"""
+    
+    def __init__(self):
+        self.histograms = []
+        self.gauges = []
+    
+    def histogram(self, name, help_text, label_names=()):
+        histogram = Histogram(name, help_text, tuple(label_names))
+        self.histograms.append(histogram)
+        return histogram
+    
+    def gauge(self, name, help_text, read, kind='gauge'):
+        """`read()` trả về số, hoặc None nếu chưa có giá trị; kind='counter' cho giá trị chỉ tăng"""
+        self.gauges.append((name, help_text, read, kind))
+    
+    def expose(self):
+        lines = []
+        for histogram in self.histograms:
+            lines.extend(histogram.expose())
+        for name, help_text, read, kind in self.gauges:
+            try:
+                value = read()
+            except Exception:
+                value = None
+            if value is not None:
+                lines.extend([f'# HELP {name} {help_text}', f'# TYPE {name} {kind}', f'{name} {value}'])
+        return '\n'.join(lines) + '\n'
+
+METRICS = MetricsRegistry()
+REQUEST_SECONDS = METRICS.histogram(
+    'http_request_duration_seconds', 'Thời gian xử lý request theo route', ('route', 'method', 'status'))
+STAGE_SECONDS = METRICS.histogram(
+    'stage_duration_seconds', 'Thời gian từng bước xử lý (parse, vectorize, score, ...)', ('stage',))
+
+class _Span:
+    __slots__ = ('stage', 'start')
+    
+    def __init__(self, stage):
+        self.stage = stage
+    
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+    
+    def __exit__(self, *exc_info):
+        STAGE_SECONDS.observe((self.stage,), time.perf_counter() - self.start)
+        return False
+
+class _NoopSpan:
+    __slots__ = ()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        return False
+
+_NOOP_SPAN = _NoopSpan()
+
+def span(stage):
+    """Context manager đo thời gian một bước vào STAGE_SECONDS"""
+    return _Span(stage) if INSTRUMENTATION else _NOOP_SPAN
+
+LOG_LEVELS = {'debug': 10, 'info': 20, 'warning': 30, 'error': 40}
+
+class StructuredLogger:
+    """Log mỗi sự kiện thành một dòng JSON; debug/info được lấy mẫu theo `sample_rate`"""
+    
+    def __init__(self, level='info', sample_rate=1.0, stream=None):
+        self.level = LOG_LEVELS[level]
+        self.sample_rate = sample_rate
+        self.stream = stream or sys.stdout
+        self.sampled_out = 0
+    
+    def log(self, level, event, **fields):
+        level_number = LOG_LEVELS[level]
+        if level_number < self.level:
+            return
+        if level_number < LOG_LEVELS['warning'] and self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            self.sampled_out += 1
+            return
+        record = {'ts': round(time.time(), 3), 'level': level, 'event': event}
+        record.update(fields)
+        # Một lần write() cho cả dòng để log của các thread không xen kẽ
+        self.stream.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+    
+    def debug(self, event, **fields):
+        self.log('debug', event, **fields)
+    
+    def info(self, event, **fields):
+        self.log('info', event, **fields)
+    
+    def warning(self, event, **fields):
+        self.log('warning', event, **fields)
+    
+    def error(self, event, exc_info=False, **fields):
+        if exc_info:
+            fields['traceback'] = traceback.format_exc()
+        self.log('error', event, **fields)
+
+LOG = StructuredLogger(
+    level=os.environ.get('LOG_LEVEL', 'info' if INSTRUMENTATION else 'warning'),
+    sample_rate=float(os.environ.get('LOG_SAMPLE', 0.1)),
+)
+
+# Khóa HMAC cho id user trong log; không đặt thì mỗi lần khởi động sinh khóa ngẫu nhiên
+# (các worker fork từ serve.py dùng chung), nên không đối chiếu được log giữa các lần chạy
+LOG_USER_KEY = os.environ.get('LOG_USER_KEY', '').encode('utf-8') or os.urandom(16)
+
+def user_ref(email):
+    """Id ẩn danh của user để ghi log thay cho email (PII): HMAC-SHA256 rút gọn của email"""
+    if not email:
+        return None
+    return hmac.new(LOG_USER_KEY, str(email).strip().lower().encode('utf-8'), hashlib.sha256).hexdigest()[:16]
+
+@app.before_request
+def start_request_timer():
+    if INSTRUMENTATION:
+        g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_duration(response):
+    start = g.get('request_start') if INSTRUMENTATION else None
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        REQUEST_SECONDS.observe((route, request.method, str(response.status_code)), time.perf_counter() - start)
+    return response
+
+# ==================== SERIALIZATION ====================
+# JSON_ENCODER=json buộc dùng json chuẩn kể cả khi đã cài orjson
+JSON_ENCODER = os.environ.get('JSON_ENCODER', 'orjson').lower()
+if orjson is None:
+    JSON_ENCODER = 'json'
+
+def json_dumps(value, sort_keys=False, default=None):
+    """JSON str không escape Unicode (như ensure_ascii=False), bằng orjson nếu được bật"""
+    if JSON_ENCODER == 'orjson':
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        try:
+            return orjson.dumps(value, default=default, option=option).decode('utf-8')
+        except orjson.JSONEncodeError:
+            pass  # Kiểu orjson không hỗ trợ (vd. int > 64 bit): dùng json chuẩn
+    return json.dumps(value, ensure_ascii=False, sort_keys=sort_keys, default=default)
+
+class FastJSONProvider(DefaultJSONProvider):
+    """JSON provider của jsonify: ghi UTF-8 trực tiếp, orjson cho response gọn (json chuẩn khi cần indent)"""
+    ensure_ascii = False
+    
+    def dumps(self, obj, **kwargs):
+        if 'indent' in kwargs:
+            return super().dumps(obj, **kwargs)
+        return json_dumps(obj, sort_keys=self.sort_keys, default=self.default)
+
+app.json = FastJSONProvider(app)
+
+# Nén response theo Accept-Encoding (br khi có module brotli, gzip); body nhỏ hơn COMPRESS_MIN_BYTES giữ nguyên
+RESPONSE_COMPRESSION = os.environ.get('RESPONSE_COMPRESSION', 'on').lower() not in ('0', 'off', 'false', 'no')
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', 1024))
+COMPRESS_LEVELS = {
+    'gzip': int(os.environ.get('GZIP_LEVEL', 6)),
+    'br': int(os.environ.get('BROTLI_QUALITY', 5)),
+}
+# Mức nén cao nhất cho body tính sẵn (chỉ nén một lần)
+MAX_COMPRESS_LEVELS = {'gzip': 9, 'br': 11}
+COMPRESSIBLE_MIMETYPES = ('application/json', 'text/plain')
+
+def compress(body, encoding, levels=COMPRESS_LEVELS):
+    if encoding == 'br':
+        return brotli.compress(body, quality=levels['br'])
+    return gzip.compress(body, compresslevel=levels['gzip'], mtime=0)
+
+def negotiate_encoding():
+    """Encoding nén mà client chấp nhận (ưu tiên br), None nếu không nén"""
+    if not RESPONSE_COMPRESSION:
+        return None
+    return request.accept_encodings.best_match(('br', 'gzip') if brotli is not None else ('gzip',))
+
+@app.after_request
+def compress_response(response):
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+    body = response.get_data()
+    if len(body) < COMPRESS_MIN_BYTES:
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate_encoding()
+    if encoding is None:
+        return response
+    with span('compress'):
+        response.set_data(compress(body, encoding))
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag(f'{etag}-{encoding}', weak)
+    return response
+
 # ==================== DATABASE ====================
-USERS = {}
-USER_VIEW_HISTORY = defaultdict(list)
-USER_SEARCH_HISTORY = defaultdict(list)
+class IdRingBuffer:
+    """Ring buffer int64 dung lượng cố định cho product id, kèm set để kiểm tra trùng O(1)"""
+    
+    def __init__(self, capacity, ids=()):
+        self.capacity = capacity
+        self._items = array('q', bytes(8 * capacity))
+        self._start = 0
+        self._size = 0
+        self._members = set()
+        for product_id in ids:
+            self.append(product_id)
+    
+    def append(self, product_id):
+        """Thêm id (bỏ qua nếu đã có); khi đầy thì ghi đè id cũ nhất"""
+        if product_id in self._members:
+            return False
+        if self._size == self.capacity:
+            self._members.discard(self._items[self._start])
+            self._items[self._start] = product_id
+            self._start = (self._start + 1) % self.capacity
+        else:
+            self._items[(self._start + self._size) % self.capacity] = product_id
+            self._size += 1
+        self._members.add(product_id)
+        return True
+    
+    def __contains__(self, product_id):
+        return product_id in self._members
+    
+    def __len__(self):
+        return self._size
+    
+    def tolist(self):
+        """Các id theo thứ tự cũ -> mới"""
+        end = self._start + self._size
+        if end <= self.capacity:
+            return self._items[self._start:end].tolist()
+        return self._items[self._start:].tolist() + self._items[:end - self.capacity].tolist()
+    
+    def tobytes(self):
+        return array('q', self.tolist()).tobytes()
+    
+    @classmethod
+    def frombytes(cls, capacity, data):
+        ids = array('q')
+        ids.frombytes(data or b'')
+        return cls(capacity, ids)
+    
+    def nbytes(self):
+        return sys.getsizeof(self._items) + sys.getsizeof(self._members)
+
+class UserState:
+    """Trạng thái một user: tài khoản, sản phẩm đã xem, truy vấn gần đây"""
+    
+    __slots__ = ('account', 'views', 'searches', 'updated_at', 'dirty', 'nbytes')
+    
+    def __init__(self, account=None, views=(), searches=(), updated_at=None):
+        self.account = account
+        self.views = IdRingBuffer(MAX_VIEW_HISTORY, views)
+        self.searches = deque(searches, maxlen=MAX_SEARCH_HISTORY)
+        self.updated_at = updated_at or time.time()
+        self.dirty = False
+        self.nbytes = 0
+    
+    def estimate_nbytes(self):
+        size = 256 + self.views.nbytes() + sys.getsizeof(self.searches)
+        size += sum(sys.getsizeof(query) for query in self.searches)
+        if self.account is not None:
+            size += len(json.dumps(self.account, ensure_ascii=False))
+        return size
+    
+    def to_record(self):
+        """(account JSON, views int64 bytes, searches JSON, updated_at)"""
+        account = json.dumps(self.account, ensure_ascii=False) if self.account is not None else None
+        return (account,) + self.history_record()
+    
+    def history_record(self):
+        """(views int64 bytes, searches JSON, updated_at): phần được ghi khi flush"""
+        return self.views.tobytes(), json.dumps(list(self.searches), ensure_ascii=False), self.updated_at
+    
+    @classmethod
+    def from_record(cls, record):
+        account, views, searches, updated_at = record
+        state = cls(json.loads(account) if account else None, (), json.loads(searches or '[]'), updated_at)
+        state.views = IdRingBuffer.frombytes(MAX_VIEW_HISTORY, views)
+        return state
+
+class MemoryUserBackend:
+    """Backend trong RAM, KHÔNG giới hạn: giữ record của mọi user tới khi process thoát.
+
+    Chỉ dùng cho dev/test (USER_STATE_BACKEND=memory); giới hạn max_users/max_bytes
+    của UserStateStore chỉ áp cho cache, không áp cho backend này.
+    """
+    
+    def __init__(self):
+        self._records = {}
+        self._lock = threading.Lock()
+    
+    def load(self, email):
+        with self._lock:
+            return self._records.get(email)
+    
+    def save_history(self, items):
+        """Ghi {email: (views, searches, updated_at)}, giữ nguyên tài khoản"""
+        with self._lock:
+            for email, (views, searches, updated_at) in items.items():
+                record = self._records.get(email)
+                self._records[email] = (record[0] if record else None, views, searches, updated_at)
+    
+    def create_account(self, email, account, updated_at):
+        """Ghi tài khoản mới; False nếu email đã có tài khoản"""
+        with self._lock:
+            record = self._records.get(email)
+            if record is not None and record[0] is not None:
+                return False
+            views, searches = (record[1], record[2]) if record else (b'', '[]')
+            self._records[email] = (json.dumps(account, ensure_ascii=False), views, searches, updated_at)
+            return True
+    
+    def update_account(self, email, change):
+        """Áp `change(account)` lên tài khoản đang lưu; trả về tài khoản mới, None nếu chưa có tài khoản"""
+        with self._lock:
+            record = self._records.get(email)
+            if record is None or record[0] is None:
+                return None
+            account = json.loads(record[0])
+            change(account)
+            self._records[email] = (json.dumps(account, ensure_ascii=False),) + tuple(record[1:])
+            return account
+    
+    def iter_records(self):
+        with self._lock:
+            items = list(self._records.items())
+        return iter(items)
+    
+    def count_accounts(self):
+        with self._lock:
+            return sum(1 for record in self._records.values() if record[0] is not None)
+
+class SQLiteUserBackend:
+    """Backend SQLite cục bộ để trạng thái user còn lại sau khi restart"""
+    
+    def __init__(self, path):
+        self.path = path
+        self._conn = None
+        self._pid = None
+        self._lock = threading.Lock()
+    
+    def _connection(self):
+        # Mỗi process (kể cả worker fork từ serve.py) mở connection riêng
+        if self._conn is None or self._pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=10)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS user_state ('
+                'email TEXT PRIMARY KEY, account TEXT, views BLOB, searches TEXT, updated_at REAL)'
+            )
+            self._migrate(self._conn)
+            self._pid = os.getpid()
+        return self._conn
+    
+    @staticmethod
+    def _migrate(conn):
+        """user_version 0 -> 1: views từ int32 sang int64"""
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            if conn.execute('PRAGMA user_version').fetchone()[0] >= 1:
+                return
+            rows = conn.execute('SELECT email, views FROM user_state WHERE views IS NOT NULL').fetchall()
+            converted = []
+            for email, views in rows:
+                ids = array('i')
+                ids.frombytes(views)
+                converted.append((array('q', ids).tobytes(), email))
+            conn.executemany('UPDATE user_state SET views = ? WHERE email = ?', converted)
+            conn.execute('PRAGMA user_version = 1')
+    
+    def load(self, email):
+        with self._lock:
+            row = self._connection().execute(
+                'SELECT account, views, searches, updated_at FROM user_state WHERE email = ?', (email,)
+            ).fetchone()
+        return tuple(row) if row else None
+    
+    def save_history(self, items):
+        """Ghi {email: (views, searches, updated_at)}; chỉ cập nhật cột lịch sử để cache cũ của
+        process khác không ghi đè tài khoản/profile mới hơn"""
+        rows = [(email,) + tuple(record) for email, record in items.items()]
+        if not rows:
+            return
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.executemany(
+                    'INSERT INTO user_state (email, account, views, searches, updated_at) VALUES (?, NULL, ?, ?, ?) '
+                    'ON CONFLICT(email) DO UPDATE SET views = excluded.views, searches = excluded.searches, '
+                    'updated_at = excluded.updated_at', rows)
+    
+    def create_account(self, email, account, updated_at):
+        """Ghi tài khoản mới; False nếu email đã có tài khoản (kể cả do process khác tạo)"""
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                cursor = conn.execute(
+                    'INSERT INTO user_state (email, account, views, searches, updated_at) VALUES (?, ?, ?, ?, ?) '
+                    'ON CONFLICT(email) DO UPDATE SET account = excluded.account, updated_at = excluded.updated_at '
+                    'WHERE user_state.account IS NULL',
+                    (email, json.dumps(account, ensure_ascii=False), b'', '[]', updated_at))
+            return cursor.rowcount > 0
+    
+    def update_account(self, email, change):
+        """Áp `change(account)` lên tài khoản đang lưu trong một transaction; None nếu chưa có tài khoản"""
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute('BEGIN IMMEDIATE')
+                row = conn.execute('SELECT account FROM user_state WHERE email = ?', (email,)).fetchone()
+                if row is None or row[0] is None:
+                    return None
+                account = json.loads(row[0])
+                change(account)
+                conn.execute('UPDATE user_state SET account = ?, updated_at = ? WHERE email = ?',
+                             (json.dumps(account, ensure_ascii=False), time.time(), email))
+            return account
+    
+    def iter_records(self):
+        with self._lock:
+            rows = self._connection().execute(
+                'SELECT email, account, views, searches, updated_at FROM user_state'
+            ).fetchall()
+        return ((row[0], tuple(row[1:])) for row in rows)
+    
+    def count_accounts(self):
+        with self._lock:
+            return self._connection().execute(
+                'SELECT COUNT(*) FROM user_state WHERE account IS NOT NULL'
+            ).fetchone()[0]
+
+USER_STATE_BACKENDS = {
+    'memory': lambda: MemoryUserBackend(),
+    'sqlite': lambda: SQLiteUserBackend(os.environ.get('USER_STATE_DB', 'data/user_state.sqlite3')),
+}
+
+MAX_VIEW_HISTORY = 50
+MAX_SEARCH_HISTORY = 20
+
+class UserStateStore:
+    """Trạng thái user: cache LRU trong RAM (giới hạn số user và số byte) trên một backend.
+
+    RAM chỉ bị chặn khi backend nằm trên đĩa (sqlite, mặc định); với backend
+    memory, user bị đẩy khỏi cache vẫn được giữ trong backend.
+
+    Tài khoản/profile được ghi thẳng xuống backend (backend là nguồn đúng, cache
+    được cập nhật theo kết quả); lịch sử xem/tìm kiếm được đánh dấu dirty và chỉ
+    các cột lịch sử được một thread nền ghi theo chu kỳ (và lúc thoát), ngoài
+    lock của request. Record của user bị đẩy khỏi cache nằm trong `_pending`
+    tới khi ghi xong, để lần đọc lại không thấy bản cũ trong backend.
+    """
+    
+    def __init__(self, backend, max_users=100000, max_bytes=64 * 1024 * 1024, flush_interval=5.0):
+        self.backend = backend
+        self.max_users = max_users
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_interval
+        self.evictions = 0
+        self._states = OrderedDict()
+        self._dirty = set()
+        self._pending = {}
+        self._nbytes = 0
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        atexit.register(self.flush)
+    
+    def _ensure_flusher(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='user-state-flusher', daemon=True)
+                self._thread.start()
+    
+    def reset_after_fork(self):
+        """Trong process con vừa fork: bỏ thread và lock của process cha (process cha tự ghi phần dirty của nó)"""
+        self._dirty = set()
+        self._pending = {}
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self._ensure_flusher()
+    
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                LOG.error('user_state_flush_error', error=str(e))
+    
+    def _state(self, email, create=False):
+        state = self._states.get(email)
+        if state is not None:
+            self._states.move_to_end(email)
+            return state
+        record = self.backend.load(email)
+        pending = self._pending.get(email)
+        if pending is not None:
+            # Lịch sử chưa ghi xuống backend mới hơn bản trong backend
+            record = ((record[0] if record else None),) + pending
+        if record is None and not create:
+            return None
+        state = UserState.from_record(record) if record is not None else UserState()
+        self._states[email] = state
+        self._resize(state)
+        return state
+    
+    def _resize(self, state):
+        nbytes = state.estimate_nbytes()
+        self._nbytes += nbytes - state.nbytes
+        state.nbytes = nbytes
+    
+    def _touch(self, email, state):
+        state.updated_at = time.time()
+        self._resize(state)
+        self._dirty.add(email)
+        self._evict()
+        self._ensure_flusher()
+    
+    def _evict(self):
+        while len(self._states) > 1 and (len(self._states) > self.max_users or self._nbytes > self.max_bytes):
+            email, state = self._states.popitem(last=False)
+            self._nbytes -= state.nbytes
+            self.evictions += 1
+            if email in self._dirty:
+                self._dirty.discard(email)
+                self._pending[email] = state.history_record()
+    
+    def flush(self):
+        """Ghi lịch sử của các user dirty/đã bị đẩy khỏi cache xuống backend (ngoài lock của request)"""
+        with self._flush_lock:
+            with self._lock:
+                for email in self._dirty:
+                    if email in self._states:
+                        self._pending[email] = self._states[email].history_record()
+                self._dirty.clear()
+                items = dict(self._pending)
+            if not items:
+                return
+            self.backend.save_history(items)
+            with self._lock:
+                for email, record in items.items():
+                    if self._pending.get(email) is record:
+                        del self._pending[email]
+    
+    def get_account(self, email):
+        with self._lock:
+            state = self._state(email)
+            return dict(state.account) if state is not None and state.account is not None else None
+    
+    def create_account(self, email, account):
+        """Tạo tài khoản; False nếu email đã tồn tại"""
+        with self._lock:
+            state = self._state(email, create=True)
+            if state.account is not None:
+                return False
+            if not self.backend.create_account(email, account, time.time()):
+                # Process khác vừa tạo tài khoản này: nạp lại từ backend
+                state.account = UserState.from_record(self.backend.load(email)).account
+                self._resize(state)
+                return False
+            state.account = account
+            self._resize(state)
+            self._evict()
+            return True
+    
+    def update_profile(self, email, profile):
+        with self._lock:
+            state = self._state(email)
+            if state is None:
+                return False
+            account = self.backend.update_account(email, lambda account: account.update(profile=profile))
+            if account is None:
+                return False
+            state.account = account
+            self._resize(state)
+            return True
+    
+    def record_view(self, email, product_id):
+        """Thêm sản phẩm vào lịch sử xem; trả về (có thêm mới không, số sản phẩm đã xem)"""
+        with self._lock:
+            state = self._state(email, create=True)
+            added = state.views.append(product_id)
+            if added:
+                self._touch(email, state)
+            return added, len(state.views)
+    
+    def record_search(self, email, query):
+        with self._lock:
+            state = self._state(email, create=True)
+            state.searches.append(query)
+            self._touch(email, state)
+    
+    def history(self, email):
+        """(product id đã xem, truy vấn gần đây), cũ -> mới"""
+        with self._lock:
+            state = self._state(email)
+            if state is None:
+                return [], []
+            return state.views.tolist(), list(state.searches)
+    
+    def iter_users(self):
+        """(email, account, số sản phẩm đã xem, số truy vấn) của mọi user (dùng cho debug)"""
+        self.flush()
+        for email, record in self.backend.iter_records():
+            state = UserState.from_record(record)
+            yield email, state.account, len(state.views), len(state.searches)
+    
+    def __len__(self):
+        """Số tài khoản đã đăng ký"""
+        return self.backend.count_accounts()
+    
+    def stats(self):
+        with self._lock:
+            return {
+                "backend": type(self.backend).__name__,
+                "cached_users": len(self._states),
+                "cached_bytes": self._nbytes,
+                "max_users": self.max_users,
+                "max_bytes": self.max_bytes,
+                "dirty": len(self._dirty) + len(self._pending),
+                "evictions": self.evictions,
+            }
+
+USER_STORE = UserStateStore(
+    USER_STATE_BACKENDS[os.environ.get('USER_STATE_BACKEND', 'sqlite')](),
+    max_users=int(os.environ.get('USER_STATE_MAX_USERS', 100000)),
+    max_bytes=int(os.environ.get('USER_STATE_MAX_BYTES', 64 * 1024 * 1024)),
+)
 
 # ==================== LOAD DATA ====================
-def load_healthcare_data():
+DATA_FILE = os.environ.get('DATA_FILE', 'healthcare_data.csv')
+MODEL_DIR = os.environ.get('MODEL_DIR', 'model')
+
+def load_healthcare_data(path=DATA_FILE):
     """Load và xử lý dữ liệu sản phẩm"""
     try:
-        df = pd.read_csv('healthcare_data.csv', encoding='utf-8-sig')
-        print(f"Loaded {len(df)} products")
+        df = pd.read_csv(path, encoding='utf-8-sig')
         
         # Chuẩn hóa dữ liệu
         df = df.fillna('')
@@ -48,97 +775,2070 @@ def load_healthcare_data():
             df['weight_range'] = '45-90'
         
         # Tạo features cho ML với các trường mới
+        # Các trường ngăn bởi ', ' để analyzer không ghép từ qua ranh giới trường
         df['features'] = (
-            df['name'].str.lower() + " " + 
-            df['category'].str.lower() + " " + 
-            df['description'].str.lower() + " " + 
-            df['target_gender'].str.lower() + " " + 
-            df['health_goal'].str.lower() + " " +
-            df['age_range'].astype(str) + " " +
+            df['name'].str.lower() + ", " + 
+            df['category'].str.lower() + ", " + 
+            df['description'].str.lower() + ", " + 
+            df['target_gender'].str.lower() + ", " + 
+            df['health_goal'].str.lower() + ", " +
+            df['age_range'].astype(str) + ", " +
             df['weight_range'].astype(str)
         )
         
-        print(f"📊 Data sample:")
-        print(f"  - Categories: {df['category'].unique()[:10]}")
-        print(f"  - Target genders: {df['target_gender'].unique()}")
-        print(f"  - Age ranges: {df['age_range'].unique()[:5]}")
+        LOG.info('data_loaded', path=path, products=len(df), categories=int(df['category'].nunique()),
+                 target_genders=df['target_gender'].unique().tolist()[:10])
         
         return df
         
     except Exception as e:
-        print(f"Error loading data: {e}")
-        import traceback
-        traceback.print_exc()
+        LOG.error('data_load_error', path=path, error=str(e), exc_info=True)
         return pd.DataFrame()
 
-# Load data khi server start
-PRODUCTS_DF = load_healthcare_data()
+# ==================== TEXT ANALYZER ====================
+VIETNAMESE_STOP_WORDS = frozenset("""
+    và của có các những cho với là trong được một không khi để này đã thì hay hoặc
+    bị từ theo nhiều rất cũng như vào ra sau trước nên do lại mà về tại đến nhưng
+    nếu vì còn đó đây nào ai gì sẽ đang vẫn chỉ mỗi từng cả qua lên xuống bởi hơn
+    thường luôn rằng thế vậy ở
+""".split())
+
+def fold_diacritics(token):
+    """Bỏ dấu tiếng Việt: 'mệt' -> 'met', 'đề' -> 'de'"""
+    decomposed = unicodedata.normalize('NFD', token.replace('đ', 'd').replace('Đ', 'D'))
+    return ''.join(ch for ch in decomposed if unicodedata.category(ch) != 'Mn')
+
+class DefaultAnalyzer:
+    """Analyzer gốc của TfidfVectorizer với stop words tiếng Anh"""
+    name = 'default'
+    
+    def __init__(self):
+        self._analyze = TfidfVectorizer(stop_words='english').build_analyzer()
+    
+    def fit(self, documents):
+        return self
+    
+    def __call__(self, document):
+        return self._analyze(document)
+    
+    def get_state(self):
+        return {}
+    
+    @classmethod
+    def from_state(cls, state):
+        return cls()
+
+class VietnameseAnalyzer:
+    """Analyzer cho mô tả tiếng Việt dùng làm `analyzer` của TfidfVectorizer.
+
+    Mỗi cụm (ngăn bởi dấu câu) được tách thành âm tiết, bỏ stop words tiếng
+    Việt/Anh, bỏ dấu để query không dấu vẫn khớp. Ngoài từng âm tiết còn sinh
+    từ ghép hai âm tiết liền nhau ('met_moi') nếu từ ghép đó xuất hiện trong
+    ít nhất `min_compound_df` sản phẩm lúc fit. Kết quả chuẩn hóa từng token
+    và từng cụm được cache vì mô tả sản phẩm lặp lại rất nhiều cụm.
+    """
+    name = 'vietnamese'
+    PHRASE_PATTERN = re.compile(r'[^,.;:!?()\[\]{}"\n]+')
+    TOKEN_PATTERN = re.compile(r'(?u)\b\w\w+\b')
+    MAX_CACHED_TOKENS = 100_000
+    
+    def __init__(self, compounds=(), min_compound_df=3):
+        self.compounds = frozenset(compounds)
+        self.min_compound_df = min_compound_df
+        self._token_cache = {}
+        self._phrase_cache = {}
+    
+    def _normalize(self, token):
+        """Token đã bỏ dấu, None nếu là stop word hoặc chỉ gồm chữ số"""
+        normalized = self._token_cache.get(token)
+        if normalized is None:
+            # Số thuần (age/weight range) đã có bộ lọc demographic riêng
+            if token in VIETNAMESE_STOP_WORDS or token in ENGLISH_STOP_WORDS or token.isdigit():
+                normalized = ''
+            else:
+                normalized = fold_diacritics(token)
+            if len(self._token_cache) >= self.MAX_CACHED_TOKENS:
+                self._token_cache.clear()
+            self._token_cache[token] = normalized
+        return normalized or None
+    
+    def _tokens(self, phrase):
+        """Token đã chuẩn hóa của một cụm (None ở vị trí stop word), cache theo cụm"""
+        tokens = self._phrase_cache.get(phrase)
+        if tokens is None:
+            tokens = [self._normalize(token) for token in self.TOKEN_PATTERN.findall(phrase)]
+            if len(self._phrase_cache) >= self.MAX_CACHED_TOKENS:
+                self._phrase_cache.clear()
+            self._phrase_cache[phrase] = tokens
+        return tokens
+    
+    def _phrases(self, document):
+        """Danh sách cụm, mỗi cụm là list token đã chuẩn hóa"""
+        document = unicodedata.normalize('NFC', str(document)).lower()
+        return [self._tokens(phrase.strip()) for phrase in self.PHRASE_PATTERN.findall(document)]
+    
+    @staticmethod
+    def _pairs(tokens):
+        return (f'{a}_{b}' for a, b in zip(tokens, tokens[1:]) if a and b)
+    
+    def fit(self, documents):
+        """Học tập từ ghép: cặp âm tiết liền nhau có mặt trong >= min_compound_df sản phẩm"""
+        document_frequency = defaultdict(int)
+        for document in documents:
+            pairs = set()
+            for tokens in self._phrases(document):
+                pairs.update(self._pairs(tokens))
+            for pair in pairs:
+                document_frequency[pair] += 1
+        self.compounds = frozenset(
+            pair for pair, count in document_frequency.items() if count >= self.min_compound_df
+        )
+        return self
+    
+    def __call__(self, document):
+        terms = []
+        for tokens in self._phrases(document):
+            terms.extend(token for token in tokens if token)
+            terms.extend(pair for pair in self._pairs(tokens) if pair in self.compounds)
+        return terms
+    
+    def get_state(self):
+        return {'compounds': sorted(self.compounds), 'min_compound_df': self.min_compound_df}
+    
+    @classmethod
+    def from_state(cls, state):
+        return cls(**state)
+
+TEXT_ANALYZERS = {
+    DefaultAnalyzer.name: DefaultAnalyzer,
+    VietnameseAnalyzer.name: VietnameseAnalyzer,
+}
+
+# ==================== SPELL CORRECTION ====================
+def edit_distance(a, b, max_distance):
+    """Khoảng cách Damerau-Levenshtein (OSA) giữa a và b; trả về max_distance + 1 khi chắc chắn vượt ngưỡng"""
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    before = None
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i] + [0] * len(b)
+        for j, char_b in enumerate(b, 1):
+            value = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b))
+            if before is not None and j > 1 and char_a == b[j - 2] and a[i - 2] == char_b:
+                value = min(value, before[j - 2] + 1)
+            current[j] = value
+        if min(current) > max_distance:
+            return max_distance + 1
+        before, previous = previous, current
+    return previous[-1]
+
+def trigrams(term):
+    padded = f'${term}$'
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class _GramPostings:
+    """Trigram -> term ids đọc từ grams đã sắp xếp + CSR (memory-mapped), tra bằng tìm nhị phân"""
+    
+    def __init__(self, grams, indptr, terms):
+        self.grams = grams
+        self.indptr = indptr
+        self.terms = terms
+    
+    def _position(self, gram):
+        i = int(np.searchsorted(self.grams, gram))
+        return i if i < len(self.grams) and self.grams[i] == gram else None
+    
+    def __contains__(self, gram):
+        return self._position(gram) is not None
+    
+    def __getitem__(self, gram):
+        i = self._position(gram)
+        if i is None:
+            raise KeyError(gram)
+        return self.terms[self.indptr[i]:self.indptr[i + 1]]
+    
+    def __len__(self):
+        return len(self.grams)
+
+class TermCorrector:
+    """Sửa token ngoài vocabulary của TF-IDF về term gần nhất trước khi vectorize.
+
+    Ứng viên lấy từ trigram index (lọc theo số trigram chung tối thiểu ứng với
+    khoảng cách cho phép), rồi chọn bằng edit distance có giới hạn; hòa thì
+    ưu tiên term phổ biến hơn (idf thấp). Token dính chữ-số ('omega3') hoặc
+    dính hai term ('vitamind') được tách trước. Kết quả cache theo từ.
+    """
+    WORD_PATTERN = re.compile(r'\w+')
+    DIGIT_BOUNDARY = re.compile(r'\d+|[^\d]+')
+    MAX_CANDIDATES = 32
+    MAX_CACHED_WORDS = 100_000
+    
+    ARRAYS = ('term_ids', 'lengths', 'grams', 'gram_indptr', 'gram_terms')
+    
+    def __init__(self, vocabulary, idf):
+        self.vocabulary = vocabulary
+        self.terms = [term for term in vocabulary if '_' not in term and len(term) >= 2]
+        self.term_ids = np.array([vocabulary[term] for term in self.terms], dtype=np.int64)
+        self.lengths = np.array([len(term) for term in self.terms], dtype=np.int32)
+        self.idf = np.asarray(idf)[self.term_ids]
+        postings = defaultdict(list)
+        for i, term in enumerate(self.terms):
+            for gram in trigrams(term):
+                postings[gram].append(i)
+        self.postings = {gram: np.array(ids, dtype=np.int32) for gram, ids in postings.items()}
+        self._cache = {}
+    
+    def arrays(self):
+        """Trigram index dạng mảng (grams sắp xếp + CSR các term) để lưu vào artifact"""
+        arrays = {'term_ids': self.term_ids, 'lengths': self.lengths}
+        if isinstance(self.postings, _GramPostings):
+            arrays.update(grams=self.postings.grams, gram_indptr=self.postings.indptr,
+                          gram_terms=self.postings.terms)
+            return arrays
+        grams = sorted(self.postings)
+        lists = [self.postings[gram] for gram in grams]
+        indptr = np.zeros(len(grams) + 1, dtype=np.int64)
+        np.cumsum([len(ids) for ids in lists], out=indptr[1:])
+        arrays.update(
+            grams=np.array(grams, dtype=str).reshape(len(grams)),
+            gram_indptr=indptr,
+            gram_terms=np.concatenate(lists).astype(np.int32) if lists else np.empty(0, dtype=np.int32),
+        )
+        return arrays
+    
+    @classmethod
+    def from_arrays(cls, vocabulary, terms, idf, arrays):
+        """Corrector từ arrays() đã lưu (memory-map), không dựng lại trigram index; `terms` là vocabulary theo id"""
+        corrector = cls.__new__(cls)
+        corrector.vocabulary = vocabulary
+        corrector.term_ids = arrays['term_ids']
+        corrector.terms = [terms[i] for i in corrector.term_ids.tolist()]
+        corrector.lengths = arrays['lengths']
+        corrector.idf = np.asarray(idf)[corrector.term_ids]
+        corrector.postings = _GramPostings(arrays['grams'], arrays['gram_indptr'], arrays['gram_terms'])
+        corrector._cache = {}
+        return corrector
+    
+    @staticmethod
+    def max_distance(term):
+        return 1 if len(term) <= 5 else 2
+    
+    def closest(self, term):
+        """Term trong vocabulary gần `term` nhất, None nếu không có term nào đủ gần"""
+        max_distance = self.max_distance(term)
+        grams = [self.postings[gram] for gram in trigrams(term) if gram in self.postings]
+        if len(term) < 3 or not grams:
+            return None
+        counts = np.bincount(np.concatenate(grams), minlength=len(self.terms))
+        # q-gram lemma: mỗi phép sửa (kể cả đảo hai ký tự) làm mất tối đa 4 trigram chung
+        required = np.maximum(self.lengths, len(term)) - 4 * max_distance
+        keep = np.flatnonzero((counts >= np.maximum(required, 1)) &
+                              (np.abs(self.lengths - len(term)) <= max_distance))
+        if len(keep) > self.MAX_CANDIDATES:
+            keep = keep[np.argpartition(-counts[keep], self.MAX_CANDIDATES - 1)[:self.MAX_CANDIDATES]]
+        
+        best, best_key = None, None
+        for i in keep.tolist():
+            distance = edit_distance(term, self.terms[i], max_distance)
+            if distance <= max_distance and (best_key is None or (distance, self.idf[i]) < best_key):
+                best, best_key = self.terms[i], (distance, self.idf[i])
+        return best
+    
+    def split(self, term):
+        """Tách token dính: theo ranh giới chữ/số, hoặc thành hai term có trong vocabulary"""
+        parts = self.DIGIT_BOUNDARY.findall(term)
+        if len(parts) > 1:
+            return [part if part.isdigit() or part in self.vocabulary else (self.closest(part) or part)
+                    for part in parts]
+        for i in range(2, len(term) - 1):
+            if term[:i] in self.vocabulary and term[i:] in self.vocabulary:
+                return [term[:i], term[i:]]
+        return None
+    
+    def correct_word(self, word, analyzer):
+        """Từ đã sửa (có thể thành nhiều term), hoặc chính `word` nếu không cần/không sửa được"""
+        corrected = self._cache.get(word)
+        if corrected is not None:
+            return corrected
+        terms = analyzer(word)
+        if all(term in self.vocabulary for term in terms):
+            corrected = word
+        else:
+            fixed = []
+            for term in terms:
+                if term in self.vocabulary:
+                    fixed.append(term)
+                else:
+                    fixed.extend(self.split(term) or [self.closest(term) or term])
+            corrected = ' '.join(fixed)
+        if len(self._cache) >= self.MAX_CACHED_WORDS:
+            self._cache.clear()
+        self._cache[word] = corrected
+        return corrected
+    
+    def correct(self, query, analyzer):
+        """Query với từng từ ngoài vocabulary được thay bằng term gần nhất (giữ nguyên dấu câu)"""
+        return self.WORD_PATTERN.sub(lambda match: self.correct_word(match.group(0), analyzer), query.lower())
+
+# ==================== PRODUCT STORE ====================
+class FieldProjection:
+    """Tập trường sản phẩm được trả về: `include` (None = mọi trường) trừ `exclude`; luôn giữ id"""
+    __slots__ = ('include', 'exclude')
+    
+    def __init__(self, include=None, exclude=()):
+        self.include = None if include is None else frozenset(include) | {'id'}
+        self.exclude = frozenset(exclude) - {'id'}
+    
+    def __contains__(self, name):
+        return (self.include is None or name in self.include) and name not in self.exclude
+    
+    def project(self, product):
+        if self.include is None and not self.exclude:
+            return product
+        return {key: value for key, value in product.items() if key in self}
+
+ALL_PRODUCT_FIELDS = FieldProjection()
+# Mặc định bỏ cột `features` (text ghép nội bộ để vector hóa, chiếm phần lớn mỗi sản phẩm)
+DEFAULT_PRODUCT_FIELDS = FieldProjection(exclude=('features',))
+
+def parse_product_fields(value):
+    """Tham số fields (chuỗi 'a,b' hoặc list) -> FieldProjection; 'all' cho mọi trường"""
+    names = value.split(',') if isinstance(value, str) else (value or [])
+    names = [str(name).strip() for name in names if str(name).strip()]
+    if not names:
+        return DEFAULT_PRODUCT_FIELDS
+    if 'all' in names:
+        return ALL_PRODUCT_FIELDS
+    return FieldProjection(include=names)
+
+def _to_native(value):
+    """Chuyển numpy scalar sang kiểu Python để serialize JSON"""
+    return value.item() if isinstance(value, np.generic) else value
+
+class _BlobFragments:
+    """Dãy JSON fragment đọc từ một blob UTF-8 (memory-mapped) theo offsets"""
+    
+    def __init__(self, blob, offsets):
+        self.blob = blob
+        self.offsets = offsets
+    
+    def __len__(self):
+        return len(self.offsets) - 1
+    
+    def __getitem__(self, row):
+        start, end = self.offsets[row], self.offsets[row + 1]
+        return bytes(self.blob[start:end]).decode('utf-8')
+
+# Số record (dict) và fragment theo projection mặc định được giữ lại sau khi giải mã
+PRODUCT_RECORD_CACHE_SIZE = int(os.environ.get('PRODUCT_RECORD_CACHE_SIZE', 4096))
+
+class _LazyRecords:
+    """Dãy record giải mã từ fragment khi được truy cập, giữ PRODUCT_RECORD_CACHE_SIZE record gần nhất"""
+    
+    def __init__(self, fragments):
+        self.fragments = fragments
+        self._decode = functools.lru_cache(maxsize=PRODUCT_RECORD_CACHE_SIZE)(self._load)
+    
+    def __len__(self):
+        return len(self.fragments)
+    
+    def __getitem__(self, row):
+        return self._decode(int(row))
+    
+    def _load(self, row):
+        return json.loads(self.fragments[row] + '}')
+
+class ProductStore:
+    """Kho sản phẩm bất biến, xây một lần khi load dữ liệu.
+
+    Giữ một JSON fragment đã serialize sẵn cho mỗi dòng và các cột index
+    (INDEXED_COLUMNS) dạng numpy array; record (dict) được giải mã từ fragment
+    khi cần, như store load từ artifact. Không giữ lại DataFrame.
+    """
+    # Các cột ít giá trị, được lưu vào artifact dạng codes + levels
+    INDEXED_COLUMNS = ('category', 'target_gender', 'age_range', 'weight_range', 'health_goal')
+    
+    def __init__(self, products_df):
+        self.n_products = len(products_df)
+        self.columns = {col: products_df[col].to_numpy(dtype=object)
+                        for col in self.INDEXED_COLUMNS if col in products_df.columns}
+        
+        if 'id' in products_df.columns:
+            self.ids = products_df['id'].to_numpy(dtype=np.int64)
+        else:
+            self.ids = np.arange(1, self.n_products + 1, dtype=np.int64)
+        
+        self._build_id_index()
+        self._build_filter_columns()
+        self._build_category_counts()
+        self.facets = FacetIndex(self)
+        
+        # Fragment là JSON object chưa có dấu '}' để nối thêm scores; dict của
+        # từng dòng chỉ tồn tại trong lúc serialize
+        names = list(products_df.columns)
+        values = [products_df[name].tolist() for name in names]
+        fragments = []
+        for row, row_values in enumerate(zip(*values)):
+            record = dict(zip(names, row_values))
+            record['id'] = int(self.ids[row])
+            fragments.append(json.dumps(record, ensure_ascii=False, sort_keys=True)[:-1])
+        self.fragments = tuple(fragments)
+        self._init_caches()
+    
+    def _init_caches(self):
+        self.records = _LazyRecords(self.fragments)
+        self._default_fragment = functools.lru_cache(maxsize=PRODUCT_RECORD_CACHE_SIZE)(
+            lambda row: json_dumps(DEFAULT_PRODUCT_FIELDS.project(self.records[row]), sort_keys=True)[:-1])
+    
+    def _build_id_index(self):
+        """Index id -> dòng: id đã sắp xếp và dòng tương ứng (argsort stable nên id trùng giữ dòng đầu tiên)"""
+        self.id_rows = np.argsort(self.ids, kind='stable')
+        self.sorted_ids = self.ids[self.id_rows]
+    
+    def _build_filter_columns(self):
+        """Cột lọc tính sẵn: mask theo gender/category và khoảng age/weight dạng số"""
+        def lowered(name):
+            if name not in self.columns:
+                return pd.Series([''] * self.n_products, dtype=object)
+            return pd.Series(self.columns[name], dtype=object).astype(str).str.strip().str.lower()
+        
+        self.gender_masks = {
+            value: mask.to_numpy() for value, mask in pd.get_dummies(lowered('target_gender'), dtype=bool).items()
+        }
+        self.category_codes, categories = pd.factorize(lowered('category'))
+        self.category_code_of = {category: code for code, category in enumerate(categories)}
+        self.age_bounds = _parse_ranges(lowered('age_range'))
+        self.weight_bounds = _parse_ranges(lowered('weight_range'))
+    
+    def _build_category_counts(self):
+        """Danh sách category theo thứ tự xuất hiện và số sản phẩm mỗi category"""
+        if 'category' not in self.columns or self.n_products == 0:
+            self.categories, self.category_counts = [], {}
+            return
+        codes, uniques = pd.factorize(self.columns['category'])
+        self.categories = [_to_native(value) for value in uniques]
+        self.category_counts = dict(zip(self.categories, np.bincount(codes, minlength=len(uniques)).tolist()))
+    
+    def filter_mask(self, gender=None, age=None, weight=None, category=None):
+        """Mask bool các dòng thỏa điều kiện demographic, None nếu không có điều kiện nào"""
+        mask = None
+        
+        def narrow(condition):
+            return condition if mask is None else mask & condition
+        
+        no_rows = np.zeros(self.n_products, dtype=bool)
+        if gender and gender != 'all':
+            # Sản phẩm cho 'All' luôn phù hợp, giống hành vi lọc cũ
+            mask = narrow(self.gender_masks.get('all', no_rows) | self.gender_masks.get(gender, no_rows))
+        if category:
+            code = self.category_code_of.get(category)
+            mask = narrow(self.category_codes == code if code is not None else no_rows)
+        if age is not None:
+            mask = narrow((self.age_bounds[:, 0] <= age) & (age <= self.age_bounds[:, 1]))
+        if weight is not None:
+            mask = narrow((self.weight_bounds[:, 0] <= weight) & (weight <= self.weight_bounds[:, 1]))
+        return mask
+    
+    def pack(self):
+        """Store dạng (arrays, levels): ids và index id, blob fragment + offsets, các cột index dạng codes"""
+        encoded = [self.fragments[row].encode('utf-8') for row in range(self.n_products)]
+        offsets = np.zeros(self.n_products + 1, dtype=np.int64)
+        np.cumsum([len(fragment) for fragment in encoded], out=offsets[1:])
+        arrays = {
+            'ids': np.asarray(self.ids, dtype=np.int64),
+            'sorted_ids': np.asarray(self.sorted_ids, dtype=np.int64),
+            'id_rows': np.asarray(self.id_rows, dtype=np.int64),
+            'offsets': offsets,
+            'fragments': np.frombuffer(b''.join(encoded), dtype=np.uint8),
+        }
+        
+        levels = {}
+        for name in self.INDEXED_COLUMNS:
+            if name in self.columns:
+                codes, uniques = pd.factorize(self.columns[name])
+                arrays[f'column_{name}'] = codes.astype(np.int32)
+                levels[name] = [_to_native(value) for value in uniques]
+        
+        # Cột lọc và bitset facet tính sẵn, để load không phải dựng lại
+        genders = list(self.gender_masks)
+        arrays['filter_gender_masks'] = np.array([self.gender_masks[value] for value in genders], dtype=bool) \
+            .reshape(len(genders), self.n_products)
+        arrays['filter_category_codes'] = np.asarray(self.category_codes, dtype=np.int64)
+        arrays['filter_age_bounds'] = np.asarray(self.age_bounds, dtype=np.float64)
+        arrays['filter_weight_bounds'] = np.asarray(self.weight_bounds, dtype=np.float64)
+        for name, bitsets in self.facets.bitsets.items():
+            arrays[f'facet_{name}'] = bitsets
+        meta = {
+            'genders': genders,
+            'category_keys': list(self.category_code_of),
+            'categories': self.categories,
+            'category_counts': [self.category_counts[category] for category in self.categories],
+            'facets': self.facets.values,
+        }
+        return arrays, {'columns': levels, 'meta': meta}
+    
+    @classmethod
+    def unpack(cls, arrays, levels):
+        """Dựng store từ (arrays, levels) của pack(); các mảng được dùng trực tiếp, không copy"""
+        store = cls.__new__(cls)
+        store.ids = arrays['ids']
+        store.sorted_ids = arrays['sorted_ids']
+        store.id_rows = arrays['id_rows']
+        store.n_products = len(store.ids)
+        store.fragments = _BlobFragments(arrays['fragments'], arrays['offsets'])
+        store._init_caches()
+        store.columns = {
+            name: np.asarray(uniques, dtype=object)[arrays[f'column_{name}']]
+            for name, uniques in levels['columns'].items()
+        }
+        
+        meta = levels['meta']
+        store.gender_masks = dict(zip(meta['genders'], arrays['filter_gender_masks']))
+        store.category_codes = arrays['filter_category_codes']
+        store.category_code_of = {category: code for code, category in enumerate(meta['category_keys'])}
+        store.age_bounds = arrays['filter_age_bounds']
+        store.weight_bounds = arrays['filter_weight_bounds']
+        store.categories = meta['categories']
+        store.category_counts = dict(zip(meta['categories'], meta['category_counts']))
+        store.facets = FacetIndex.from_arrays(
+            store.n_products, meta['facets'], {name: arrays[f'facet_{name}'] for name in meta['facets']})
+        return store
+    
+    def save(self, directory):
+        """Ghi store ra thư mục: fragments.bin, các mảng .npy, levels và metadata lọc/facet trong columns.json"""
+        os.makedirs(directory, exist_ok=True)
+        arrays, levels = self.pack()
+        with open(os.path.join(directory, 'fragments.bin'), 'wb') as f:
+            f.write(arrays.pop('fragments').tobytes())
+        for name, array in arrays.items():
+            np.save(os.path.join(directory, f'{name}.npy'), array)
+        with open(os.path.join(directory, 'columns.json'), 'w', encoding='utf-8') as f:
+            json.dump(levels, f, ensure_ascii=False)
+    
+    @classmethod
+    def load(cls, directory):
+        """Load store từ thư mục, các mảng lớn được memory-map"""
+        with open(os.path.join(directory, 'columns.json'), encoding='utf-8') as f:
+            levels = json.load(f)
+        names = ['ids', 'sorted_ids', 'id_rows', 'offsets', 'filter_gender_masks', 'filter_category_codes',
+                 'filter_age_bounds', 'filter_weight_bounds']
+        names += [f'column_{name}' for name in levels['columns']]
+        names += [f'facet_{name}' for name in levels['meta']['facets']]
+        arrays = {name: np.load(os.path.join(directory, f'{name}.npy'), mmap_mode='r') for name in names}
+        if arrays['offsets'][-1] > 0:
+            arrays['fragments'] = np.memmap(os.path.join(directory, 'fragments.bin'), dtype=np.uint8, mode='r')
+        else:
+            arrays['fragments'] = np.empty(0, dtype=np.uint8)
+        return cls.unpack(arrays, levels)
+    
+    def __len__(self):
+        return self.n_products
+    
+    def column(self, name):
+        """Giá trị của cột; cột không được giữ (ngoài INDEXED_COLUMNS) đọc từ fragment, không cache record"""
+        if name in self.columns:
+            return self.columns[name]
+        values = np.empty(self.n_products, dtype=object)
+        for row in range(self.n_products):
+            values[row] = json.loads(self.fragments[row] + '}').get(name)
+        return values
+    
+    def row_of(self, product_id):
+        """Dòng của sản phẩm theo id (tìm nhị phân), None nếu không tồn tại"""
+        if not isinstance(product_id, (int, float, np.number)):
+            return None
+        i = int(np.searchsorted(self.sorted_ids, product_id))
+        if i < self.n_products and self.sorted_ids[i] == product_id:
+            return int(self.id_rows[i])
+        return None
+    
+    def rows_of(self, product_ids):
+        """Dòng của nhiều id cùng lúc (int64), -1 với id không tồn tại"""
+        product_ids = np.asarray(product_ids, dtype=np.int64)
+        if self.n_products == 0:
+            return np.full(len(product_ids), -1, dtype=np.int64)
+        positions = np.minimum(np.searchsorted(self.sorted_ids, product_ids), self.n_products - 1)
+        found = self.sorted_ids[positions] == product_ids
+        return np.where(found, self.id_rows[positions], -1).astype(np.int64)
+    
+    def product(self, row, **extra):
+        """Bản sao dict của sản phẩm ở dòng `row`, kèm các trường bổ sung"""
+        product = dict(self.records[row])
+        product.update(extra)
+        return product
+    
+    def products(self, rows, relevance=None, match_score=None, fields=ALL_PRODUCT_FIELDS):
+        """Danh sách dict sản phẩm; relevance/match_score là array hoặc scalar"""
+        products = []
+        for i, row in enumerate(rows):
+            product = dict(fields.project(self.records[row]))
+            if relevance is not None and 'relevance' in fields:
+                product['relevance'] = float(np.take(relevance, i) if np.ndim(relevance) else relevance)
+            if match_score is not None and 'match_score' in fields:
+                product['match_score'] = float(np.take(match_score, i) if np.ndim(match_score) else match_score)
+            products.append(product)
+        return products
+    
+    def fragment(self, row, fields=ALL_PRODUCT_FIELDS):
+        """Fragment JSON của dòng `row` chỉ gồm các trường trong `fields` (projection mặc định được nhớ lại)"""
+        if fields is ALL_PRODUCT_FIELDS:
+            return self.fragments[row]
+        if fields is DEFAULT_PRODUCT_FIELDS:
+            return self._default_fragment(int(row))
+        return json_dumps(fields.project(self.records[row]), sort_keys=True)[:-1]
+    
+    def dumps(self, rows, relevance=None, match_score=None, fields=DEFAULT_PRODUCT_FIELDS):
+        """Serialize danh sách sản phẩm thành JSON array từ các fragment có sẵn"""
+        parts = []
+        for i, row in enumerate(rows):
+            fragment = self.fragment(row, fields)
+            if relevance is not None and 'relevance' in fields:
+                value = np.take(relevance, i) if np.ndim(relevance) else relevance
+                fragment += f', "relevance": {float(value)!r}'
+            if match_score is not None and 'match_score' in fields:
+                value = np.take(match_score, i) if np.ndim(match_score) else match_score
+                fragment += f', "match_score": {float(value)!r}'
+            parts.append(fragment + '}')
+        return '[' + ', '.join(parts) + ']'
+
+def _parse_ranges(values):
+    """Chuỗi khoảng dạng '18-65' -> mảng (n, 2) float; giá trị không đọc được thì không giới hạn"""
+    bounds = values.str.extract(r'(\d+(?:\.\d+)?)\s*[-–]\s*(\d+(?:\.\d+)?)').astype(float).to_numpy()
+    bounds = bounds.reshape(len(values), 2)
+    bounds[np.isnan(bounds[:, 0]), 0] = -np.inf
+    bounds[np.isnan(bounds[:, 1]), 1] = np.inf
+    return bounds
+
+def demographic_filters(source):
+    """Chuẩn hóa điều kiện lọc (gender, age, weight, category) thành tuple làm cache key"""
+    if not source:
+        return ()
+    filters = []
+    gender = str(source.get('gender') or '').strip().lower()
+    if gender and gender != 'all':
+        filters.append(('gender', gender))
+    category = str(source.get('category') or '').strip().lower()
+    if category:
+        filters.append(('category', category))
+    for name in ('age', 'weight'):
+        try:
+            value = float(source.get(name))
+        except (TypeError, ValueError):
+            continue
+        if np.isfinite(value) and value > 0:
+            filters.append((name, value))
+    return tuple(filters)
+
+# ==================== FACETS ====================
+FACET_NAMES = ('category', 'target_gender', 'age_range', 'health_goal')
+# Số giá trị tối đa trả về cho mỗi facet (giá trị đang được chọn luôn có mặt)
+FACET_LIMIT = int(os.environ.get('FACET_LIMIT', 20))
+# Khoảng tuổi của facet age_range: sản phẩm thuộc mọi khoảng giao với age_range của nó
+FACET_FILTER_CACHE_SIZE = int(os.environ.get('FACET_FILTER_CACHE_SIZE', 256))
+AGE_FACET_BUCKETS = ((0, 17, '0-17'), (18, 29, '18-29'), (30, 44, '30-44'), (45, 59, '45-59'), (60, np.inf, '60+'))
+
+if hasattr(np, 'bitwise_count'):
+    def popcount_rows(words):
+        """Số bit 1 theo trục cuối của mảng uint64"""
+        return np.bitwise_count(words).sum(axis=-1, dtype=np.int64)
+else:
+    _POPCOUNT_BYTE = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+    
+    def popcount_rows(words):
+        """Số bit 1 theo trục cuối của mảng uint64"""
+        return _POPCOUNT_BYTE[words.view(np.uint8)].sum(axis=-1, dtype=np.int64)
+
+def pack_rows(mask):
+    """Mask bool (..., n) -> bitset uint64 (..., ceil(n / 64))"""
+    packed = np.packbits(np.asarray(mask, dtype=bool), axis=-1)
+    pad = -packed.shape[-1] % 8
+    if pad:
+        packed = np.pad(packed, [(0, 0)] * (packed.ndim - 1) + [(0, pad)])
+    return np.ascontiguousarray(packed).view(np.uint64)
+
+def rows_to_bits(rows, n_rows, labels=None, n_labels=1):
+    """Bitset uint64 (n_labels, ceil(n_rows / 64)) bật bit của từng cặp (labels[i], rows[i]).
+
+    Ghi thẳng vào các byte của bitset theo đúng thứ tự bit của np.packbits
+    (dòng r ở byte r // 8, bit 7 - r % 8), không dựng mask bool dài n_rows:
+    các bit cùng byte được gộp bằng bitwise_or.reduceat (nhanh hơn nhiều so
+    với bitwise_or.at). labels=None: bitset một chiều của tập `rows`.
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    n_bytes = (n_rows + 63) // 64 * 8
+    packed = np.zeros(n_labels * n_bytes, dtype=np.uint8)
+    if len(rows):
+        positions = rows >> 3
+        if labels is not None:
+            positions = positions + np.asarray(labels, dtype=np.int64) * n_bytes
+        bits = np.right_shift(0x80, rows & 7).astype(np.uint8)
+        if np.any(positions[1:] < positions[:-1]):
+            order = np.argsort(positions, kind='stable')
+            positions, bits = positions[order], bits[order]
+        starts = np.flatnonzero(np.concatenate(([True], positions[1:] != positions[:-1])))
+        packed[positions[starts]] = np.bitwise_or.reduceat(bits, starts)
+    packed = packed.view(np.uint64)
+    return packed if labels is None else packed.reshape(n_labels, -1)
+
+def unpack_rows(bits, n_rows):
+    """Bitset uint64 -> mask bool độ dài n_rows"""
+    return np.unpackbits(bits.view(np.uint8), count=n_rows).view(bool)
+
+def parse_facet_filters(value):
+    """{facet: giá trị hoặc list} của request -> tuple ((facet, (giá trị lower, ...)), ...) làm cache key"""
+    if not isinstance(value, dict):
+        return ()
+    filters = []
+    for name in FACET_NAMES:
+        selected = value.get(name)
+        if not isinstance(selected, (list, tuple)):
+            selected = [] if selected is None else [selected]
+        values = tuple(sorted({str(item).strip().lower() for item in selected if str(item).strip()}))
+        if values:
+            filters.append((name, values))
+    return tuple(filters)
+
+class FacetIndex:
+    """Bitset (uint64) của từng giá trị facet; đếm facet = popcount(bitset & tập kết quả).
+
+    category, target_gender: một giá trị mỗi sản phẩm; health_goal: các tag tách
+    theo dấu phẩy; age_range: các khoảng AGE_FACET_BUCKETS. Filter trong một
+    facet là OR các giá trị, giữa các facet là AND.
+    """
+    
+    def __init__(self, store):
+        self.n_products = len(store)
+        self.n_words = (self.n_products + 63) // 64
+        self.values = {}
+        self.bitsets = {}
+        self.lookup = {}
+        self._filter_cache = OrderedDict()
+        self._filter_lock = threading.Lock()
+        
+        for name in ('category', 'target_gender'):
+            if name in store.columns:
+                codes, uniques = pd.factorize(store.columns[name])
+                rows = np.flatnonzero(codes >= 0)
+                self._add(name, uniques, codes[rows], rows)
+        
+        if 'age_range' in store.columns:
+            low, high = store.age_bounds[:, 0], store.age_bounds[:, 1]
+            bucket_rows = [np.flatnonzero((low <= bucket_high) & (high >= bucket_low))
+                           for bucket_low, bucket_high, _ in AGE_FACET_BUCKETS]
+            self._add('age_range', [label for _, _, label in AGE_FACET_BUCKETS],
+                      np.repeat(np.arange(len(bucket_rows)), [len(rows) for rows in bucket_rows]),
+                      np.concatenate(bucket_rows))
+        
+        if 'health_goal' in store.columns:
+            tags = pd.Series(store.columns['health_goal'], dtype=object).fillna('').astype(str)
+            tags = tags.str.split(',').explode().str.strip()
+            tags = tags[tags != '']
+            codes, uniques = pd.factorize(tags.to_numpy())
+            self._add('health_goal', uniques, codes, tags.index.to_numpy())
+    
+    @classmethod
+    def from_arrays(cls, n_products, values, bitsets):
+        """FacetIndex từ values và bitsets đã lưu (artifact, shared memory), không dựng lại bitset"""
+        index = cls.__new__(cls)
+        index.n_products = n_products
+        index.n_words = (n_products + 63) // 64
+        index.values = {name: list(labels) for name, labels in values.items()}
+        index.bitsets = dict(bitsets)
+        index.lookup = {name: {str(label).strip().lower(): i for i, label in enumerate(labels)}
+                        for name, labels in index.values.items()}
+        index._filter_cache = OrderedDict()
+        index._filter_lock = threading.Lock()
+        return index
+    
+    def _add(self, name, labels, value_index, rows):
+        labels = [_to_native(label) for label in labels]
+        self.values[name] = labels
+        self.bitsets[name] = rows_to_bits(rows, self.n_products, value_index, len(labels))
+        self.lookup[name] = {str(label).strip().lower(): i for i, label in enumerate(labels)}
+    
+    def match_bits(self, rows):
+        """Bitset của tập dòng `rows`.
+
+        Tập thưa được ghi thẳng vào bitset; tập chiếm hơn 1/8 catalog thì mask
+        bool + packbits nhanh hơn mà không tốn thêm đáng kể so với chính bitset.
+        """
+        if len(rows) * 8 < self.n_products:
+            return rows_to_bits(rows, self.n_products)
+        mask = np.zeros(self.n_products, dtype=bool)
+        mask[rows] = True
+        return pack_rows(mask)
+    
+    def _cached_filter(self, facet_filters):
+        """(filter_bits, mask) của một facet_filters, giữ FACET_FILTER_CACHE_SIZE bộ lọc gần nhất"""
+        with self._filter_lock:
+            entry = self._filter_cache.get(facet_filters)
+            if entry is not None:
+                self._filter_cache.move_to_end(facet_filters)
+                return entry
+        bits = self._filter_bits(facet_filters)
+        mask = unpack_rows(np.bitwise_and.reduce(list(bits.values())), self.n_products) if bits else None
+        if mask is not None:
+            mask.flags.writeable = False
+        entry = (bits, mask)
+        with self._filter_lock:
+            self._filter_cache[facet_filters] = entry
+            while len(self._filter_cache) > FACET_FILTER_CACHE_SIZE:
+                self._filter_cache.popitem(last=False)
+        return entry
+    
+    def filter_bits(self, facet_filters):
+        """{facet: bitset OR các giá trị đã chọn} của các facet được lọc"""
+        return self._cached_filter(facet_filters)[0]
+    
+    def _filter_bits(self, facet_filters):
+        bits = {}
+        for name, selected in facet_filters:
+            if name not in self.bitsets:
+                continue
+            indices = [self.lookup[name][value] for value in selected if value in self.lookup[name]]
+            bits[name] = np.bitwise_or.reduce(self.bitsets[name][indices], axis=0) if indices \
+                else np.zeros(self.n_words, dtype=np.uint64)
+        return bits
+    
+    def filter_mask(self, facet_filters):
+        """Mask bool các dòng thỏa mọi facet filter, None nếu không lọc"""
+        return self._cached_filter(facet_filters)[1]
+    
+    def counts(self, match_bits, facet_filters=(), limit=FACET_LIMIT):
+        """Số kết quả theo giá trị của từng facet.
+
+        Facet đang lọc được đếm với filter của các facet khác (không tính
+        filter của chính nó), để vẫn thấy số lượng của các giá trị khác.
+        """
+        selected = dict(facet_filters)
+        filter_bits = self.filter_bits(facet_filters)
+        facets = {}
+        for name, bitsets in self.bitsets.items():
+            base = match_bits
+            for other, bits in filter_bits.items():
+                if other != name:
+                    base = base & bits
+            # Tập kết quả thưa: chỉ đếm trên các word có kết quả thay vì quét cả bitset
+            words = np.flatnonzero(base)
+            if len(words) < len(base) // 4:
+                counts = popcount_rows(bitsets[:, words] & base[words])
+            else:
+                counts = popcount_rows(bitsets & base)
+            chosen = {self.lookup[name][value] for value in selected.get(name, ()) if value in self.lookup[name]}
+            # Khoảng tuổi giữ thứ tự tăng dần, các facet khác xếp theo số lượng
+            order = np.arange(len(counts)) if name == 'age_range' else np.argsort(-counts, kind='stable')
+            shown = [i for i in order.tolist() if counts[i] > 0][:limit]
+            shown += [i for i in sorted(chosen) if i not in shown]
+            facets[name] = [
+                {'value': self.values[name][i], 'count': int(counts[i]), 'selected': i in chosen} for i in shown
+            ]
+        return facets
+
+# ==================== TOP-K ENGINE ====================
+def select_top_k(scores, k, min_score=0.0):
+    """Chọn tối đa k vị trí có điểm cao nhất (> min_score) bằng argpartition.
+
+    Thứ tự trả về giống `scores.argsort(kind='stable')[-k:][::-1]`:
+    điểm giảm dần, cùng điểm thì vị trí lớn hơn đứng trước.
+    """
+    candidates = np.flatnonzero(scores > min_score)
+    if k <= 0 or len(candidates) == 0:
+        return np.empty(0, dtype=np.int64)
+    
+    candidate_scores = scores[candidates]
+    if len(candidates) > k:
+        # Ngưỡng điểm thứ k, các phần tử bằng ngưỡng ưu tiên vị trí lớn hơn
+        kth = np.partition(candidate_scores, len(candidates) - k)[len(candidates) - k]
+        above = np.flatnonzero(candidate_scores > kth)
+        ties = np.flatnonzero(candidate_scores == kth)[::-1][:k - len(above)]
+        keep = np.concatenate([above, ties])
+        candidates = candidates[keep]
+        candidate_scores = candidate_scores[keep]
+    
+    order = np.lexsort((-candidates, -candidate_scores))
+    return candidates[order]
+
+def top_k_per_row(score_matrix, k, min_score=0.0):
+    """Top-k từng dòng của ma trận điểm sparse (queries x products)"""
+    score_matrix = score_matrix.tocsr()
+    score_matrix.sort_indices()
+    results = []
+    for i in range(score_matrix.shape[0]):
+        start, end = score_matrix.indptr[i], score_matrix.indptr[i + 1]
+        candidates = score_matrix.indices[start:end].astype(np.int64)
+        scores = score_matrix.data[start:end]
+        top = select_top_k(scores, k, min_score)
+        results.append((candidates[top], scores[top]))
+    return results
+
+def exact_matches(feature_matrix, query_vector, min_score=0.01):
+    """(rows tăng dần, scores) của mọi dòng có cosine > min_score (các dòng đã chuẩn hóa L2)"""
+    scores = np.asarray((feature_matrix @ query_vector.T).todense()).ravel()
+    rows = np.flatnonzero(scores > min_score)
+    return rows, scores[rows]
+
+class BruteForceEngine:
+    """Engine gốc: cosine similarity với toàn bộ catalog"""
+    name = 'brute'
+    
+    def __init__(self, feature_matrix, postings=None):
+        self.feature_matrix = feature_matrix
+    
+    def search(self, query_vector, limit, min_score=0.01, mask=None):
+        """Trả về (indices, scores) của top `limit` sản phẩm (chỉ trong `mask` nếu có)"""
+        similarities = cosine_similarity(query_vector, self.feature_matrix).flatten()
+        if mask is not None:
+            similarities = np.where(mask, similarities, 0.0)
+        top_indices = select_top_k(similarities, limit, min_score)
+        return top_indices, similarities[top_indices]
+    
+    def search_many(self, query_matrix, limit, min_score=0.01):
+        """Top `limit` cho nhiều query trong một phép nhân ma trận"""
+        similarities = cosine_similarity(query_matrix, self.feature_matrix, dense_output=False)
+        return top_k_per_row(similarities, limit, min_score)
+    
+    def match(self, query_vector, min_score=0.01):
+        """Mọi sản phẩm có điểm > min_score: (rows tăng dần, scores)"""
+        return exact_matches(self.feature_matrix, query_vector, min_score)
+    
+    def updated(self, feature_matrix, source_rows):
+        """Engine cho feature_matrix sau incremental update (không có gì để dựng lại)"""
+        return BruteForceEngine(feature_matrix)
+
+def patch_postings(postings, feature_matrix, source_rows):
+    """Postings CSC của feature_matrix vá từ postings cũ, không chuyển CSR -> CSC cả ma trận.
+
+    source_rows[dòng mới] là dòng cũ giữ nguyên (-1 với dòng mới/đã sửa):
+    entry của dòng giữ nguyên được đổi chỉ số, entry của dòng bị bỏ được xóa,
+    entry của dòng mới/đã sửa được chèn vào đúng vị trí trong từng cột.
+    """
+    n_rows, n_features = feature_matrix.shape
+    kept = np.flatnonzero(source_rows >= 0)
+    changed = np.flatnonzero(source_rows < 0)
+    old_to_new = np.full(postings.shape[0], -1, dtype=np.int64)
+    old_to_new[source_rows[kept]] = kept
+    
+    columns = np.repeat(np.arange(n_features, dtype=np.int64), np.diff(postings.indptr))
+    rows = old_to_new[postings.indices]
+    keep = rows >= 0
+    columns, rows, data = columns[keep], rows[keep], np.asarray(postings.data)[keep]
+    keys = columns * n_rows + rows
+    if np.any(np.diff(source_rows[kept]) < 0):
+        # Thứ tự dòng thay đổi: sắp xếp lại trong từng cột
+        order = np.argsort(keys, kind='stable')
+        keys, columns, rows, data = keys[order], columns[order], rows[order], data[order]
+    
+    added = feature_matrix[changed].tocoo()
+    added_rows = changed[added.row]
+    added_columns = added.col.astype(np.int64)
+    added_keys = added_columns * n_rows + added_rows
+    order = np.argsort(added_keys)
+    positions = np.searchsorted(keys, added_keys[order])
+    rows = np.insert(rows, positions, added_rows[order])
+    columns = np.insert(columns, positions, added_columns[order])
+    data = np.insert(data, positions, added.data[order])
+    
+    indptr = np.zeros(n_features + 1, dtype=np.int64)
+    np.cumsum(np.bincount(columns, minlength=n_features), out=indptr[1:])
+    return sp.csc_matrix((data, rows, indptr), shape=(n_rows, n_features))
+
+class InvertedIndexEngine:
+    """Engine dùng inverted index: chỉ duyệt posting list của các term có trong query.
+
+    Các dòng của feature_matrix đã được TfidfVectorizer chuẩn hóa L2 nên
+    tích vô hướng chính là cosine similarity.
+    """
+    name = 'inverted'
+    
+    def __init__(self, feature_matrix, postings=None):
+        # CSC: mỗi cột là posting list (row ids, weights) của một term
+        self.postings = postings if postings is not None else feature_matrix.tocsc()
+        self.postings.sort_indices()
+        self.n_products = feature_matrix.shape[0]
+    
+    def score_candidates(self, query_vector):
+        """Tính điểm cho các sản phẩm có chứa ít nhất một term của query"""
+        query_vector = query_vector.tocsr()
+        terms = query_vector.indices
+        if len(terms) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+        
+        indptr = self.postings.indptr
+        rows = []
+        weights = []
+        for term, query_weight in zip(terms, query_vector.data):
+            start, end = indptr[term], indptr[term + 1]
+            rows.append(self.postings.indices[start:end])
+            weights.append(self.postings.data[start:end] * query_weight)
+        
+        rows = np.concatenate(rows)
+        weights = np.concatenate(weights)
+        candidates, inverse = np.unique(rows, return_inverse=True)
+        scores = np.bincount(inverse, weights=weights, minlength=len(candidates))
+        return candidates.astype(np.int64), scores
+    
+    def search(self, query_vector, limit, min_score=0.01, mask=None):
+        """Trả về (indices, scores) của top `limit` sản phẩm (chỉ trong `mask` nếu có)"""
+        candidates, scores = self.score_candidates(query_vector)
+        if mask is not None:
+            keep = mask[candidates]
+            candidates, scores = candidates[keep], scores[keep]
+        # candidates đã sắp xếp tăng dần nên thứ tự tie-break giữ nguyên
+        top = select_top_k(scores, limit, min_score)
+        return candidates[top], scores[top]
+    
+    def match(self, query_vector, min_score=0.01):
+        """Mọi sản phẩm có điểm > min_score: (rows tăng dần, scores)"""
+        candidates, scores = self.score_candidates(query_vector)
+        keep = scores > min_score
+        return candidates[keep], scores[keep]
+    
+    def updated(self, feature_matrix, source_rows):
+        """Engine cho feature_matrix sau incremental update, postings được vá thay vì dựng lại"""
+        return InvertedIndexEngine(feature_matrix, postings=patch_postings(self.postings, feature_matrix, source_rows))
+    
+    def search_many(self, query_matrix, limit, min_score=0.01):
+        """Top `limit` cho nhiều query: một phép nhân sparse (queries x terms) @ (terms x products)"""
+        # postings.T là CSR của ma trận terms x products, không cần copy
+        return top_k_per_row(query_matrix.tocsr() @ self.postings.T, limit, min_score)
+
+class DenseANNEngine:
+    """Engine dense: chiếu TF-IDF xuống không gian LSA (TruncatedSVD, float32) và tìm gần đúng bằng IVF.
+
+    Sản phẩm được gom vào `n_lists` cụm (k-means trên vector LSA); mỗi query chỉ
+    duyệt các cụm có centroid gần nhất (ít nhất `nprobe` cụm và đủ `rerank * limit`
+    ứng viên), chọn ứng viên theo điểm dense rồi chấm lại chính xác bằng cosine
+    TF-IDF, nên điểm trả về giống các engine khác.
+    """
+    name = 'dense'
+    # Các mảng đã fit, lưu vào artifact/shared memory để load không phải chạy lại SVD + k-means
+    ARRAYS = ('embeddings', 'projection', 'centroids', 'list_rows', 'list_offsets')
+    
+    def __init__(self, feature_matrix, postings=None, dimensions=None, n_lists=None, nprobe=None,
+                 rerank=None, seed=0):
+        self.feature_matrix = feature_matrix.tocsr()
+        n_products, n_features = self.feature_matrix.shape
+        dimensions = dimensions or int(os.environ.get('DENSE_DIMENSIONS', 256))
+        self.nprobe = nprobe or int(os.environ.get('DENSE_NPROBE', 16))
+        self.rerank = rerank or int(os.environ.get('DENSE_RERANK', 10))
+        
+        self.svd = TruncatedSVD(n_components=max(1, min(dimensions, n_products - 1, n_features - 1)),
+                                algorithm='randomized', random_state=seed)
+        self.embeddings = self._normalize(self.svd.fit_transform(self.feature_matrix))
+        # (n_features x dims), C-contiguous để chiếu query chỉ cần gom các dòng của term trong query
+        self.projection = np.ascontiguousarray(self.svd.components_.T, dtype=np.float32)
+        
+        n_lists = n_lists or int(np.clip(np.sqrt(n_products), 1, 4096))
+        kmeans = MiniBatchKMeans(n_clusters=n_lists, random_state=seed, n_init=3,
+                                 batch_size=min(4096, n_products)).fit(self.embeddings)
+        self.centroids = kmeans.cluster_centers_.astype(np.float32)
+        # Inverted lists: rows của cụm i là list_rows[list_offsets[i]:list_offsets[i + 1]] (tăng dần)
+        labels = kmeans.labels_
+        self.list_rows = np.argsort(labels, kind='stable').astype(np.int64)
+        self.list_offsets = np.searchsorted(labels[self.list_rows], np.arange(n_lists + 1))
+    
+    @classmethod
+    def from_arrays(cls, feature_matrix, arrays, nprobe=None, rerank=None):
+        """Engine từ các mảng ARRAYS đã lưu, không fit lại"""
+        engine = cls.__new__(cls)
+        engine.feature_matrix = feature_matrix.tocsr()
+        engine.nprobe = nprobe or int(os.environ.get('DENSE_NPROBE', 16))
+        engine.rerank = rerank or int(os.environ.get('DENSE_RERANK', 10))
+        engine.svd = None
+        for name in cls.ARRAYS:
+            setattr(engine, name, arrays[name])
+        return engine
+    
+    @staticmethod
+    def _normalize(matrix):
+        matrix = np.asarray(matrix, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+    
+    def candidates(self, query_vector, limit, mask=None):
+        """Ứng viên (rows tăng dần) từ các cụm gần query nhất"""
+        dense = self._normalize((query_vector.data @ self.projection[query_vector.indices])[None, :])[0]
+        if not dense.any():
+            return np.empty(0, dtype=np.int64)
+        
+        wanted = max(limit * self.rerank, limit)
+        rows, found = [], 0
+        for probe, cluster in enumerate(np.argsort(-(self.centroids @ dense))):
+            members = self.list_rows[self.list_offsets[cluster]:self.list_offsets[cluster + 1]]
+            if mask is not None:
+                members = members[mask[members]]
+            rows.append(members)
+            found += len(members)
+            if probe + 1 >= self.nprobe and found >= wanted:
+                break
+        rows = np.concatenate(rows)
+        
+        if len(rows) > wanted:
+            dense_scores = self.embeddings[rows] @ dense
+            rows = rows[np.argpartition(-dense_scores, wanted - 1)[:wanted]]
+        return np.sort(rows)
+    
+    def search(self, query_vector, limit, min_score=0.01, mask=None):
+        """Trả về (indices, scores) của top `limit` sản phẩm (chỉ trong `mask` nếu có)"""
+        query_vector = query_vector.tocsr()
+        if query_vector.nnz == 0 or limit <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        rows = self.candidates(query_vector, limit, mask)
+        # Chấm lại chính xác; rows tăng dần nên tie-break giống InvertedIndexEngine
+        scores = np.asarray((self.feature_matrix[rows] @ query_vector.T).todense()).ravel()
+        top = select_top_k(scores, limit, min_score)
+        return rows[top], scores[top]
+    
+    def search_many(self, query_matrix, limit, min_score=0.01):
+        query_matrix = query_matrix.tocsr()
+        return [self.search(query_matrix[i], limit, min_score) for i in range(query_matrix.shape[0])]
+    
+    def match(self, query_vector, min_score=0.01):
+        """Mọi sản phẩm có điểm > min_score (chính xác, không qua IVF): (rows tăng dần, scores)"""
+        return exact_matches(self.feature_matrix, query_vector, min_score)
+    
+    def updated(self, feature_matrix, source_rows):
+        """Engine cho feature_matrix sau incremental update: giữ phép chiếu SVD và centroid,
+        chỉ chiếu các dòng mới/đã sửa và gán chúng vào cụm gần nhất"""
+        engine = DenseANNEngine.__new__(DenseANNEngine)
+        engine.feature_matrix = feature_matrix.tocsr()
+        engine.nprobe, engine.rerank = self.nprobe, self.rerank
+        engine.svd, engine.projection, engine.centroids = self.svd, self.projection, self.centroids
+        
+        n_lists = len(self.centroids)
+        old_labels = np.empty(len(self.list_rows), dtype=np.int64)
+        old_labels[self.list_rows] = np.repeat(np.arange(n_lists), np.diff(self.list_offsets))
+        
+        kept = np.flatnonzero(source_rows >= 0)
+        changed = np.flatnonzero(source_rows < 0)
+        engine.embeddings = np.empty((len(source_rows), self.embeddings.shape[1]), dtype=np.float32)
+        engine.embeddings[kept] = self.embeddings[source_rows[kept]]
+        labels = np.empty(len(source_rows), dtype=np.int64)
+        labels[kept] = old_labels[source_rows[kept]]
+        if len(changed):
+            embedded = self._normalize(engine.feature_matrix[changed] @ self.projection)
+            engine.embeddings[changed] = embedded
+            # Cụm gần nhất theo khoảng cách Euclid như MiniBatchKMeans.predict
+            distances = (self.centroids ** 2).sum(axis=1)[None, :] - 2 * embedded @ self.centroids.T
+            labels[changed] = np.argmin(distances, axis=1)
+        
+        engine.list_rows = np.argsort(labels, kind='stable').astype(np.int64)
+        engine.list_offsets = np.searchsorted(labels[engine.list_rows], np.arange(n_lists + 1))
+        return engine
+
+TOPK_ENGINES = {
+    BruteForceEngine.name: BruteForceEngine,
+    InvertedIndexEngine.name: InvertedIndexEngine,
+    DenseANNEngine.name: DenseANNEngine,
+}
+
+# ==================== SIMILARITY INDEX ====================
+class SimilarityIndex:
+    """Bảng top-N sản phẩm tương tự tính sẵn từ feature_matrix.
+
+    Lưu hai bảng neighbour (int32 row, -1 là ô trống) và score (float32):
+    một bảng toàn catalog và một bảng chỉ trong cùng category. Có thể lưu
+    ra thư mục dạng .npy và load lại bằng memory-map.
+    """
+    FILES = ('neighbors', 'scores', 'category_neighbors', 'category_scores')
+    
+    def __init__(self, neighbors, scores, category_neighbors, category_scores):
+        self.neighbors = neighbors
+        self.scores = scores
+        self.category_neighbors = category_neighbors
+        self.category_scores = category_scores
+    
+    @staticmethod
+    def category_codes(categories):
+        """Mã category dùng để giới hạn neighbour trong cùng category"""
+        return pd.factorize(pd.Series(categories))[0]
+    
+    @classmethod
+    def empty_tables(cls, n_rows, k):
+        return {
+            'neighbors': np.full((n_rows, k), -1, dtype=np.int32),
+            'scores': np.zeros((n_rows, k), dtype=np.float32),
+            'category_neighbors': np.full((n_rows, k), -1, dtype=np.int32),
+            'category_scores': np.zeros((n_rows, k), dtype=np.float32),
+        }
+    
+    @classmethod
+    def compute_rows(cls, feature_matrix, codes, rows, n_neighbors=20, transposed=None):
+        """Bốn bảng neighbour (như FILES) chỉ cho các dòng `rows`"""
+        rows = np.asarray(rows, dtype=np.int64)
+        n_products = feature_matrix.shape[0]
+        k = max(0, min(n_neighbors, n_products - 1))
+        tables = cls.empty_tables(len(rows), k)
+        if k == 0 or len(rows) == 0:
+            return tables
+        
+        if transposed is None:
+            # Ít dòng: một lượt nhân ma trận x vector, không cần chuyển vị cả ma trận
+            block = (feature_matrix @ feature_matrix[rows].T).T.toarray()
+        else:
+            block = (feature_matrix[rows] @ transposed).toarray()
+        block[np.arange(len(rows)), rows] = -np.inf  # bỏ chính nó
+        
+        # Toàn catalog: chỉ giữ sản phẩm có similarity > 0
+        global_block = np.where(block > 0, block, -np.inf)
+        cls._fill_top_k(global_block, k, tables['neighbors'], tables['scores'])
+        
+        # Cùng category: giữ cả sản phẩm similarity = 0 như hành vi cũ
+        other_category = codes[None, :] != codes[rows, None]
+        category_block = np.where(other_category, -np.inf, block)
+        cls._fill_top_k(category_block, k, tables['category_neighbors'], tables['category_scores'])
+        return tables
+    
+    @classmethod
+    def build(cls, feature_matrix, categories, n_neighbors=20, max_block_cells=8_000_000):
+        """Tính top-N neighbours theo từng block dòng để giới hạn bộ nhớ (O(n²), nên chạy trong build_model.py)"""
+        n_products = feature_matrix.shape[0]
+        k = max(0, min(n_neighbors, n_products - 1))
+        codes = cls.category_codes(categories)
+        block_size = max(1, min(1024, max_block_cells // max(n_products, 1)))
+        
+        tables = cls.empty_tables(n_products, k)
+        if k == 0:
+            return cls(**tables)
+        
+        transposed = feature_matrix.T.tocsc()
+        for start in range(0, n_products, block_size):
+            end = min(start + block_size, n_products)
+            block_tables = cls.compute_rows(feature_matrix, codes, np.arange(start, end), k, transposed)
+            for name in cls.FILES:
+                tables[name][start:end] = block_tables[name]
+        
+        return cls(**tables)
+    
+    def updated(self, feature_matrix, categories, source_rows, n_neighbors=20, max_block_cells=8_000_000):
+        """Bảng cho feature_matrix sau incremental update, không tính lại toàn bộ O(n²).
+
+        source_rows[dòng mới] là dòng cũ giữ nguyên (-1 với dòng mới/đã sửa).
+        Chỉ tính lại các dòng mới/đã sửa, các dòng có neighbour bị sửa/xóa và
+        các dòng mà một sản phẩm mới/đã sửa có điểm đủ để lọt vào top-k.
+        Trả về (index, số dòng đã tính lại).
+        """
+        n_rows = feature_matrix.shape[0]
+        k = max(0, min(n_neighbors, n_rows - 1))
+        if k != self.neighbors.shape[1]:
+            return SimilarityIndex.build(feature_matrix, categories, n_neighbors, max_block_cells), n_rows
+        
+        codes = self.category_codes(categories)
+        kept = np.flatnonzero(source_rows >= 0)
+        changed = np.flatnonzero(source_rows < 0)
+        old_to_new = np.full(self.neighbors.shape[0], -1, dtype=np.int64)
+        old_to_new[source_rows[kept]] = kept
+        
+        tables = self.empty_tables(n_rows, k)
+        affected = np.zeros(n_rows, dtype=bool)
+        affected[changed] = True
+        for name, score_name in (('neighbors', 'scores'), ('category_neighbors', 'category_scores')):
+            old = np.asarray(getattr(self, name))[source_rows[kept]]
+            remapped = np.where(old >= 0, old_to_new[old], -1)
+            affected[kept] |= ((old >= 0) & (remapped < 0)).any(axis=1)
+            tables[name][kept] = remapped
+            tables[score_name][kept] = np.asarray(getattr(self, score_name))[source_rows[kept]]
+        
+        transposed = feature_matrix.T.tocsc()
+        block_size = max(1, min(1024, max_block_cells // max(n_rows, 1)))
+        if len(changed):
+            # Ngưỡng vào top-k của từng dòng (danh sách chưa đủ k thì sản phẩm nào phù hợp cũng vào)
+            full = tables['neighbors'][:, -1] >= 0
+            worst = tables['scores'][:, -1] - 1e-6
+            category_full = tables['category_neighbors'][:, -1] >= 0
+            category_worst = tables['category_scores'][:, -1] - 1e-6
+            for start in range(0, len(changed), block_size):
+                chunk = changed[start:start + block_size]
+                block = (feature_matrix[chunk] @ transposed).toarray()
+                block[np.arange(len(chunk)), chunk] = -np.inf
+                best = np.where(block > 0, block, -np.inf).max(axis=0)
+                affected |= (best > 0) & (~full | (best >= worst))
+                same_category = codes[chunk, None] == codes[None, :]
+                category_best = np.where(same_category, block, -np.inf).max(axis=0)
+                affected |= np.isfinite(category_best) & (~category_full | (category_best >= category_worst))
+        
+        rows = np.flatnonzero(affected)
+        for start in range(0, len(rows), block_size):
+            chunk = rows[start:start + block_size]
+            block_tables = self.compute_rows(feature_matrix, codes, chunk, k, transposed)
+            for name in self.FILES:
+                tables[name][chunk] = block_tables[name]
+        return SimilarityIndex(**tables), len(rows)
+    
+    @staticmethod
+    def _fill_top_k(block, k, out_rows, out_scores):
+        """Ghi top-k của từng dòng trong block (score giảm dần) vào bảng"""
+        top = np.argpartition(-block, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(block, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind='stable')
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+        valid = np.isfinite(top_scores)
+        out_rows[...] = np.where(valid, top, -1)
+        out_scores[...] = np.where(valid, top_scores, 0)
+    
+    def lookup(self, row, limit, same_category=True):
+        """Trả về (rows, scores) của tối đa `limit` sản phẩm tương tự"""
+        neighbors = self.category_neighbors if same_category else self.neighbors
+        scores = self.category_scores if same_category else self.scores
+        limit = max(0, min(int(limit), neighbors.shape[1]))
+        rows = np.asarray(neighbors[row, :limit])
+        valid = rows >= 0
+        return rows[valid], np.asarray(scores[row, :limit])[valid]
+    
+    def save(self, directory):
+        """Lưu các bảng ra thư mục dạng .npy"""
+        os.makedirs(directory, exist_ok=True)
+        for name in self.FILES:
+            np.save(os.path.join(directory, f'{name}.npy'), getattr(self, name))
+    
+    @classmethod
+    def load(cls, directory, mmap_mode='r'):
+        """Load bảng từ thư mục, mặc định memory-map để các worker dùng chung page"""
+        return cls(**{
+            name: np.load(os.path.join(directory, f'{name}.npy'), mmap_mode=mmap_mode)
+            for name in cls.FILES
+        })
+
+# ==================== QUERY CACHE ====================
+def normalize_query(text):
+    """Chuẩn hóa query làm cache key: chữ thường, gộp khoảng trắng"""
+    return ' '.join(str(text).lower().split())
+
+class ResultCache:
+    """Cache kết quả LRU + TTL, thread-safe.
+
+    Key luôn đi kèm catalog version; khi gặp version mới toàn bộ cache cũ bị
+    xóa, nên sau khi reload catalog không trả về kết quả cũ.
+    """
+    
+    def __init__(self, maxsize=1024, ttl=300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def _check_version(self, version):
+        if version != self.version:
+            self._data.clear()
+            self.version = version
+    
+    def get(self, version, key):
+        """Giá trị đã cache hoặc None (hết hạn/không có)"""
+        if self.maxsize <= 0:
+            return None
+        with self._lock:
+            self._check_version(version)
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+    
+    def put(self, version, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._check_version(version)
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+    
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+    
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+QUERY_CACHE = ResultCache(
+    maxsize=int(os.environ.get('QUERY_CACHE_SIZE', 1024)),
+    ttl=float(os.environ.get('QUERY_CACHE_TTL', 300)),
+)
+
+# Ranking đã chấm điểm của từng query cho phân trang bằng cursor (mỗi handle ~16 byte/sản phẩm)
+SEARCH_RESULTS = ResultCache(
+    maxsize=int(os.environ.get('SEARCH_RESULT_HANDLES', 2048)),
+    ttl=float(os.environ.get('SEARCH_RESULT_TTL', 600)),
+)
+SEARCH_RESULT_DEPTH = int(os.environ.get('SEARCH_RESULT_DEPTH', 500))
+
+# ==================== POPULARITY ====================
+class CountMinSketch:
+    """Count-Min sketch cho key số nguyên: bộ nhớ cố định depth x width, ước lượng không bao giờ thấp hơn thực tế"""
+    PRIME = (1 << 61) - 1
+    
+    def __init__(self, width=1 << 14, depth=4, seed=0):
+        rng = np.random.default_rng(seed)
+        self.width = width
+        self.table = np.zeros((depth, width), dtype=np.float64)
+        self._hashes = [(int(a), int(b)) for a, b in rng.integers(1, 1 << 60, size=(depth, 2))]
+        self._depth_index = np.arange(depth)
+    
+    def _buckets(self, key):
+        return [((a * key + b) % self.PRIME) % self.width for a, b in self._hashes]
+    
+    def add(self, key, weight=1.0):
+        self.table[self._depth_index, self._buckets(key)] += weight
+    
+    def estimate(self, key):
+        return float(self.table[self._depth_index, self._buckets(key)].min())
+    
+    def scale(self, factor):
+        self.table *= factor
+
+class PopularityTracker:
+    """Đếm lượt quan tâm theo sản phẩm có suy giảm theo thời gian (half-life), thread-safe.
+
+    Dùng forward decay: sự kiện ở thời điểm t có trọng số exp((t - t0) / tau)
+    nên không phải giảm mọi bộ đếm mỗi lần ghi. Bộ đếm nằm trong Count-Min
+    sketch (bộ nhớ cố định bất kể số sự kiện), kèm danh sách tối đa
+    ~2 x `capacity` heavy hitter làm ứng viên cho top-N.
+    """
+    
+    def __init__(self, half_life=3 * 24 * 3600.0, capacity=1000, width=1 << 14, depth=4):
+        self.tau = half_life / np.log(2)
+        self.capacity = capacity
+        self.sketch = CountMinSketch(width, depth)
+        self.events = 0
+        self._t0 = time.time()
+        self._candidates = {}
+        self._threshold = 0.0
+        self._lock = threading.Lock()
+    
+    def _rescale(self, now):
+        """Đưa mốc t0 về hiện tại khi hệ số exp sắp quá lớn"""
+        factor = np.exp(-(now - self._t0) / self.tau)
+        self.sketch.scale(factor)
+        self._candidates = {key: value * factor for key, value in self._candidates.items()}
+        self._threshold *= factor
+        self._t0 = now
+    
+    def record(self, product_id, weight=1.0, now=None):
+        """Ghi một sự kiện (view, xuất hiện trong kết quả search...) cho sản phẩm"""
+        try:
+            key = int(product_id)
+        except (TypeError, ValueError):
+            return
+        now = time.time() if now is None else now
+        with self._lock:
+            if (now - self._t0) / self.tau > 30:
+                self._rescale(now)
+            self.sketch.add(key, weight * np.exp((now - self._t0) / self.tau))
+            self.events += 1
+            estimate = self.sketch.estimate(key)
+            if key in self._candidates or estimate > self._threshold:
+                self._candidates[key] = estimate
+                if len(self._candidates) > 2 * self.capacity:
+                    kept = sorted(self._candidates.items(), key=lambda item: item[1], reverse=True)[:self.capacity]
+                    self._candidates = dict(kept)
+                    self._threshold = kept[-1][1]
+    
+    def record_many(self, product_ids, weight=1.0):
+        now = time.time()
+        for product_id in product_ids:
+            self.record(product_id, weight, now)
+    
+    def top(self, n, now=None):
+        """Top n (product_id, điểm đã suy giảm tới thời điểm hiện tại), điểm giảm dần"""
+        now = time.time() if now is None else now
+        with self._lock:
+            factor = np.exp(-(now - self._t0) / self.tau)
+            ranked = sorted(self._candidates.items(), key=lambda item: (-item[1], item[0]))[:n]
+        return [(key, float(value * factor)) for key, value in ranked]
+    
+    def stats(self):
+        return {"events": self.events, "candidates": len(self._candidates), "half_life": float(self.tau * np.log(2))}
+
+POPULARITY = PopularityTracker(half_life=float(os.environ.get('POPULARITY_HALF_LIFE', 3 * 24 * 3600)))
+# Trọng số sự kiện: xem chi tiết sản phẩm và xuất hiện trong kết quả search
+VIEW_EVENT_WEIGHT = 1.0
+SEARCH_RESULT_EVENT_WEIGHT = 0.1
+
+def id_hash(ids):
+    """Hash uint64 cố định của id (nhân Fibonacci + xorshift), giống nhau giữa các process và lần chạy"""
+    keys = np.asarray(ids).astype(np.uint64) * np.uint64(0x9E3779B97F4A7C15)
+    return keys ^ (keys >> np.uint64(29))
+
+class PopularSnapshot:
+    """Danh sách sản phẩm phổ biến tính sẵn cho một catalog, kèm dữ liệu landing page.
+
+    Sản phẩm có lượt quan tâm xếp trước theo điểm (relevance = điểm / điểm cao
+    nhất); còn thiếu thì bù bằng sản phẩm theo thứ tự hash của id (relevance 0)
+    để danh sách luôn đủ `size` khi catalog đủ lớn. Thứ tự bù cố định nên khi
+    không có sự kiện mới, snapshot (và ETag landing) không đổi.
+    """
+    
+    def __init__(self, recommender, tracker, size=100):
+        self.store = recommender.store
+        self.catalog_version = recommender.catalog_version
+        self.events = tracker.events
+        self.built_at = time.monotonic()
+        # Mọi heavy hitter tại thời điểm dựng, để mở rộng danh sách vẫn cùng một bảng xếp hạng
+        self.tracked = tracker.top(2 * tracker.capacity)
+        self._lock = threading.Lock()
+        self.rows, self.scores = self._rank(size)
+        
+        store = self.store
+        general = slice(8, 14) if len(self.rows) >= 14 else slice(0, 6)
+        self.landing = PrecomputedJSON({
+            "status": "success",
+            "categories": recommender.get_categories(4),
+            "popular_products": store.products(self.rows[:8], relevance=self.scores[:8],
+                                               match_score=self.scores[:8], fields=DEFAULT_PRODUCT_FIELDS),
+            "general_recommendations": store.products(
+                self.rows[general], relevance=self.scores[general], match_score=self.scores[general],
+                fields=DEFAULT_PRODUCT_FIELDS),
+            "total_products": len(store),
+        })
+    
+    def _rank(self, size):
+        """(rows, relevance) của `size` sản phẩm đầu bảng xếp hạng"""
+        store = self.store
+        rows, scores = [], []
+        for product_id, score in self.tracked[:size]:
+            row = store.row_of(product_id)
+            if row is not None and score > 0:
+                rows.append(row)
+                scores.append(score)
+        
+        scores = np.asarray(scores, dtype=np.float64)
+        if len(scores):
+            # Làm tròn để hệ số suy giảm tại thời điểm dựng không làm đổi nội dung (ETag) landing
+            scores = np.round(scores / scores[0], 6)
+        n_fill = min(size, len(store)) - len(rows)
+        if n_fill > 0:
+            keys = id_hash(store.ids)
+            rest = np.ones(len(store), dtype=bool)
+            rest[rows] = False
+            rest = np.flatnonzero(rest)
+            if n_fill < len(rest):
+                rest = rest[np.argpartition(keys[rest], n_fill - 1)[:n_fill]]
+            fill = rest[np.lexsort((rest, keys[rest]))]
+            rows.extend(fill.tolist())
+            scores = np.concatenate([scores, np.zeros(len(fill))])
+        return np.asarray(rows, dtype=np.int64), scores
+    
+    def top(self, limit):
+        """Top `limit`; vượt kích thước hiện có thì mở rộng bảng xếp hạng của snapshot (không dựng snapshot mới)"""
+        rows, scores = self.rows, self.scores
+        if limit > len(rows) and len(rows) < len(self.store):
+            with self._lock:
+                if limit > len(self.rows):
+                    # Cùng bảng xếp hạng nên phần đầu giữ nguyên, landing vẫn khớp
+                    self.rows, self.scores = self._rank(max(limit, 2 * len(self.rows)))
+                rows, scores = self.rows, self.scores
+        return rows[:limit], scores[:limit]
+
+POPULAR_REFRESH_INTERVAL = float(os.environ.get('POPULAR_REFRESH_INTERVAL', 60))
+POPULAR_STATE = {"snapshot": None}
+_popular_lock = threading.Lock()
+
+def refresh_popular_snapshot(recommender):
+    """Tính lại danh sách phổ biến từ POPULARITY rồi swap vào"""
+    if not _popular_lock.acquire(blocking=False):
+        return
+    try:
+        POPULAR_STATE["snapshot"] = PopularSnapshot(recommender, POPULARITY)
+    except Exception as e:
+        LOG.error('popular_snapshot_error', error=str(e), exc_info=True)
+    finally:
+        _popular_lock.release()
+
+def get_popular_snapshot(recommender):
+    """Snapshot phổ biến của catalog hiện tại; snapshot cũ có sự kiện mới được tính lại ở background"""
+    snapshot = POPULAR_STATE["snapshot"]
+    if snapshot is None or snapshot.catalog_version != recommender.catalog_version:
+        with _popular_lock:
+            snapshot = POPULAR_STATE["snapshot"]
+            if snapshot is None or snapshot.catalog_version != recommender.catalog_version:
+                snapshot = PopularSnapshot(recommender, POPULARITY)
+                POPULAR_STATE["snapshot"] = snapshot
+    elif time.monotonic() - snapshot.built_at > POPULAR_REFRESH_INTERVAL and snapshot.events != POPULARITY.events \
+            and not _popular_lock.locked():
+        threading.Thread(target=refresh_popular_snapshot, args=(recommender,), daemon=True).start()
+    return snapshot
+
+# ==================== SHARED MEMORY ====================
+class SharedArrays:
+    """Gom nhiều numpy array vào một segment multiprocessing.shared_memory.
+
+    `views` là các ndarray trỏ thẳng vào segment; process con fork sau đó dùng
+    chung các trang nhớ này (MAP_SHARED) thay vì mỗi worker giữ một bản.
+    Process tạo segment phải gọi `unlink()` khi thoát.
+    """
+    ALIGNMENT = 64
+    
+    def __init__(self, arrays):
+        layout = {}
+        size = 0
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            layout[name] = (array, size)
+            size += -(-array.nbytes // self.ALIGNMENT) * self.ALIGNMENT
+        
+        self.shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        self.nbytes = size
+        self.views = {}
+        for name, (array, offset) in layout.items():
+            view = np.ndarray(array.shape, dtype=array.dtype, buffer=self.shm.buf, offset=offset)
+            view[...] = array
+            view.flags.writeable = False
+            self.views[name] = view
+    
+    def unlink(self):
+        self.views = {}
+        try:
+            self.shm.close()
+        except BufferError:
+            # Vẫn còn view đang được tham chiếu; segment được giải phóng khi process thoát
+            pass
+        self.shm.unlink()
 
 # ==================== ML MODEL ====================
+# Similarity index khi fit từ CSV: background (mặc định, server phục vụ ngay và tính
+# từng dòng khi cần cho tới khi xong) | eager (tính xong mới trả về, dùng cho build_model.py)
+SIMILARITY_BUILD = os.environ.get('SIMILARITY_BUILD', 'background').lower()
+SIMILARITY_NEIGHBORS = 20
+
 class ProductRecommender:
-    def __init__(self, products_df):
-        """Khởi tạo với dữ liệu sản phẩm"""
-        self.df = products_df
-        self.vectorizer = TfidfVectorizer(stop_words='english')
+    def __init__(self, products_df, engine=None, catalog_version=None, analyzer=None):
+        """Khởi tạo với dữ liệu sản phẩm (DataFrame chỉ dùng lúc dựng, không giữ lại)"""
+        self.artifact_dir = None
+        self.catalog_version = catalog_version or dataframe_version(products_df)
+        self.store = ProductStore(products_df)
+        analyzer_name = analyzer or os.environ.get('TEXT_ANALYZER', VietnameseAnalyzer.name)
+        self.vectorizer = TfidfVectorizer(analyzer=TEXT_ANALYZERS[analyzer_name]())
         self.feature_matrix = None
-        self._fit_model()
+        self.engine_name = engine or os.environ.get('TOPK_ENGINE', InvertedIndexEngine.name)
+        self.engine = None
+        self.similarity_index = None
+        self._similarity_thread = None
+        self._similarity_codes = None
+        self.corrector = None
+        self._fit_model(products_df['features'] if 'features' in products_df.columns else None)
     
-    def _fit_model(self):
+    def _fit_model(self, features):
         """Huấn luyện model TF-IDF"""
-        if len(self.df) > 0:
-            self.feature_matrix = self.vectorizer.fit_transform(self.df['features'])
-            print(f"TF-IDF model trained with {self.feature_matrix.shape[1]} features")
+        if len(self.store) > 0:
+            self.vectorizer.analyzer.fit(features)
+            self.feature_matrix = self.vectorizer.fit_transform(features)
+            LOG.info('model_trained', features=self.feature_matrix.shape[1],
+                     analyzer=self.vectorizer.analyzer.name, engine=self.engine_name)
+            self._build_indexes()
         else:
-            print("No data to train model")
+            LOG.warning('model_not_trained', reason='no data')
     
-    def search_products(self, query, limit=20):
-        """Tìm kiếm sản phẩm bằng TF-IDF"""
-        if len(self.df) == 0 or self.feature_matrix is None:
-            print("No data or model not trained")
-            return []
+    def _build_indexes(self):
+        """Dựng engine top-k và similarity index từ feature_matrix"""
+        self.engine = TOPK_ENGINES[self.engine_name](self.feature_matrix)
+        self.corrector = TermCorrector(self.vectorizer.vocabulary_, self.vectorizer.idf_)
+        self._start_similarity_index()
+    
+    def incremental_update(self, products_df, catalog_version=None, max_changed_ratio=0.05):
+        """Recommender mới cho catalog thay đổi ít: chỉ vectorize lại các dòng mới/đã sửa.
+
+        Giữ nguyên vocabulary và idf của model hiện tại, nên term mới chưa có
+        trong vocabulary sẽ bị bỏ qua cho tới lần fit lại toàn bộ. Trả về None
+        nếu tỉ lệ dòng thay đổi vượt `max_changed_ratio`.
+        """
+        if len(self.store) == 0 or len(products_df) == 0:
+            return None
+        
+        new_store = ProductStore(products_df)
+        features = products_df['features'].tolist()
+        old_features = self.store.column('features')
+        source_rows = self.store.rows_of(new_store.ids)
+        for new_row, old_row in enumerate(source_rows.tolist()):
+            if old_row >= 0 and old_features[old_row] != features[new_row]:
+                source_rows[new_row] = -1
+        
+        changed = np.flatnonzero(source_rows < 0)
+        if len(changed) > max_changed_ratio * len(new_store):
+            LOG.info('incremental_update_refused', changed=len(changed), products=len(new_store))
+            return None
+        
+        kept = np.flatnonzero(source_rows >= 0)
+        stacked = sp.vstack([
+            self.feature_matrix[source_rows[kept]],
+            self.vectorizer.transform([features[row] for row in changed]),
+        ]).tocsr()
+        positions = np.empty(len(new_store), dtype=np.int64)
+        positions[kept] = np.arange(len(kept))
+        positions[changed] = len(kept) + np.arange(len(changed))
+        
+        recommender = ProductRecommender.__new__(ProductRecommender)
+        recommender.artifact_dir = None
+        recommender.catalog_version = catalog_version or dataframe_version(products_df)
+        recommender.store = new_store
+        recommender.vectorizer = self.vectorizer
+        recommender.feature_matrix = stacked[positions]
+        recommender.engine_name = self.engine_name
+        recommender.engine = self.engine.updated(recommender.feature_matrix, source_rows)
+        # Vocabulary không đổi nên bộ sửa chính tả dùng lại được
+        recommender.corrector = self.corrector
+        recommender._similarity_thread = None
+        recommender._similarity_codes = None
+        
+        recomputed = None
+        if self.similarity_index is not None:
+            recommender.similarity_index, recomputed = self.similarity_index.updated(
+                recommender.feature_matrix, new_store.column('category'), source_rows, SIMILARITY_NEIGHBORS)
+            directory = recommender._similarity_dir()
+            if directory:
+                recommender.similarity_index.save(directory)
+        else:
+            recommender._start_similarity_index()
+        LOG.info('incremental_update', revectorized=len(changed), products=len(new_store),
+                 similarity_rows=recomputed if recomputed is not None else 'all')
+        return recommender
+    
+    @classmethod
+    def from_artifact(cls, directory, engine=None):
+        """Load model đã build sẵn; các mảng CSR/CSC và store được memory-map"""
+        with open(os.path.join(directory, 'manifest.json'), encoding='utf-8') as f:
+            manifest = json.load(f)
+        
+        recommender = cls.__new__(cls)
+        recommender.artifact_dir = directory
+        recommender.catalog_version = manifest['catalog_version']
+        recommender.store = ProductStore.load(os.path.join(directory, 'products'))
+        
+        with open(os.path.join(directory, 'vocabulary.json'), encoding='utf-8') as f:
+            terms = json.load(f)
+        with open(os.path.join(directory, 'analyzer.json'), encoding='utf-8') as f:
+            analyzer = TEXT_ANALYZERS[manifest['analyzer']].from_state(json.load(f))
+        recommender.vectorizer = TfidfVectorizer(analyzer=analyzer)
+        recommender.vectorizer.vocabulary_ = {term: i for i, term in enumerate(terms)}
+        recommender.vectorizer.idf_ = np.load(os.path.join(directory, 'idf.npy'))
+        
+        shape = (manifest['n_products'], manifest['n_features'])
+        recommender.feature_matrix = sp.csr_matrix(_load_sparse_arrays(directory, 'matrix'), shape=shape)
+        postings = sp.csc_matrix(_load_sparse_arrays(directory, 'postings'), shape=shape)
+        
+        recommender.engine_name = engine or os.environ.get('TOPK_ENGINE', InvertedIndexEngine.name)
+        if recommender.engine_name == DenseANNEngine.name and manifest.get('engine') == DenseANNEngine.name:
+            recommender.engine = DenseANNEngine.from_arrays(
+                recommender.feature_matrix, _load_arrays(directory, 'dense', DenseANNEngine.ARRAYS))
+        else:
+            recommender.engine = TOPK_ENGINES[recommender.engine_name](recommender.feature_matrix, postings=postings)
+        recommender.similarity_index = SimilarityIndex.load(os.path.join(directory, 'similarity'))
+        recommender.corrector = TermCorrector.from_arrays(
+            recommender.vectorizer.vocabulary_, terms, recommender.vectorizer.idf_,
+            _load_arrays(directory, 'corrector', TermCorrector.ARRAYS))
+        LOG.info('model_artifact_loaded', directory=directory, products=shape[0], features=shape[1])
+        return recommender
+    
+    def save(self, directory):
+        """Ghi model ra thư mục artifact: vocabulary, idf, CSR/CSC arrays, store, similarity index,
+        trigram index của corrector và (engine dense) các mảng đã fit"""
+        os.makedirs(directory, exist_ok=True)
+        
+        terms = [None] * len(self.vectorizer.vocabulary_)
+        for term, i in self.vectorizer.vocabulary_.items():
+            terms[i] = term
+        with open(os.path.join(directory, 'vocabulary.json'), 'w', encoding='utf-8') as f:
+            json.dump(terms, f, ensure_ascii=False)
+        np.save(os.path.join(directory, 'idf.npy'), self.vectorizer.idf_)
+        with open(os.path.join(directory, 'analyzer.json'), 'w', encoding='utf-8') as f:
+            json.dump(self.vectorizer.analyzer.get_state(), f, ensure_ascii=False)
+        
+        matrix = self.feature_matrix.tocsr()
+        matrix.sort_indices()
+        _save_sparse_arrays(directory, 'matrix', matrix)
+        postings = matrix.tocsc()
+        postings.sort_indices()
+        _save_sparse_arrays(directory, 'postings', postings)
+        
+        self.store.save(os.path.join(directory, 'products'))
+        self.ensure_similarity_index().save(os.path.join(directory, 'similarity'))
+        _save_arrays(directory, 'corrector', self.corrector.arrays())
+        # Engine dense tốn SVD + k-means: lưu kết quả fit để load chỉ memory-map
+        if isinstance(self.engine, DenseANNEngine):
+            _save_arrays(directory, 'dense', {name: getattr(self.engine, name) for name in DenseANNEngine.ARRAYS})
+        
+        return {
+            'format_version': MODEL_ARTIFACT_FORMAT,
+            'catalog_version': self.catalog_version,
+            'n_products': matrix.shape[0],
+            'n_features': matrix.shape[1],
+            'analyzer': self.vectorizer.analyzer.name,
+            'engine': self.engine_name,
+        }
+    
+    def to_shared_memory(self):
+        """Chuyển các mảng lớn (CSR/CSC, store, similarity index) vào shared memory.
+
+        Recommender được trỏ sang các view trong segment như khi load từ
+        artifact. Trả về SharedArrays để process gọi unlink.
+        """
+        matrix = self.feature_matrix.tocsr()
+        matrix.sort_indices()
+        postings = matrix.tocsc()
+        postings.sort_indices()
+        store_arrays, levels = self.store.pack()
+        
+        arrays = {f'products/{name}': array for name, array in store_arrays.items()}
+        for prefix, sparse in (('matrix', matrix), ('postings', postings)):
+            for name in ('data', 'indices', 'indptr'):
+                arrays[f'{prefix}/{name}'] = getattr(sparse, name)
+        if isinstance(self.engine, DenseANNEngine):
+            for name in DenseANNEngine.ARRAYS:
+                arrays[f'dense/{name}'] = getattr(self.engine, name)
+        # Bảng similar products còn đang tính thì không chia sẻ: worker tính từng dòng khi cần
+        similarity_index = self.similarity_index
+        if similarity_index is not None:
+            for name in SimilarityIndex.FILES:
+                arrays[f'similarity/{name}'] = getattr(similarity_index, name)
+        else:
+            LOG.warning('similarity_index_not_shared', reason='not built yet',
+                        hint='run build_model.py to precompute it')
+        
+        shared = SharedArrays(arrays)
+        views = shared.views
+        
+        def group(prefix):
+            return {name.split('/', 1)[1]: view for name, view in views.items() if name.startswith(prefix + '/')}
+        
+        def sparse_arrays(prefix):
+            arrays = group(prefix)
+            return arrays['data'], arrays['indices'], arrays['indptr']
+        
+        self.store = ProductStore.unpack(group('products'), levels)
+        self.feature_matrix = sp.csr_matrix(sparse_arrays('matrix'), shape=matrix.shape)
+        if isinstance(self.engine, DenseANNEngine):
+            self.engine = DenseANNEngine.from_arrays(self.feature_matrix, group('dense'),
+                                                     nprobe=self.engine.nprobe, rerank=self.engine.rerank)
+        else:
+            self.engine = TOPK_ENGINES[self.engine_name](
+                self.feature_matrix, postings=sp.csc_matrix(sparse_arrays('postings'), shape=matrix.shape))
+        self.similarity_index = SimilarityIndex(**group('similarity')) if similarity_index is not None else None
+        self._similarity_thread = None
+        LOG.info('model_shared', segment=shared.shm.name, mib=round(shared.nbytes / 2**20, 1))
+        return shared
+    
+    def _similarity_dir(self):
+        directory = os.environ.get('SIMILARITY_INDEX_DIR')
+        return os.path.join(directory, self.catalog_version) if directory else None
+    
+    def _start_similarity_index(self):
+        """Load bảng similar products đã lưu ở SIMILARITY_INDEX_DIR, ngược lại tính theo SIMILARITY_BUILD"""
+        self.similarity_index = None
+        self._similarity_thread = None
+        directory = self._similarity_dir()
+        if directory and os.path.exists(os.path.join(directory, 'neighbors.npy')):
+            LOG.info('similarity_index_loaded', directory=directory)
+            self.similarity_index = SimilarityIndex.load(directory)
+            return
+        if SIMILARITY_BUILD == 'eager':
+            self._build_similarity_index()
+            return
+        self._similarity_thread = threading.Thread(
+            target=self._build_similarity_index, name='similarity-index', daemon=True)
+        self._similarity_thread.start()
+        LOG.info('similarity_index_building', products=len(self.store), hint='run build_model.py to precompute it')
+    
+    def _build_similarity_index(self):
+        """Tính bảng similar products toàn catalog (O(n²)) rồi gán vào recommender"""
+        try:
+            start = time.perf_counter()
+            index = SimilarityIndex.build(self.feature_matrix, self.store.column('category'), SIMILARITY_NEIGHBORS)
+            directory = self._similarity_dir()
+            if directory:
+                index.save(directory)
+            self.similarity_index = index
+            LOG.info('similarity_index_built', seconds=round(time.perf_counter() - start, 1))
+        except Exception as e:
+            LOG.error('similarity_index_error', error=str(e), exc_info=True)
+    
+    def ensure_similarity_index(self):
+        """Similarity index đầy đủ; chờ bản đang tính ở background hoặc tính ngay (trước khi lưu artifact)"""
+        thread = getattr(self, '_similarity_thread', None)
+        if thread is not None:
+            thread.join()
+        if self.similarity_index is None and self.feature_matrix is not None:
+            self._build_similarity_index()
+        return self.similarity_index
+    
+    def get_similar_rows(self, row, limit=5, same_category=True):
+        """Sản phẩm tương tự tra từ bảng tính sẵn, trả về (rows, scores)"""
+        index = self.similarity_index
+        if index is not None:
+            return index.lookup(row, limit, same_category)
+        if self.feature_matrix is None:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        # Bảng chưa tính xong: tính chính xác riêng dòng này
+        codes = getattr(self, '_similarity_codes', None)
+        if codes is None:
+            codes = self._similarity_codes = SimilarityIndex.category_codes(self.store.column('category'))
+        tables = SimilarityIndex.compute_rows(self.feature_matrix, codes, [row], SIMILARITY_NEIGHBORS)
+        return SimilarityIndex(**tables).lookup(0, limit, same_category)
+    
+    def correct_query(self, query):
+        """Query với các từ gõ sai/không dấu lệch được sửa về term trong vocabulary"""
+        if self.corrector is None:
+            return query
+        return self.corrector.correct(query, self.vectorizer.analyzer)
+    
+    def engine_call(self, method, *args, **kwargs):
+        """self.engine.<method>(...): phần chấm điểm thuần, chạy được trong process worker"""
+        return getattr(self.engine, method)(*args, **kwargs)
+    
+    def score_vector(self, query_vector, limit, min_score=0.01, mask=None):
+        """Top `limit` cho vector nhiều term (vector user): một phép nhân CSR x vector trên toàn catalog.
+
+        Với vector có nnz lớn, gộp posting list của từng term (inverted engine)
+        chậm hơn nhiều so với một phép nhân sparse.
+        """
+        scores = np.asarray((self.feature_matrix @ query_vector.T).todense()).ravel()
+        if mask is not None:
+            scores = np.where(mask, scores, 0.0)
+        top = select_top_k(scores, limit, min_score)
+        return top, scores[top]
+    
+    def score(self, method, *args, **kwargs):
+        """Chấm điểm qua SCORING_POOL; cache, popularity và materialize vẫn ở process hiện tại"""
+        return SCORING_POOL.run(self, 'engine_call', method, *args, **kwargs)
+    
+    def search_rows(self, query, limit=20, filters=()):
+        """Tìm kiếm bằng TF-IDF, trả về (rows, scores) trong ProductStore.
+
+        `filters` (từ demographic_filters) được áp dụng thành mask trước khi
+        chọn top-k, nên kết quả vẫn đủ `limit` nếu có đủ sản phẩm phù hợp.
+        """
+        if len(self.store) == 0 or self.feature_matrix is None:
+            LOG.warning('search_unavailable', reason='no data or model not trained')
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        
+        cache_key = ('search', normalize_query(query), limit, filters)
+        cached = QUERY_CACHE.get(self.catalog_version, cache_key)
+        if cached is not None:
+            return cached
         
         try:
-            print(f"🔍 Searching for: '{query}' (limit: {limit})")
-            
             # Vectorize query
-            query_vector = self.vectorizer.transform([query.lower()])
+            with span('vectorize'):
+                query_vector = self.vectorizer.transform([self.correct_query(query)])
             
-            # Tính similarity
-            similarities = cosine_similarity(query_vector, self.feature_matrix).flatten()
+            # Lấy top k results (chỉ lấy kết quả có similarity > 0.01)
+            with span('score'):
+                mask = self.store.filter_mask(**dict(filters))
+                top_indices, top_scores = self.score('search', query_vector, limit, min_score=0.01, mask=mask)
             
-            # Lấy top k results
-            top_indices = similarities.argsort()[-limit:][::-1]
-            
-            results = []
-            for idx in top_indices:
-                if similarities[idx] > 0.01:  # Chỉ lấy kết quả có similarity > 0.01
-                    product = self.df.iloc[idx].to_dict()
-                    
-                    # Đảm bảo có id
-                    if 'id' not in product:
-                        product['id'] = int(idx) + 1
-                    
-                    # Thêm scores
-                    product['relevance'] = float(similarities[idx])
-                    product['match_score'] = float(similarities[idx])
-                    
-                    # Format đúng type
-                    product['id'] = int(product['id'])
-                    
-                    results.append(product)
-            
-            print(f"Found {len(results)} results with similarity > 0.01")
-            return results
+            LOG.debug('search_scored', query=query, limit=limit, results=len(top_indices))
+            top_indices.flags.writeable = False
+            top_scores.flags.writeable = False
+            QUERY_CACHE.put(self.catalog_version, cache_key, (top_indices, top_scores))
+            return top_indices, top_scores
             
         except Exception as e:
-            print(f"Search products error: {e}")
-            import traceback
-            traceback.print_exc()
-            return []
+            LOG.error('search_rows_error', error=str(e), exc_info=True)
+            return np.empty(0, dtype=np.int64), np.empty(0)
+    
+    def search_faceted(self, query, limit=20, facet_filters=(), with_counts=True):
+        """Tìm kiếm kèm facet, trả về (rows, scores, facets).
+
+        Tập khớp đầy đủ (mọi sản phẩm có điểm > 0.01) được đếm theo facet bằng
+        bitset; top `limit` được chọn trong phần tập khớp thỏa `facet_filters`.
+        """
+        if len(self.store) == 0 or self.feature_matrix is None:
+            LOG.warning('search_unavailable', reason='no data or model not trained')
+            return np.empty(0, dtype=np.int64), np.empty(0), None
+        
+        cache_key = ('facets', normalize_query(query), limit, facet_filters, with_counts)
+        cached = QUERY_CACHE.get(self.catalog_version, cache_key)
+        if cached is not None:
+            return cached
+        
+        with span('vectorize'):
+            query_vector = self.vectorizer.transform([self.correct_query(query)])
+        with span('score'):
+            candidates, scores = self.score('match', query_vector, min_score=0.01)
+            mask = self.store.facets.filter_mask(facet_filters)
+            if mask is not None:
+                keep = mask[candidates]
+                rows, row_scores = candidates[keep], scores[keep]
+            else:
+                rows, row_scores = candidates, scores
+            top = select_top_k(row_scores, limit, min_score=0.01)
+            top_indices, top_scores = rows[top], row_scores[top]
+        
+        facets = None
+        if with_counts:
+            with span('facets'):
+                facets = self.store.facets.counts(self.store.facets.match_bits(candidates), facet_filters)
+        
+        top_indices.flags.writeable = False
+        top_scores.flags.writeable = False
+        result = (top_indices, top_scores, facets)
+        QUERY_CACHE.put(self.catalog_version, cache_key, result)
+        return result
+    
+    def search_many(self, queries, limit=20):
+        """Tìm kiếm nhiều query cùng lúc, trả về danh sách (rows, scores) theo thứ tự queries.
+
+        Các query chưa có trong cache được vectorize chung và chấm điểm bằng một
+        phép nhân ma trận sparse thay vì gọi search_rows từng query.
+        """
+        empty = (np.empty(0, dtype=np.int64), np.empty(0))
+        if len(self.store) == 0 or self.feature_matrix is None:
+            return [empty for _ in queries]
+        
+        results = [None] * len(queries)
+        pending = {}
+        for i, query in enumerate(queries):
+            cache_key = ('search', normalize_query(query), limit, ())
+            cached = QUERY_CACHE.get(self.catalog_version, cache_key)
+            if cached is not None:
+                results[i] = cached
+            else:
+                pending.setdefault(cache_key, []).append(i)
+        
+        if pending:
+            keys = list(pending)
+            with span('vectorize'):
+                query_matrix = self.vectorizer.transform([self.correct_query(queries[pending[key][0]]) for key in keys])
+            with span('score'):
+                scored = self.score('search_many', query_matrix, limit, min_score=0.01)
+            for key, (top_indices, top_scores) in zip(keys, scored):
+                top_indices.flags.writeable = False
+                top_scores.flags.writeable = False
+                QUERY_CACHE.put(self.catalog_version, key, (top_indices, top_scores))
+                for i in pending[key]:
+                    results[i] = (top_indices, top_scores)
+        
+        LOG.debug('batch_search_scored', queries=len(queries), scored=len(pending))
+        return results
+    
+    def search_products(self, query, limit=20, filters=()):
+        """Tìm kiếm sản phẩm bằng TF-IDF"""
+        rows, scores = self.search_rows(query, limit, filters)
+        return self.store.products(rows, relevance=scores, match_score=scores)
     
     def recommend(self, user_input, limit=20):
         """Gợi ý sản phẩm dựa trên user input"""
-        if len(self.df) == 0:
+        if len(self.store) == 0:
             return []
         
         try:
@@ -158,164 +2858,1042 @@ class ProductRecommender:
             
             # Nếu không có query, trả về popular products
             if not query.strip():
-                print("No query, returning popular products")
+                LOG.debug('recommend_empty_query')
                 return self.get_popular_products(limit)
             
-            # Tìm kiếm bằng TF-IDF
-            results = self.search_products(query, limit)
+            # gender, age, weight, category lọc ngay trong bước chấm điểm
+            filters = demographic_filters(user_input)
+            cache_key = (
+                'recommend',
+                tuple(normalize_query(goal) for goal in user_input.get('health_goals', [])),
+                tuple(normalize_query(symptom) for symptom in user_input.get('symptoms', [])),
+                filters,
+                limit,
+            )
+            cached = QUERY_CACHE.get(self.catalog_version, cache_key)
+            if cached is not None:
+                return [dict(product) for product in cached]
             
-            # Filter by demographics nếu cần
-            gender = user_input.get('gender', 'All').lower()
-            if gender != 'all':
-                filtered_results = []
-                for product in results:
-                    product_gender = str(product.get('target_gender', 'All')).lower()
-                    if product_gender == 'all' or product_gender == gender:
-                        filtered_results.append(product)
-                results = filtered_results[:limit]
+            # Tìm kiếm bằng TF-IDF
+            results = self.search_products(query, limit, filters)
             
+            QUERY_CACHE.put(self.catalog_version, cache_key, tuple(dict(product) for product in results))
             return results
             
         except Exception as e:
-            print(f"Recommend error: {e}")
+            LOG.error('recommend_error', error=str(e))
             return self.get_popular_products(limit)
     
+    def get_row_by_id(self, product_id):
+        """Tra dòng của sản phẩm trong ProductStore theo id (O(log n))"""
+        # Chuyển đổi product_id sang int nếu cần
+        if isinstance(product_id, str):
+            product_id = int(product_id)
+        return self.store.row_of(product_id)
+    
+    def _detail_product(self, row):
+        """Dict chi tiết sản phẩm kèm thông tin bổ sung"""
+        product = self.store.product(row)
+        product['has_age_range'] = 'age_range' in product and product['age_range'] != ''
+        product['has_weight_range'] = 'weight_range' in product and product['weight_range'] != ''
+        return product
+    
     def get_product_by_id(self, product_id):
         """Lấy chi tiết sản phẩm"""
-        if len(self.df) == 0:
+        if len(self.store) == 0:
             return None
         
         try:
-            # Chuyển đổi product_id sang int nếu cần
-            if isinstance(product_id, str):
-                product_id = int(product_id)
-            
-            # Tìm sản phẩm
-            product_row = self.df[self.df['id'] == product_id]
+            row = self.get_row_by_id(product_id)
             
-            if not product_row.empty:
-                product = product_row.iloc[0].to_dict()
-                
-                # Đảm bảo id là int
-                product['id'] = int(product['id'])
-                
-                # Thêm thông tin bổ sung
-                product['has_age_range'] = 'age_range' in product and product['age_range'] != ''
-                product['has_weight_range'] = 'weight_range' in product and product['weight_range'] != ''
-                
-                return product
+            if row is not None:
+                return self._detail_product(row)
             
-            print(f"Product ID {product_id} not found")
+            LOG.debug('product_not_found', product_id=product_id)
             return None
             
         except Exception as e:
-            print(f"Error getting product by id: {e}")
+            LOG.error('product_by_id_error', product_id=product_id, error=str(e))
             return None
     
+    def get_products_by_ids(self, product_ids):
+        """Lấy chi tiết nhiều sản phẩm theo thứ tự ids, bỏ qua id không tồn tại"""
+        if len(self.store) == 0:
+            return []
+        
+        products = []
+        for product_id in product_ids:
+            try:
+                row = self.get_row_by_id(product_id)
+            except (TypeError, ValueError) as e:
+                LOG.warning('invalid_product_id', product_id=repr(product_id), error=str(e))
+                continue
+            if row is not None:
+                products.append(self._detail_product(row))
+        return products
+    
     def get_categories(self, limit=None):
         """Lấy danh sách categories"""
-        if len(self.df) == 0:
+        if len(self.store) == 0:
             return []
         
-        categories = self.df['category'].unique().tolist()
+        categories = self.store.categories
         if limit:
             return categories[:limit]
         return categories
     
     def get_popular_products(self, limit=10):
-        """Lấy sản phẩm phổ biến (mẫu)"""
-        if len(self.df) == 0:
+        """Sản phẩm phổ biến theo lượt xem/search có suy giảm theo thời gian (đọc từ snapshot tính sẵn)"""
+        if len(self.store) == 0:
             return []
         
         try:
-            # Lấy ngẫu nhiên limit sản phẩm
-            sample_size = min(limit, len(self.df))
-            sample_df = self.df.sample(sample_size)
-            products = sample_df.to_dict('records')
-            
-            # Thêm relevance và match_score
-            for product in products:
-                product['relevance'] = 0.8
-                product['match_score'] = 0.7
-                product['id'] = int(product['id'])
-            
-            return products
+            rows, scores = get_popular_snapshot(self).top(limit)
+            return self.store.products(rows, relevance=scores, match_score=scores)
             
         except Exception as e:
-            print(f"Error getting popular products: {e}")
+            LOG.error('popular_products_error', error=str(e))
             return []
     
-    def get_personalized_recommendations(self, user_profile, view_history, search_history, limit=10):
-        """Gợi ý cá nhân hóa"""
-        if len(self.df) == 0:
+    # Hệ số suy giảm mỗi sự kiện mới hơn và trọng số trộn các nguồn của vector user
+    SEARCH_DECAY = 0.7
+    VIEW_DECAY = 0.8
+    USER_VECTOR_WEIGHTS = {'searches': 1.0, 'views': 0.7, 'profile': 0.5}
+    
+    def _rows_of_ids(self, product_ids):
+        """Dòng trong ProductStore của các id hợp lệ, giữ thứ tự"""
+        rows = []
+        for product_id in product_ids:
+            try:
+                row = self.get_row_by_id(product_id)
+            except (TypeError, ValueError):
+                continue
+            if row is not None:
+                rows.append(row)
+        return rows
+    
+    @staticmethod
+    def _decayed_sum(matrix, decay):
+        """Tổng có trọng số các dòng, dòng cuối (mới nhất) có trọng số 1"""
+        n_rows = matrix.shape[0]
+        weights = decay ** np.arange(n_rows - 1, -1, -1, dtype=np.float64)
+        return sp.csr_matrix(sp.csr_matrix(weights[None, :]) @ matrix)
+    
+    def _empty_vector(self):
+        return sp.csr_matrix((1, self.feature_matrix.shape[1]))
+    
+    def user_components(self, user_profile, view_history, search_history):
+        """Các thành phần vector sở thích của user (sparse 1 x n_features) theo từng nguồn"""
+        components = {name: self._empty_vector() for name in self.USER_VECTOR_WEIGHTS}
+        if search_history:
+            queries = self.vectorizer.transform([query.lower() for query in search_history])
+            components['searches'] = self._decayed_sum(queries, self.SEARCH_DECAY)
+        rows = self._rows_of_ids(view_history or [])
+        if rows:
+            components['views'] = self._decayed_sum(self.feature_matrix[rows], self.VIEW_DECAY)
+        if user_profile:
+            concerns = {user_profile.get('health_concerns') or '', user_profile.get('diseases') or ''}
+            components['profile'] = self.vectorizer.transform([' '.join(concerns).lower()])
+        return components
+    
+    def add_search(self, components, query):
+        """Cập nhật incremental thành phần search khi user tìm kiếm thêm"""
+        vector = self.vectorizer.transform([query.lower()])
+        components['searches'] = sp.csr_matrix(components['searches'] * self.SEARCH_DECAY + vector)
+    
+    def add_view(self, components, product_id):
+        """Cập nhật incremental thành phần view khi user xem thêm sản phẩm"""
+        rows = self._rows_of_ids([product_id])
+        if rows:
+            components['views'] = sp.csr_matrix(
+                components['views'] * self.VIEW_DECAY + self.feature_matrix[rows[0]])
+    
+    def user_vector(self, components):
+        """Trộn các thành phần (mỗi thành phần chuẩn hóa L2) thành vector user chuẩn hóa L2"""
+        vector = self._empty_vector()
+        for name, weight in self.USER_VECTOR_WEIGHTS.items():
+            component = components[name]
+            norm = np.sqrt(component.multiply(component).sum())
+            if norm > 0:
+                vector = vector + component * (weight / norm)
+        norm = np.sqrt(vector.multiply(vector).sum())
+        return sp.csr_matrix(vector / norm) if norm > 0 else vector
+    
+    def get_personalized_recommendations(self, user_profile, view_history, search_history, limit=10,
+                                         user_vector=None):
+        """Gợi ý cá nhân hóa: chấm điểm toàn catalog với vector user trong một phép nhân sparse.
+
+        Vector user trộn lịch sử search, sản phẩm đã xem (có suy giảm theo thời
+        gian) và health concerns trong profile. Sản phẩm đã xem và sản phẩm
+        không hợp age/weight trong profile bị loại bằng mask trước khi chọn top-k.
+        """
+        if len(self.store) == 0:
             return []
         
         try:
-            # Tạo query từ search history
-            query = ' '.join(search_history[-3:]) if search_history else ''
+            if user_vector is None:
+                user_vector = self.user_vector(self.user_components(user_profile, view_history, search_history))
+            viewed_rows = self._rows_of_ids(view_history or [])
             
-            if not query and user_profile:
-                # Sử dụng health concerns từ profile
-                query = user_profile.get('health_concerns', '') or user_profile.get('diseases', '')
+            if user_vector.nnz == 0:
+                # Chưa có tín hiệu nào: lấy popular products, bỏ sản phẩm đã xem
+                viewed = {int(self.store.ids[row]) for row in viewed_rows}
+                results = self.get_popular_products(limit + len(viewed))
+                return [p for p in results if p['id'] not in viewed][:limit]
             
-            if query:
-                # Tìm kiếm dựa trên query
-                results = self.search_products(query, limit * 2)
-            else:
-                # Nếu không có query, lấy popular products
-                results = self.get_popular_products(limit * 2)
+            filters = demographic_filters(user_profile)
+            vector = user_vector.tocsr()
+            cache_key = (
+                'personalized',
+                hashlib.sha1(vector.indices.tobytes() + vector.data.tobytes()).hexdigest(),
+                tuple(sorted(viewed_rows)),
+                filters,
+                limit,
+            )
+            cached = QUERY_CACHE.get(self.catalog_version, cache_key)
+            if cached is not None:
+                return [dict(product) for product in cached]
             
-            # Filter out viewed products
-            if view_history:
-                results = [p for p in results if p['id'] not in view_history]
+            mask = self.store.filter_mask(**dict(filters))
+            if viewed_rows:
+                mask = np.ones(len(self.store), dtype=bool) if mask is None else mask.copy()
+                mask[viewed_rows] = False
             
-            # Limit results
-            return results[:limit]
+            with span('score'):
+                rows, scores = SCORING_POOL.run(self, 'score_vector', vector, limit, min_score=0.01, mask=mask)
+            with span('materialize'):
+                results = self.store.products(rows, relevance=scores, match_score=scores)
+            QUERY_CACHE.put(self.catalog_version, cache_key, tuple(dict(product) for product in results))
+            return results
             
         except Exception as e:
-            print(f"Error getting personalized recommendations: {e}")
+            LOG.error('personalized_error', error=str(e))
             return self.get_popular_products(limit)
 
+# ==================== MODEL ARTIFACT ====================
+MODEL_ARTIFACT_FORMAT = 4
+
+def dataframe_version(df):
+    """Version của catalog tính từ nội dung DataFrame"""
+    digest = hashlib.sha256(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()[:12]
+
+def _save_sparse_arrays(directory, prefix, matrix):
+    for name in ('data', 'indices', 'indptr'):
+        np.save(os.path.join(directory, f'{prefix}_{name}.npy'), getattr(matrix, name))
+
+def _load_sparse_arrays(directory, prefix):
+    return tuple(
+        np.load(os.path.join(directory, f'{prefix}_{name}.npy'), mmap_mode='r')
+        for name in ('data', 'indices', 'indptr')
+    )
+
+def _save_arrays(directory, prefix, arrays):
+    for name, array in arrays.items():
+        np.save(os.path.join(directory, f'{prefix}_{name}.npy'), array)
+
+def _load_arrays(directory, prefix, names):
+    return {name: np.load(os.path.join(directory, f'{prefix}_{name}.npy'), mmap_mode='r') for name in names}
+
+def source_fingerprint(path):
+    """Kích thước, mtime và sha256 của file dữ liệu nguồn"""
+    stat = os.stat(path)
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': digest.hexdigest()}
+
+def save_model_artifact(recommender, root=MODEL_DIR, source=DATA_FILE):
+    """Build artifact vào thư mục version mới rồi trỏ CURRENT sang (atomic)"""
+    fingerprint = source_fingerprint(source)
+    name = f"{fingerprint['sha256'][:12]}-{datetime.now().strftime('%Y%m%d%H%M%S')}"
+    tmp_dir = os.path.join(root, f'.tmp-{name}')
+    if os.path.exists(tmp_dir):
+        shutil.rmtree(tmp_dir)
+    
+    manifest = recommender.save(tmp_dir)
+    manifest['source'] = fingerprint
+    manifest['created_at'] = datetime.now().isoformat()
+    with open(os.path.join(tmp_dir, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_dir, os.path.join(root, name))
+    
+    # Các artifact cũ được giữ lại vì worker đang chạy có thể còn memory-map chúng
+    pointer = os.path.join(root, '.CURRENT.tmp')
+    with open(pointer, 'w', encoding='utf-8') as f:
+        f.write(name)
+    os.replace(pointer, os.path.join(root, 'CURRENT'))
+    LOG.info('model_artifact_saved', directory=os.path.join(root, name))
+    return os.path.join(root, name)
+
+def find_model_artifact(root=MODEL_DIR, source=DATA_FILE):
+    """Trả về thư mục artifact hiện tại nếu còn khớp với file nguồn, ngược lại None"""
+    try:
+        with open(os.path.join(root, 'CURRENT'), encoding='utf-8') as f:
+            directory = os.path.join(root, f.read().strip())
+        with open(os.path.join(directory, 'manifest.json'), encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    
+    if manifest.get('format_version') != MODEL_ARTIFACT_FORMAT:
+        LOG.warning('model_artifact_ignored', directory=directory, reason='old format')
+        return None
+    
+    built_from = manifest.get('source', {})
+    stat = os.stat(source)
+    if stat.st_size == built_from.get('size') and stat.st_mtime_ns == built_from.get('mtime_ns'):
+        return directory
+    if source_fingerprint(source)['sha256'] == built_from.get('sha256'):
+        return directory
+    
+    LOG.warning('model_artifact_ignored', directory=directory, reason='stale', source=source)
+    return None
+
+def build_recommender(base=None, source=DATA_FILE):
+    """Dựng recommender: ưu tiên artifact đã build sẵn, fallback fit từ CSV.
+
+    Nếu có `base` (recommender đang chạy), thử cập nhật incremental trước khi
+    fit lại toàn bộ. Trả về None nếu không có dữ liệu.
+    """
+    artifact_dir = find_model_artifact(source=source)
+    if artifact_dir:
+        try:
+            return ProductRecommender.from_artifact(artifact_dir)
+        except Exception as e:
+            LOG.error('model_artifact_error', directory=artifact_dir, error=str(e), exc_info=True)
+    
+    products_df = load_healthcare_data(source)
+    if products_df.empty:
+        return None
+    
+    catalog_version = source_fingerprint(source)['sha256'][:12]
+    if base is not None:
+        if base.catalog_version == catalog_version:
+            return base
+        updated = base.incremental_update(products_df, catalog_version)
+        if updated is not None:
+            return updated
+    return ProductRecommender(products_df, catalog_version=catalog_version)
+
 # Khởi tạo recommender
-if not PRODUCTS_DF.empty:
-    recommender = ProductRecommender(PRODUCTS_DF)
-    print("Recommender initialized successfully")
+recommender = build_recommender()
+if recommender is not None:
+    LOG.info('recommender_initialized', catalog_version=recommender.catalog_version, products=len(recommender.store))
 else:
-    recommender = None
-    print("Recommender not initialized due to empty data")
+    LOG.warning('recommender_not_initialized', reason='empty data')
 
-# ==================== HELPER FUNCTIONS ====================
-def save_search_history(history):
-    """Lưu lịch sử tìm kiếm"""
+# ==================== CATALOG RELOAD ====================
+RELOAD_STATE = {
+    "status": "idle",
+    "mode": None,
+    "started_at": None,
+    "finished_at": None,
+    "catalog_version": recommender.catalog_version if recommender else None,
+    "error": None,
+}
+_reload_lock = threading.Lock()
+
+def get_recommender():
+    """Snapshot recommender hiện tại; mỗi request giữ snapshot này tới khi xong"""
+    return recommender
+
+def reload_catalog(incremental=True):
+    """Dựng recommender mới từ dữ liệu hiện tại rồi swap vào (atomic)"""
+    global recommender
+    
+    if not _reload_lock.acquire(blocking=False):
+        LOG.info('catalog_reload_skipped', reason='already running')
+        return False
+    
     try:
-        # Tạo thư mục nếu chưa tồn tại
-        os.makedirs('data', exist_ok=True)
+        RELOAD_STATE.update({
+            "status": "running",
+            "mode": "incremental" if incremental else "full",
+            "started_at": datetime.now().isoformat(),
+            "finished_at": None,
+            "error": None,
+        })
+        new_recommender = build_recommender(base=recommender if incremental else None)
+        if new_recommender is None:
+            raise ValueError("No products data available")
+        if new_recommender is not recommender:
+            # Dựng suggest index của catalog mới trước khi swap: /suggest không phải dựng trên request path
+            rebuild_suggest_index(new_recommender, wait=True)
+        
+        # Gán một lần: request mới dùng model mới, request đang chạy giữ snapshot cũ
+        recommender = new_recommender
+        SCORING_POOL.reset()
+        RELOAD_STATE.update({"status": "idle", "catalog_version": new_recommender.catalog_version})
+        LOG.info('catalog_reloaded', catalog_version=new_recommender.catalog_version)
+        return True
+    
+    except Exception as e:
+        LOG.error('catalog_reload_error', error=str(e), exc_info=True)
+        RELOAD_STATE.update({"status": "failed", "error": str(e)})
+        return False
+    
+    finally:
+        RELOAD_STATE["finished_at"] = datetime.now().isoformat()
+        _reload_lock.release()
+
+def start_catalog_reload(incremental=True):
+    """Chạy reload ở background thread, ngoài request path"""
+    if _reload_lock.locked():
+        return False
+    threading.Thread(target=reload_catalog, args=(incremental,), daemon=True).start()
+    return True
+
+# `kill -HUP <pid>` để reload catalog
+try:
+    signal.signal(signal.SIGHUP, lambda signum, frame: start_catalog_reload())
+except (AttributeError, ValueError):
+    # Windows không có SIGHUP; chỉ đăng ký được trong main thread
+    pass
+
+# ==================== SCORING POOL ====================
+class StaleScoringWorker(Exception):
+    """Process worker không có model đúng catalog version của request"""
+
+_unavailable_versions = set()
+
+def _load_worker_recommender(catalog_version):
+    """Trong process worker: load lại model (artifact memory-map hoặc CSV) nếu khác version của process cha"""
+    global recommender
+    if recommender is not None and recommender.catalog_version == catalog_version:
+        return True
+    if catalog_version in _unavailable_versions:
+        return False
+    recommender = build_recommender()
+    if recommender is None or recommender.catalog_version != catalog_version:
+        # Version chỉ có ở process cha (vd. catalog đã đổi sau khi reload): không thử load lại mỗi lệnh
+        _unavailable_versions.add(catalog_version)
+        return False
+    return True
+
+def _init_scoring_worker(catalog_version):
+    """Khởi tạo process worker (forkserver): import app đã load model; bỏ signal handler của server"""
+    for name in ('SIGTERM', 'SIGINT', 'SIGHUP'):
+        if hasattr(signal, name):
+            signal.signal(getattr(signal, name), signal.SIG_DFL)
+    _load_worker_recommender(catalog_version)
+
+def _call_recommender(catalog_version, method, args, kwargs):
+    """Chạy trong process worker trên model của worker; StaleScoringWorker nếu không cùng version"""
+    if not _load_worker_recommender(catalog_version):
+        raise StaleScoringWorker(catalog_version)
+    return getattr(get_recommender(), method)(*args, **kwargs)
+
+class ScoringPool:
+    """Pool chạy phần chấm điểm thuần (engine.search/match/search_many trên vector đã
+    vectorize) ngoài request thread; query cache, popularity và materialize sản
+    phẩm luôn ở process server nên dùng chung giữa các request.
+
+    kind='thread' dùng chung recommender trong process; kind='process' chạy
+    worker bằng start method 'forkserver' (không fork process server đang có
+    thread); mỗi worker import app và load model của mình, nên nên build
+    artifact trước (build_model.py) để load chỉ là memory-map. Worker có model
+    khác version thì lệnh chạy trực tiếp trên request thread. kind='none'
+    (mặc định) chạy trực tiếp trên request thread: request thread đã là một
+    thread riêng nên 'thread' chỉ thêm một lần chuyển thread mà vẫn chung GIL.
+    """
+    
+    def __init__(self, kind='none', workers=None, timeout=30.0):
+        self.kind = kind
+        self.workers = workers or os.cpu_count() or 4
+        self.timeout = timeout
+        self._executor = None
+        self._lock = threading.Lock()
+    
+    def _get_executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    if self.kind == 'process':
+                        current = get_recommender()
+                        self._executor = ProcessPoolExecutor(
+                            self.workers, mp_context=multiprocessing.get_context('forkserver'),
+                            initializer=_init_scoring_worker,
+                            initargs=(current.catalog_version if current else None,))
+                    else:
+                        self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='scoring')
+        return self._executor
+    
+    def run(self, recommender, method, *args, **kwargs):
+        """Gọi recommender.<method>(*args, **kwargs) trong pool và chờ kết quả"""
+        if self.kind == 'none':
+            return getattr(recommender, method)(*args, **kwargs)
+        if self.kind == 'process':
+            if recommender is not get_recommender():
+                # Snapshot cũ (catalog vừa reload): worker không còn giữ model này
+                return getattr(recommender, method)(*args, **kwargs)
+            future = self._get_executor().submit(
+                _call_recommender, recommender.catalog_version, method, args, kwargs)
+            try:
+                return future.result(timeout=self.timeout)
+            except StaleScoringWorker:
+                return getattr(recommender, method)(*args, **kwargs)
+        future = self._get_executor().submit(getattr(recommender, method), *args, **kwargs)
+        return future.result(timeout=self.timeout)
+    
+    def reset(self):
+        """Sau khi reload catalog: process worker mới sẽ load model mới"""
+        if self.kind != 'process':
+            return
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+    
+    def reset_after_fork(self):
+        """Trong process con vừa fork: executor của process cha không dùng được, tạo mới khi cần"""
+        self._executor = None
+        self._lock = threading.Lock()
+    
+    def stats(self):
+        return {"kind": self.kind, "workers": self.workers, "timeout": self.timeout}
+
+SCORING_POOL = ScoringPool(
+    kind=os.environ.get('SCORING_POOL', 'none'),
+    workers=int(os.environ.get('SCORING_WORKERS', 0)) or None,
+    timeout=float(os.environ.get('SCORING_TIMEOUT', 30)),
+)
+
+# ==================== SEARCH HISTORY LOG ====================
+class SearchHistoryLog:
+    """Log lịch sử tìm kiếm dạng append-only (JSON lines).
+
+    Request chỉ đẩy record vào hàng đợi có giới hạn; một thread nền ghi theo
+    batch, fsync theo chu kỳ và xoay file (rotation) khi vượt `max_bytes`.
+    """
+    
+    def __init__(self, path, legacy_path=None, max_queue=10000, batch_size=256,
+                 flush_interval=1.0, max_bytes=10 * 1024 * 1024, backup_count=5):
+        self.path = path
+        self.legacy_path = legacy_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.dropped = 0
+        self.written = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._start_lock = threading.Lock()
+    
+    def append(self, record):
+        """Đưa record vào hàng đợi; bỏ record nếu hàng đợi đầy để không chặn request"""
+        self._ensure_writer()
+        try:
+            self._queue.put_nowait(record)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+    
+    def flush(self, timeout=5.0):
+        """Chờ thread nền ghi hết các record đang chờ"""
+        if self._thread is None:
+            return
+        done = threading.Event()
+        try:
+            self._queue.put(done, timeout=timeout)
+        except queue.Full:
+            return
+        done.wait(timeout)
+    
+    def _ensure_writer(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='search-history-writer', daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+    
+    def reset_after_fork(self):
+        """Trong process con vừa fork: hàng đợi và thread ghi riêng cho process con"""
+        self._queue = queue.Queue(maxsize=self._queue.maxsize)
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self._ensure_writer()
+    
+    def _run(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
         
-        # Lưu vào file JSON
-        history_file = 'data/search_history.json'
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            
+            records = [item for item in batch if not isinstance(item, threading.Event)]
+            try:
+                if records:
+                    self._write(records)
+            except Exception as e:
+                LOG.error('search_history_write_error', error=str(e))
+            
+            for item in batch:
+                if isinstance(item, threading.Event):
+                    item.set()
+    
+    def _write(self, records):
+        data = ''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in records).encode('utf-8')
         
-        # Đọc lịch sử hiện có
-        if os.path.exists(history_file):
-            with open(history_file, 'r', encoding='utf-8') as f:
-                histories = json.load(f)
+        # Các worker của serve.py ghi chung file: flock (file .lock riêng, mở lại mỗi lần để
+        # process con không dùng chung open file description với process cha) bao cả bước
+        # kiểm tra kích thước, xoay file và ghi, để hai process không cùng xoay một file
+        lock_fd = os.open(f'{self.path}.lock', os.O_WRONLY | os.O_CREAT, 0o644)
+        try:
+            if fcntl is not None:
+                fcntl.flock(lock_fd, fcntl.LOCK_EX)
+            if os.path.exists(self.path) and os.path.getsize(self.path) + len(data) > self.max_bytes:
+                self._rotate()
+            
+            # Một lần write() với O_APPEND cho cả batch để các dòng không bị xen kẽ
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, data)
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        finally:
+            # Đóng fd là nhả flock
+            os.close(lock_fd)
+        self.written += len(records)
+    
+    def _rotate(self):
+        """search_history.jsonl -> .1 -> .2 ...; bỏ file cũ hơn backup_count"""
+        for i in range(self.backup_count - 1, 0, -1):
+            src = f'{self.path}.{i}'
+            if os.path.exists(src):
+                os.replace(src, f'{self.path}.{i + 1}')
+        if self.backup_count > 0:
+            os.replace(self.path, f'{self.path}.1')
         else:
-            histories = []
+            os.remove(self.path)
+    
+    def _files(self):
+        """Các file log theo thứ tự cũ -> mới"""
+        files = [f'{self.path}.{i}' for i in range(self.backup_count, 0, -1)] + [self.path]
+        return [path for path in files if os.path.exists(path)]
+    
+    def iter_records(self):
+        """Đọc tuần tự toàn bộ lịch sử (cũ -> mới), kể cả file JSON cũ nếu còn"""
+        if self.legacy_path and os.path.exists(self.legacy_path):
+            try:
+                with open(self.legacy_path, 'r', encoding='utf-8') as f:
+                    yield from json.load(f)
+            except ValueError as e:
+                LOG.error('search_history_legacy_read_error', error=str(e))
         
-        # Thêm lịch sử mới
-        histories.append(history)
+        for path in self._files():
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
+    
+    def tail(self, n=100):
+        """n record mới nhất (mới nhất ở cuối), chỉ đọc phần cuối các file"""
+        lines = []
+        for path in reversed(self._files()):
+            lines = self._tail_lines(path, n - len(lines)) + lines
+            if len(lines) >= n:
+                break
+        records = [json.loads(line) for line in lines]
         
-        # Giới hạn số lượng bản ghi
-        if len(histories) > 1000:
-            histories = histories[-1000:]
+        if len(records) < n and self.legacy_path and os.path.exists(self.legacy_path):
+            with open(self.legacy_path, 'r', encoding='utf-8') as f:
+                legacy = json.load(f)
+            records = legacy[max(0, len(legacy) - (n - len(records))):] + records
+        return records
+    
+    @staticmethod
+    def _tail_lines(path, n, block_size=64 * 1024):
+        if n <= 0:
+            return []
+        with open(path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            position = f.tell()
+            data = b''
+            while position > 0 and data.count(b'\n') <= n:
+                step = min(block_size, position)
+                position -= step
+                f.seek(position)
+                data = f.read(step) + data
+        lines = [line.decode('utf-8') for line in data.splitlines() if line.strip()]
+        return lines[-n:]
+
+SEARCH_HISTORY_LOG = SearchHistoryLog('data/search_history.jsonl', legacy_path='data/search_history.json')
+
+def flush_background_writers():
+    """Ghi hết lịch sử user và search đang chờ (trước khi fork worker hoặc khi worker thoát)"""
+    USER_STORE.flush()
+    SEARCH_HISTORY_LOG.flush()
+
+def reset_after_fork():
+    """Gọi trong worker ngay sau fork (serve.py): thread nền không được fork theo, lock có thể
+    đang bị giữ bởi thread của process cha, nên tạo lại rồi khởi động thread ghi của worker"""
+    USER_STORE.reset_after_fork()
+    SEARCH_HISTORY_LOG.reset_after_fork()
+    SCORING_POOL.reset_after_fork()
+
+# ==================== SUGGEST INDEX ====================
+def suggest_key(text):
+    """Key tra prefix: chữ thường, gộp khoảng trắng, bỏ dấu"""
+    return fold_diacritics(normalize_query(text))
+
+class SuggestIndex:
+    """Index prefix cho gợi ý khi gõ: mảng key đã sắp xếp + bisect.
+
+    Mỗi key (đã bỏ dấu) ứng với một gợi ý (text, type, weight). Với prefix
+    khớp nhiều hơn `precompute_threshold` key, top gợi ý được tính sẵn lúc
+    build nên mỗi lần tra chỉ tốn hai lần bisect và một lần chọn top-k trên
+    vùng nhỏ.
+    """
+    
+    def __init__(self, entries, max_results=10, precompute_threshold=2048):
+        """entries: iterable (text, type, weight); text trùng key được gộp, cộng weight"""
+        merged = {}
+        for text, kind, weight in entries:
+            key = suggest_key(text)
+            if not key:
+                continue
+            current = merged.get(key)
+            if current is None:
+                merged[key] = [text, kind, weight]
+            else:
+                current[2] += weight
         
-        # Lưu file
-        with open(history_file, 'w', encoding='utf-8') as f:
-            json.dump(histories, f, ensure_ascii=False, indent=2)
-            
-        print(f"Saved search history for {history['email']}")
+        self.keys = sorted(merged)
+        self.texts = [merged[key][0] for key in self.keys]
+        self.kinds = [merged[key][1] for key in self.keys]
+        self.weights = np.array([merged[key][2] for key in self.keys], dtype=np.float64)
+        self.max_results = max_results
+        self.precompute_threshold = precompute_threshold
+        self._top_by_prefix = {}
+        self._precompute('', 0, len(self.keys))
+    
+    def __len__(self):
+        return len(self.keys)
+    
+    def _range(self, prefix, lo=0, hi=None):
+        hi = len(self.keys) if hi is None else hi
+        start = bisect.bisect_left(self.keys, prefix, lo, hi)
+        end = bisect.bisect_left(self.keys, prefix + '\uffff', start, hi)
+        return start, end
+    
+    def _top(self, start, end, limit):
+        weights = self.weights[start:end]
+        if len(weights) > limit:
+            top = np.argpartition(-weights, limit - 1)[:limit]
+        else:
+            top = np.arange(len(weights))
+        top = top[np.lexsort((top, -weights[top]))]
+        return start + top
+    
+    def _precompute(self, prefix, start, end):
+        """Top gợi ý cho mọi prefix có vùng lớn hơn ngưỡng (duyệt theo từng ký tự)"""
+        if end - start <= self.precompute_threshold:
+            return
+        self._top_by_prefix[prefix] = self._top(start, end, self.max_results)
+        depth = len(prefix)
+        position = start
+        while position < end:
+            key = self.keys[position]
+            if len(key) <= depth:
+                position += 1
+                continue
+            child = key[:depth + 1]
+            child_start, child_end = self._range(child, position, end)
+            self._precompute(child, child_start, child_end)
+            position = child_end
+    
+    def complete(self, prefix, limit=None):
+        """Danh sách gợi ý cho prefix, weight giảm dần"""
+        limit = min(limit or self.max_results, self.max_results)
+        prefix = suggest_key(prefix)
+        if not prefix or limit <= 0:
+            return []
         
+        rows = self._top_by_prefix.get(prefix)
+        if rows is None:
+            start, end = self._range(prefix)
+            rows = self._top(start, end, limit)
+        return [
+            {"text": self.texts[row], "type": self.kinds[row], "score": float(self.weights[row])}
+            for row in rows[:limit]
+        ]
+
+SUGGEST_MIN_QUERY_COUNT = int(os.environ.get('SUGGEST_MIN_QUERY_COUNT', 5))
+SUGGEST_MIN_QUERY_USERS = int(os.environ.get('SUGGEST_MIN_QUERY_USERS', 3))
+
+def collect_suggestions(recommender, history_log=None, max_queries=10000,
+                        min_count=SUGGEST_MIN_QUERY_COUNT, min_users=SUGGEST_MIN_QUERY_USERS):
+    """Gợi ý từ catalog (tên, category, health goal) và các query phổ biến trong lịch sử.
+
+    Query lịch sử chỉ được gợi ý khi có ít nhất `min_count` lượt tìm từ ít nhất
+    `min_users` user khác nhau, để không lộ query (vd. bệnh) của riêng một người.
+    """
+    entries = []
+    if recommender is not None:
+        store = recommender.store
+        entries.extend((name, 'product', 1.0) for name in store.column('name').tolist() if name)
+        for category, count in Counter(store.column('category').tolist()).items():
+            if category:
+                entries.append((category, 'category', float(count)))
+        goals = Counter(
+            goal.strip() for value in store.column('health_goal').tolist()
+            for goal in str(value).split(',') if goal.strip()
+        )
+        entries.extend((goal, 'health_goal', float(count)) for goal, count in goals.items())
+    
+    if history_log is not None:
+        queries = Counter()
+        users = defaultdict(set)
+        for record in history_log.iter_records():
+            query = normalize_query(record.get('query', ''))
+            if not query:
+                continue
+            queries[query] += 1
+            if record.get('email'):
+                users[query].add(record['email'])
+        public = Counter({
+            query: count for query, count in queries.items()
+            if count >= min_count and len(users[query]) >= min_users
+        })
+        entries.extend((query, 'query', float(count)) for query, count in public.most_common(max_queries))
+    return entries
+
+SUGGEST_INDEX_TTL = float(os.environ.get('SUGGEST_INDEX_TTL', 600))
+SUGGEST_STATE = {"index": None, "catalog_version": None, "built_at": 0.0}
+_suggest_lock = threading.Lock()
+
+def rebuild_suggest_index(recommender, wait=False):
+    """Dựng lại suggest index từ catalog + search history rồi swap vào; wait=False bỏ qua nếu đang có lần dựng khác"""
+    if not _suggest_lock.acquire(blocking=wait):
+        return
+    try:
+        SEARCH_HISTORY_LOG.flush()
+        index = SuggestIndex(collect_suggestions(recommender, SEARCH_HISTORY_LOG))
+        SUGGEST_STATE.update({
+            "index": index,
+            "catalog_version": recommender.catalog_version if recommender else None,
+            "built_at": time.monotonic(),
+        })
+        LOG.info('suggest_index_built', entries=len(index))
     except Exception as e:
-        print(f"Error saving search history: {e}")
+        LOG.error('suggest_index_error', error=str(e), exc_info=True)
+    finally:
+        _suggest_lock.release()
+
+def start_suggest_rebuild(recommender):
+    """Dựng suggest index ở background thread; index hiện có vẫn được dùng tới khi bản mới được swap vào"""
+    if _suggest_lock.locked():
+        return False
+    threading.Thread(target=rebuild_suggest_index, args=(recommender,), daemon=True).start()
+    return True
+
+def get_suggest_index(recommender):
+    """Suggest index hiện có, không dựng trên request path.
+
+    Index của catalog khác (chưa dựng lúc reload/warm-up) hoặc quá TTL được
+    dựng lại ở background; request vẫn dùng index cũ (None nếu chưa có).
+    """
+    version = recommender.catalog_version if recommender else None
+    if SUGGEST_STATE["index"] is None or SUGGEST_STATE["catalog_version"] != version:
+        # Request còn giữ snapshot recommender cũ (vừa reload) không kích hoạt dựng lại
+        if recommender is get_recommender():
+            start_suggest_rebuild(recommender)
+    elif time.monotonic() - SUGGEST_STATE["built_at"] > SUGGEST_INDEX_TTL:
+        start_suggest_rebuild(recommender)
+    return SUGGEST_STATE["index"]
+
+def warm_up():
+    """Dựng trước ở background các index phụ (suggest) khi server khởi động, để request đầu không phải chờ"""
+    start_suggest_rebuild(get_recommender())
+
+# ==================== USER VECTORS ====================
+class UserVectorCache:
+    """Cache LRU các thành phần vector sở thích theo user, thread-safe.
+
+    Thành phần được dựng từ lịch sử ở lần dùng đầu tiên, sau đó cập nhật
+    incremental khi user xem sản phẩm / tìm kiếm; khi catalog version đổi
+    (vocabulary khác) thì dựng lại từ lịch sử.
+    """
+    
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def _entry(self, email, recommender):
+        entry = self._entries.get(email)
+        if entry is None or entry[0] != recommender.catalog_version:
+            return None
+        self._entries.move_to_end(email)
+        return entry[1]
+    
+    def get(self, email, recommender, user_profile, view_history, search_history):
+        """Vector user (sparse 1 x n_features, chuẩn hóa L2)"""
+        with self._lock:
+            components = self._entry(email, recommender)
+        if components is None:
+            components = recommender.user_components(user_profile, view_history, search_history)
+            with self._lock:
+                self._entries[email] = (recommender.catalog_version, components)
+                self._entries.move_to_end(email)
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+        return recommender.user_vector(components)
+    
+    def record_view(self, email, recommender, product_id):
+        with self._lock:
+            components = self._entry(email, recommender)
+            if components is not None:
+                recommender.add_view(components, product_id)
+    
+    def record_search(self, email, recommender, query):
+        with self._lock:
+            components = self._entry(email, recommender)
+            if components is not None:
+                recommender.add_search(components, query)
+    
+    def invalidate(self, email):
+        with self._lock:
+            self._entries.pop(email, None)
+
+USER_VECTORS = UserVectorCache(maxsize=int(os.environ.get('USER_VECTOR_CACHE_SIZE', 10000)))
+
+# ==================== HELPER FUNCTIONS ====================
+def save_search_history(history):
+    """Lưu lịch sử tìm kiếm (ghi bất đồng bộ vào search history log)"""
+    if not SEARCH_HISTORY_LOG.append(history):
+        LOG.warning('search_history_dropped', user=user_ref(history['email']))
+
+MAX_BATCH_QUERIES = 50
+MAX_LIMIT = 100
+
+def parse_limit(value, default):
+    """limit của request kẹp vào [1, MAX_LIMIT]; ValueError nếu không phải số nguyên"""
+    try:
+        return max(1, min(int(default if value is None else value), MAX_LIMIT))
+    except TypeError:
+        raise ValueError(f'invalid limit: {value!r}')
+
+def encode_cursor(handle, offset):
+    """Cursor opaque cho trang bắt đầu từ `offset` của ranking `handle`"""
+    return base64.urlsafe_b64encode(f'{handle}:{offset}'.encode('ascii')).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    """(handle, offset), hoặc None nếu cursor không hợp lệ"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('ascii')
+        handle, offset = raw.split(':')
+        return handle, max(int(offset), 0)
+    except ValueError:
+        return None
+
+def search_result_handle(recommender, query, depth=SEARCH_RESULT_DEPTH, facet_filters=(), with_facets=False):
+    """(handle, (rows, scores, query, facets)) của query; chỉ chấm điểm khi handle chưa có trong SEARCH_RESULTS"""
+    key = repr((normalize_query(query), depth, facet_filters, with_facets))
+    handle = hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+    ranking = SEARCH_RESULTS.get(recommender.catalog_version, handle)
+    if ranking is None:
+        if facet_filters or with_facets:
+            rows, scores, facets = recommender.search_faceted(query, depth, facet_filters, with_facets)
+        else:
+            rows, scores = recommender.search_rows(query, depth)
+            facets = None
+        ranking = (rows, scores, query, facets)
+        SEARCH_RESULTS.put(recommender.catalog_version, handle, ranking)
+    return handle, ranking
+
+def request_product_fields(data=None):
+    """Projection trường sản phẩm của request: ?fields=... hoặc `fields` trong JSON body"""
+    value = request.args.get('fields')
+    if value is None and data:
+        value = data.get('fields')
+    return parse_product_fields(value)
+
+def products_json_response(payload, products_key, products_json, status=200):
+    """Trả về JSON response, chèn mảng sản phẩm đã serialize sẵn vào `payload`"""
+    body = json_dumps(payload)[:-1]
+    if payload:
+        body += ', '
+    body += f'{json.dumps(products_key)}: {products_json}}}'
+    return app.response_class(body, status=status, mimetype='application/json')
+
+# ==================== PRECOMPUTED RESPONSES ====================
+class PrecomputedJSON:
+    """Payload JSON serialize sẵn thành bytes kèm ETag (hash nội dung)"""
+    
+    def __init__(self, payload):
+        self.payload = payload
+        self.body = json_dumps(payload).encode('utf-8')
+        self.etag = hashlib.sha1(self.body).hexdigest()[:20]
+        self._encoded = {}
+    
+    def encoded(self, encoding):
+        """Body nén bằng `encoding`, nén một lần ở mức cao nhất"""
+        body = self._encoded.get(encoding)
+        if body is None:
+            body = self._encoded[encoding] = compress(self.body, encoding, MAX_COMPRESS_LEVELS)
+        return body
+
+# Cache-Control max-age (giây) cho response tính sẵn
+CATALOG_MAX_AGE = int(os.environ.get('CATALOG_MAX_AGE', 300))
+LANDING_MAX_AGE = int(os.environ.get('LANDING_MAX_AGE', 30))
+
+def precomputed_json_response(precomputed, max_age=0):
+    """Response từ bytes có sẵn (nén sẵn nếu client chấp nhận); trả 304 nếu If-None-Match khớp ETag"""
+    compressible = len(precomputed.body) >= COMPRESS_MIN_BYTES
+    encoding = negotiate_encoding() if compressible else None
+    if encoding is None:
+        response = app.response_class(precomputed.body, mimetype='application/json')
+        response.set_etag(precomputed.etag)
+    else:
+        response = app.response_class(precomputed.encoded(encoding), mimetype='application/json')
+        response.headers['Content-Encoding'] = encoding
+        response.set_etag(f'{precomputed.etag}-{encoding}')
+    if compressible:
+        response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.max_age = max_age
+    return response.make_conditional(request)
+
+_CATALOG_RESPONSES = {"catalog_version": None, "responses": {}}
+_catalog_responses_lock = threading.Lock()
+
+CATALOG_RESPONSE_BUILDERS = {
+    'categories': lambda recommender: {
+        "status": "success",
+        "count": len(recommender.store.categories),
+        "categories": recommender.store.categories,
+        "category_counts": recommender.store.category_counts,
+        "total_products": len(recommender.store),
+    },
+}
+
+def catalog_response(recommender, name):
+    """Response `name` tính một lần cho mỗi catalog version"""
+    with _catalog_responses_lock:
+        if _CATALOG_RESPONSES["catalog_version"] != recommender.catalog_version:
+            _CATALOG_RESPONSES.update({"catalog_version": recommender.catalog_version, "responses": {}})
+        responses = _CATALOG_RESPONSES["responses"]
+        if name not in responses:
+            responses[name] = PrecomputedJSON(CATALOG_RESPONSE_BUILDERS[name](recommender))
+        return responses[name]
 
 # ==================== AUTH APIs ====================
 @app.route('/auth/signup', methods=['POST', 'OPTIONS'])
@@ -330,16 +3908,15 @@ def signup():
         if not email or not data.get('password') or not data.get('name'):
             return jsonify({"message": "Thiếu thông tin bắt buộc"}), 400
             
-        if email in USERS:
-            return jsonify({"message": "Email đã tồn tại"}), 400
-        
         # Tạo user mới
-        USERS[email] = {
+        created = USER_STORE.create_account(email, {
             "password": data.get('password'),
             "name": data.get('name'),
             "profile": None,
             "created_at": datetime.now().isoformat()
-        }
+        })
+        if not created:
+            return jsonify({"message": "Email đã tồn tại"}), 400
         
         return jsonify({
             "status": "success",
@@ -351,7 +3928,7 @@ def signup():
         })
         
     except Exception as e:
-        print(f"Signup error: {e}")
+        LOG.error('signup_error', error=str(e))
         return jsonify({"message": f"Lỗi: {str(e)}"}), 500
 
 @app.route('/auth/login', methods=['POST', 'OPTIONS'])
@@ -361,7 +3938,6 @@ def login():
     
     try:
         data = request.json
-        print(f"📨 Login request data: {data}")
         
         email = None
         password = None
@@ -376,31 +3952,27 @@ def login():
                 nested = data['email']
                 if 'email' in nested and isinstance(nested['email'], str):
                     email = nested['email'].strip().lower()
-                    print(f"Extracted email from nested object: {email}")
                 else:
                     # Try to get any string value from the object
                     for key, value in nested.items():
                         if isinstance(value, str) and '@' in value:
                             email = value.strip().lower()
-                            print(f"Found email in nested object key '{key}': {email}")
                             break
             
             # Get password
             if 'password' in data:
                 password = data['password']
         
-        print(f"🔐 Final extracted - Email: {email}, Has password: {bool(password)}")
-        
         if not email:
             return jsonify({"message": "Vui lòng nhập email"}), 400
         
         if not password:
             return jsonify({"message": "Vui lòng nhập mật khẩu"}), 400
         
-        user = USERS.get(email)
+        user = USER_STORE.get_account(email)
         
         if user and user['password'] == password:
-            print(f"Login success for: {email}")
+            LOG.info('login', user=user_ref(email), success=True)
             return jsonify({
                 "status": "success",
                 "user": {
@@ -410,13 +3982,11 @@ def login():
                 }
             })
         
-        print(f"Login failed for: {email}")
+        LOG.info('login', user=user_ref(email), success=False)
         return jsonify({"message": "Sai email hoặc mật khẩu"}), 401
         
     except Exception as e:
-        print(f"Login error: {e}")
-        import traceback
-        traceback.print_exc()
+        LOG.error('login_error', error=str(e), exc_info=True)
         return jsonify({"message": f"Lỗi server: {str(e)}"}), 500
 
 @app.route('/user/profile', methods=['POST', 'OPTIONS'])
@@ -431,8 +4001,7 @@ def save_profile():
         if not email:
             return jsonify({"message": "Thiếu email"}), 400
             
-        user = USERS.get(email)
-        if not user:
+        if USER_STORE.get_account(email) is None:
             return jsonify({"message": "User không tồn tại"}), 404
         
         # Tạo profile
@@ -445,7 +4014,8 @@ def save_profile():
         }
         
         # Cập nhật user
-        user['profile'] = profile
+        USER_STORE.update_profile(email, profile)
+        USER_VECTORS.invalidate(email)
         
         return jsonify({
             "status": "success",
@@ -454,132 +4024,259 @@ def save_profile():
         })
         
     except Exception as e:
-        print(f"Save profile error: {e}")
+        LOG.error('save_profile_error', error=str(e))
         return jsonify({"message": f"Lỗi: {str(e)}"}), 500
 
 # ==================== PRODUCT APIs ====================
 @app.route('/api/products/search', methods=['POST', 'OPTIONS'])
 def search_products():
-    """API tìm kiếm sản phẩm"""
+    """API tìm kiếm sản phẩm.
+
+    `ranked` là số kết quả đã xếp hạng có thể phân trang bằng cursor, tối đa
+    SEARCH_RESULT_DEPTH (`ranked_capped` = true khi chạm ngưỡng), không phải
+    tổng số sản phẩm khớp query.
+    """
+    recommender = get_recommender()
     if request.method == 'OPTIONS':
         return '', 200
     
     try:
-        data = request.get_json()
-        query = data.get('query', '').strip()
-        email = data.get('email', '').strip().lower()
-        limit = data.get('limit', 20)
+        with span('parse'):
+            data = request.get_json()
+            query = data.get('query', '').strip()
+            email = data.get('email', '').strip().lower()
+            cursor = data.get('cursor')
+            fields = request_product_fields(data)
+            with_facets = bool(data.get('facets'))
+            facet_filters = parse_facet_filters(data.get('facet_filters'))
         
-        if not query:
+        if not query and not cursor:
             return jsonify({
                 'success': False,
                 'message': 'Vui lòng nhập từ khóa tìm kiếm'
             }), 400
-        
-        print(f"🔍 Search request: query='{query}', email='{email}', limit={limit}")
+        try:
+            limit = parse_limit(data.get('limit'), 20)
+        except ValueError:
+            return jsonify({
+                'success': False,
+                'message': 'limit phải là số nguyên'
+            }), 400
         
         # Kiểm tra recommender
         if recommender is None:
-            print("Recommender is None")
+            LOG.warning('search_unavailable', reason='recommender not initialized')
             return jsonify({
                 'success': False,
                 'error': 'Recommender not initialized'
             }), 500
         
-        if PRODUCTS_DF.empty:
-            print("PRODUCTS_DF is empty")
+        if len(recommender.store) == 0:
+            LOG.warning('search_unavailable', reason='product store is empty')
             return jsonify({
                 'success': False,
                 'error': 'No products data available'
             }), 500
         
-        # Lưu lịch sử tìm kiếm
-        search_history_data = None
-        if email:
-            # Update in-memory history
-            USER_SEARCH_HISTORY[email].append(query)
-            USER_SEARCH_HISTORY[email] = USER_SEARCH_HISTORY[email][-20:]
+        if cursor:
+            # Trang tiếp theo: cắt ranking đã lưu, không chấm điểm lại
+            decoded = decode_cursor(str(cursor))
+            ranking = SEARCH_RESULTS.get(recommender.catalog_version, decoded[0]) if decoded else None
+            if ranking is None:
+                return jsonify({
+                    'success': False,
+                    'status': 'expired',
+                    'message': 'Kết quả tìm kiếm đã hết hạn, vui lòng tìm kiếm lại'
+                }), 410
+            handle, offset = decoded
+        else:
+            # Lưu lịch sử tìm kiếm
+            if email:
+                with span('history_write'):
+                    USER_STORE.record_search(email, query)
+                    USER_VECTORS.record_search(email, recommender, query)
             
-            # Prepare for file saving
-            search_history_data = {
-                'email': email,
-                'query': query,
-                'timestamp': datetime.now().isoformat(),
-                'results_count': 0
-            }
+            # Tìm kiếm sản phẩm (chấm điểm một lần cho mọi trang)
+            handle, ranking = search_result_handle(recommender, query, max(SEARCH_RESULT_DEPTH, limit),
+                                                   facet_filters, with_facets)
+            offset = 0
         
-        # Tìm kiếm sản phẩm
-        print(f"🔍 Executing search for: '{query}'")
-        results = recommender.search_products(query, limit)
+        all_rows, all_scores, query, facets = ranking
+        rows, scores = all_rows[offset:offset + limit], all_scores[offset:offset + limit]
+        next_offset = offset + len(rows)
         
-        # Cập nhật results count trong history
-        if search_history_data:
-            search_history_data['results_count'] = len(results)
+        if email and not cursor:
             try:
-                save_search_history(search_history_data)
+                with span('history_write'):
+                    save_search_history({
+                        'email': email,
+                        'query': query,
+                        'timestamp': datetime.now().isoformat(),
+                        'results_count': len(rows)
+                    })
             except Exception as e:
-                print(f"Could not save search history: {e}")
+                LOG.error('search_history_error', error=str(e))
         
-        print(f"Search completed. Found {len(results)} products")
+        POPULARITY.record_many(recommender.store.ids[rows].tolist(), SEARCH_RESULT_EVENT_WEIGHT)
         
-        return jsonify({
+        with span('materialize'):
+            products_json = recommender.store.dumps(rows, relevance=scores, match_score=scores, fields=fields)
+        payload = {
             'success': True,
             'status': 'success',
             'query': query,
-            'count': len(results),
-            'products': results
-        })
+            'count': len(rows),
+            'ranked': len(all_rows),
+            'ranked_capped': len(all_rows) >= SEARCH_RESULT_DEPTH,
+            'offset': offset,
+            'next_cursor': encode_cursor(handle, next_offset) if next_offset < len(all_rows) else None
+        }
+        corrected_query = recommender.correct_query(query)
+        if corrected_query != query.lower():
+            payload['corrected_query'] = corrected_query
+        if facets is not None:
+            payload['facets'] = facets
+        with span('serialize'):
+            response = products_json_response(payload, 'products', products_json)
+        LOG.info('search', query=query, user=user_ref(email), limit=limit, offset=offset, results=len(rows))
+        return response
             
     except Exception as e:
-        print(f"Search error: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        LOG.error('search_error', error=str(e), exc_info=True)
+        return jsonify({
+            'success': False,
+            'status': 'error',
+            'message': f'Lỗi tìm kiếm: {str(e)}'
+        }), 500
+
+@app.route('/api/products/search/batch', methods=['POST', 'OPTIONS'])
+def search_products_batch():
+    """API tìm kiếm nhiều query trong một request (không ghi lịch sử tìm kiếm)"""
+    recommender = get_recommender()
+    if request.method == 'OPTIONS':
+        return '', 200
+    
+    try:
+        data = request.get_json() or {}
+        queries = [str(query).strip() for query in data.get('queries', [])]
+        try:
+            limit = parse_limit(data.get('limit'), 20)
+        except ValueError:
+            return jsonify({
+                'success': False,
+                'message': 'limit phải là số nguyên'
+            }), 400
+        fields = request_product_fields(data)
+        
+        if not queries or not all(queries):
+            return jsonify({
+                'success': False,
+                'message': 'Vui lòng nhập từ khóa tìm kiếm'
+            }), 400
+        
+        if len(queries) > MAX_BATCH_QUERIES:
+            return jsonify({
+                'success': False,
+                'message': f'Tối đa {MAX_BATCH_QUERIES} query mỗi request'
+            }), 400
+        
+        if recommender is None:
+            return jsonify({
+                'success': False,
+                'error': 'Recommender not initialized'
+            }), 500
+        
+        results = recommender.search_many(queries, limit)
+        
+        # Ghép JSON từ các fragment có sẵn của ProductStore
+        parts = []
+        with span('materialize'):
+            for query, (rows, scores) in zip(queries, results):
+                header = json_dumps({'query': query, 'count': len(rows)})[:-1]
+                products_json = recommender.store.dumps(rows, relevance=scores, match_score=scores, fields=fields)
+                parts.append(f'{header}, "products": {products_json}}}')
+        
+        with span('serialize'):
+            return products_json_response({
+                'success': True,
+                'status': 'success',
+                'count': len(queries)
+            }, 'results', '[' + ', '.join(parts) + ']')
+    
+    except Exception as e:
+        LOG.error('batch_search_error', error=str(e), exc_info=True)
         return jsonify({
             'success': False,
             'status': 'error',
             'message': f'Lỗi tìm kiếm: {str(e)}'
         }), 500
 
+@app.route('/api/products/suggest', methods=['GET', 'OPTIONS'])
+def suggest_products():
+    """Gợi ý khi gõ: tên sản phẩm, category, health goal và query phổ biến theo prefix"""
+    recommender = get_recommender()
+    if request.method == 'OPTIONS':
+        return '', 200
+    
+    try:
+        query = request.args.get('q', '').strip()
+        limit = request.args.get('limit', 8, type=int)
+        
+        index = get_suggest_index(recommender) if query else None
+        suggestions = index.complete(query, limit) if index is not None else []
+        
+        return jsonify({
+            "status": "success",
+            "query": query,
+            "count": len(suggestions),
+            "suggestions": suggestions
+        })
+    
+    except Exception as e:
+        LOG.error('suggest_error', error=str(e))
+        return jsonify({"message": f"Lỗi: {str(e)}"}), 500
+
 @app.route('/api/products/personalized', methods=['POST', 'OPTIONS'])
 def get_personalized_recommendations():
     """Gợi ý sản phẩm cá nhân hóa"""
+    recommender = get_recommender()
     if request.method == 'OPTIONS':
         return '', 200
     
     try:
         data = request.json
         email = data.get('email', '').strip().lower()
-        limit = data.get('limit', 10)
+        fields = request_product_fields(data)
         
         if not email:
             return jsonify({"message": "Vui lòng đăng nhập"}), 401
+        try:
+            limit = parse_limit(data.get('limit'), 10)
+        except ValueError:
+            return jsonify({"message": "limit phải là số nguyên"}), 400
         
-        user = USERS.get(email)
+        user = USER_STORE.get_account(email)
         if not user:
             return jsonify({"message": "User không tồn tại"}), 404
         
-        print(f"🎯 Getting personalized recommendations for: {email}")
-        
         # Lấy thông tin
         user_profile = user.get('profile')
-        view_history = USER_VIEW_HISTORY.get(email, [])
-        search_history = USER_SEARCH_HISTORY.get(email, [])
-        
-        print(f"   - Has profile: {user_profile is not None}")
-        print(f"   - View history: {len(view_history)} products")
-        print(f"   - Search history: {len(search_history)} queries")
+        view_history, search_history = USER_STORE.history(email)
         
         # Lấy recommendations
+        with span('vectorize'):
+            user_vector = USER_VECTORS.get(email, recommender, user_profile, view_history, search_history)
         recommendations = recommender.get_personalized_recommendations(
-            user_profile, view_history, search_history, limit
+            user_profile, view_history, search_history, limit, user_vector=user_vector
         )
         
-        print(f"Generated {len(recommendations)} recommendations")
+        LOG.info('personalized', user=user_ref(email), has_profile=user_profile is not None,
+                 views=len(view_history), searches=len(search_history), results=len(recommendations))
         
         return jsonify({
             "status": "success",
             "count": len(recommendations),
-            "recommendations": recommendations,
+            "recommendations": [fields.project(product) for product in recommendations],
             "based_on": {
                 "has_profile": user_profile is not None,
                 "view_history_count": len(view_history),
@@ -588,51 +4285,41 @@ def get_personalized_recommendations():
         })
         
     except Exception as e:
-        print(f"Personalized error: {e}")
+        LOG.error('personalized_error', error=str(e))
         return jsonify({"message": f"Lỗi gợi ý: {str(e)}"}), 500
 
 @app.route('/api/products/landing', methods=['GET', 'OPTIONS'])
 def get_landing_page_data():
     """Lấy dữ liệu cho trang chủ"""
+    recommender = get_recommender()
     if request.method == 'OPTIONS':
         return '', 200
     
     try:
-        print(" Getting landing page data")
-        
-        # 1. Danh mục nổi bật
-        categories = recommender.get_categories(4) if recommender else []
-        
-        # 2. Sản phẩm phổ biến
-        popular_products = recommender.get_popular_products(8) if recommender else []
-        
-        # 3. Danh sách sản phẩm gợi ý chung
-        general_recommendations = recommender.get_popular_products(6) if recommender else []
-        
-        print(f"Landing page data: {len(categories)} categories, {len(popular_products)} popular products")
+        if recommender is None or len(recommender.store) == 0:
+            return jsonify({
+                "status": "success",
+                "categories": [],
+                "popular_products": [],
+                "general_recommendations": [],
+                "total_products": 0
+            })
         
-        return jsonify({
-            "status": "success",
-            "categories": categories,
-            "popular_products": popular_products,
-            "general_recommendations": general_recommendations,
-            "total_products": len(PRODUCTS_DF) if PRODUCTS_DF is not None else 0
-        })
+        # Danh mục nổi bật, sản phẩm phổ biến và gợi ý chung đều tính sẵn trong snapshot
+        return precomputed_json_response(get_popular_snapshot(recommender).landing, LANDING_MAX_AGE)
         
     except Exception as e:
-        print(f"Landing page error: {e}")
+        LOG.error('landing_error', error=str(e))
         return jsonify({"message": f"Lỗi: {str(e)}"}), 500
 
 @app.route('/api/products/<int:product_id>', methods=['GET', 'OPTIONS'])
 def get_product_detail(product_id):
     """Lấy chi tiết sản phẩm"""
+    recommender = get_recommender()
     if request.method == 'OPTIONS':
-        print(f"OPTIONS request for product {product_id}")
         return '', 200
     
     try:
-        print(f"Getting product detail for ID: {product_id}")
-        
         if recommender is None:
             return jsonify({
                 "status": "error",
@@ -647,16 +4334,13 @@ def get_product_detail(product_id):
                 "message": f"Sản phẩm ID {product_id} không tồn tại"
             }), 404
         
-        print(f"Found product: {product.get('name', 'Unknown')}")
         return jsonify({
             "status": "success",
-            "product": product
+            "product": request_product_fields().project(product)
         })
         
     except Exception as e:
-        print(f"Product detail error: {e}")
-        import traceback
-        traceback.print_exc()
+        LOG.error('product_detail_error', product_id=product_id, error=str(e), exc_info=True)
         return jsonify({
             "status": "error",
             "message": f"Lỗi server: {str(e)}"
@@ -665,6 +4349,7 @@ def get_product_detail(product_id):
 @app.route('/api/products/view', methods=['POST', 'OPTIONS'])
 def track_product_view():
     """Lưu lịch sử xem sản phẩm"""
+    recommender = get_recommender()
     if request.method == 'OPTIONS':
         return '', 200
     
@@ -678,29 +4363,35 @@ def track_product_view():
         
         if not product_id:
             return jsonify({"message": "Thiếu product_id"}), 400
-        
-        print(f"Tracking view: {email} viewed product {product_id}")
+        try:
+            product_id = int(product_id)
+        except (TypeError, ValueError):
+            return jsonify({"message": "product_id không hợp lệ"}), 400
+        if not -2 ** 63 <= product_id < 2 ** 63:
+            return jsonify({"message": "product_id không hợp lệ"}), 400
         
         # Thêm vào lịch sử xem (không trùng)
-        if product_id not in USER_VIEW_HISTORY[email]:
-            USER_VIEW_HISTORY[email].append(product_id)
-            USER_VIEW_HISTORY[email] = USER_VIEW_HISTORY[email][-50:]
+        added, view_count = USER_STORE.record_view(email, product_id)
+        if added and recommender is not None:
+            USER_VECTORS.record_view(email, recommender, product_id)
+        POPULARITY.record(product_id, VIEW_EVENT_WEIGHT)
         
-        print(f"   View history for {email}: {len(USER_VIEW_HISTORY[email])} products")
+        LOG.info('view', user=user_ref(email), product_id=product_id, view_count=view_count)
         
         return jsonify({
             "status": "success",
             "message": "Đã lưu lịch sử xem",
-            "view_count": len(USER_VIEW_HISTORY[email])
+            "view_count": view_count
         })
         
     except Exception as e:
-        print(f"Track view error: {e}")
+        LOG.error('track_view_error', error=str(e))
         return jsonify({"message": f"Lỗi: {str(e)}"}), 500
 
 @app.route('/api/products/view-history', methods=['POST', 'OPTIONS'])
 def get_view_history():
     """Lấy lịch sử xem sản phẩm"""
+    recommender = get_recommender()
     if request.method == 'OPTIONS':
         return '', 200
     
@@ -711,63 +4402,54 @@ def get_view_history():
         if not email:
             return jsonify({"message": "Vui lòng đăng nhập"}), 401
         
-        print(f"Getting view history for: {email}")
-        
-        view_history_ids = USER_VIEW_HISTORY.get(email, [])
+        view_history_ids, _ = USER_STORE.history(email)
+        fields = request_product_fields(data)
         
         # Lấy thông tin sản phẩm
-        viewed_products = []
-        for product_id in view_history_ids[::-1]:
-            product = recommender.get_product_by_id(product_id) if recommender else None
-            if product:
-                viewed_products.append(product)
-        
-        print(f"Found {len(viewed_products)} viewed products")
+        viewed_products = recommender.get_products_by_ids(view_history_ids[::-1]) if recommender else []
         
         return jsonify({
             "status": "success",
             "count": len(viewed_products),
-            "products": viewed_products
+            "products": [fields.project(product) for product in viewed_products]
         })
         
     except Exception as e:
-        print(f"View history error: {e}")
+        LOG.error('view_history_error', error=str(e))
         return jsonify({"message": f"Lỗi: {str(e)}"}), 500
 
 @app.route('/api/products/similar/<int:product_id>', methods=['GET', 'OPTIONS'])
 def get_similar_products(product_id):
     """Lấy sản phẩm tương tự"""
+    recommender = get_recommender()
     if request.method == 'OPTIONS':
         return '', 200
     
     try:
-        print(f"Getting similar products for: {product_id}")
-        
         if recommender is None:
             return jsonify({
                 "status": "error",
                 "message": "Recommender not initialized"
             }), 500
         
-        product = recommender.get_product_by_id(product_id)
-        if not product:
+        row = recommender.get_row_by_id(product_id)
+        if row is None:
             return jsonify({"message": "Sản phẩm không tồn tại"}), 404
         
-        # Sử dụng category để tìm sản phẩm tương tự
-        category = product.get('category', '')
-        if category:
-            same_category = recommender.df[recommender.df['category'] == category]
-            same_category = same_category[same_category['id'] != product_id]
-            
-            similar = same_category.sample(min(5, len(same_category))).to_dict('records')
-            
-            print(f"Found {len(similar)} similar products")
+        # mode=category (mặc định): chỉ trong cùng category, mode=global: toàn catalog
+        limit = request.args.get('limit', 5, type=int)
+        same_category = request.args.get('mode', 'category') != 'global'
+        
+        store = recommender.store
+        category = store.records[row].get('category', '')
+        if category or not same_category:
+            similar, scores = recommender.get_similar_rows(row, limit, same_category)
             
-            return jsonify({
+            return products_json_response({
                 "status": "success",
-                "count": len(similar),
-                "similar_products": similar
-            })
+                "count": len(similar)
+            }, "similar_products", store.dumps(similar, relevance=scores, match_score=scores,
+                                               fields=request_product_fields()))
         else:
             return jsonify({
                 "status": "success",
@@ -776,75 +4458,153 @@ def get_similar_products(product_id):
             })
         
     except Exception as e:
-        print(f"Similar products error: {e}")
+        LOG.error('similar_products_error', product_id=product_id, error=str(e))
         return jsonify({"message": f"Lỗi: {str(e)}"}), 500
 
 @app.route('/api/products/categories', methods=['GET', 'OPTIONS'])
 def get_all_categories():
     """Lấy tất cả danh mục"""
+    recommender = get_recommender()
     if request.method == 'OPTIONS':
         return '', 200
     
     try:
-        if PRODUCTS_DF is None or len(PRODUCTS_DF) == 0:
+        if recommender is None or len(recommender.store) == 0:
             return jsonify({"categories": []})
         
-        categories = PRODUCTS_DF['category'].unique().tolist()
-        return jsonify({
-            "status": "success",
-            "count": len(categories),
-            "categories": categories
-        })
+        return precomputed_json_response(catalog_response(recommender, 'categories'), CATALOG_MAX_AGE)
         
     except Exception as e:
-        print(f"Categories error: {e}")
+        LOG.error('categories_error', error=str(e))
         return jsonify({"message": f"Lỗi: {str(e)}"}), 500
 
+# ==================== ADMIN APIs ====================
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN', '')
+
+def admin_unauthorized():
+    """Response lỗi nếu request không có admin token hợp lệ (Authorization: Bearer hoặc X-Admin-Token), ngược lại None.
+
+    Không đặt ADMIN_TOKEN thì mọi admin endpoint bị tắt.
+    """
+    if not ADMIN_TOKEN:
+        return jsonify({"message": "Admin API chưa được bật (đặt ADMIN_TOKEN)"}), 403
+    header = request.headers.get('Authorization', '')
+    token = header[len('Bearer '):] if header.startswith('Bearer ') else request.headers.get('X-Admin-Token', '')
+    if not hmac.compare_digest(token.encode('utf-8'), ADMIN_TOKEN.encode('utf-8')):
+        return jsonify({"message": "Admin token không hợp lệ"}), 401
+    return None
+
+def parse_bool(value, default):
+    """Giá trị bool của request: true/false hoặc "true"/"false"/"1"/"0"; ValueError nếu không hợp lệ"""
+    if value is None:
+        return default
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in ('true', '1', 'yes'):
+        return True
+    if text in ('false', '0', 'no'):
+        return False
+    raise ValueError(f'invalid boolean: {value!r}')
+
+@app.route('/admin/reload', methods=['GET', 'POST'])
+def reload_catalog_api():
+    """Reload catalog ở background (POST) hoặc xem trạng thái reload (GET)"""
+    unauthorized = admin_unauthorized()
+    if unauthorized:
+        return unauthorized
+    if request.method == 'GET':
+        return jsonify({"status": "success", "reload": RELOAD_STATE})
+    
+    data = request.get_json(silent=True) or {}
+    try:
+        incremental = parse_bool(data.get('incremental', request.args.get('incremental')), True)
+    except ValueError:
+        return jsonify({"message": "incremental phải là true hoặc false"}), 400
+    started = start_catalog_reload(incremental=incremental)
+    
+    return jsonify({
+        "status": "accepted" if started else "busy",
+        "reload": RELOAD_STATE
+    }), 202 if started else 409
+
 # ==================== HEALTH CHECK ====================
 @app.route('/health', methods=['GET'])
 def health_check():
     """Kiểm tra tình trạng server"""
+    recommender = get_recommender()
     return jsonify({
         "status": "healthy",
         "timestamp": datetime.now().isoformat(),
         "data": {
-            "products_loaded": len(PRODUCTS_DF) if PRODUCTS_DF is not None else 0,
-            "users_count": len(USERS),
-            "categories_count": len(PRODUCTS_DF['category'].unique()) if PRODUCTS_DF is not None else 0,
+            "products_loaded": len(recommender.store) if recommender else 0,
+            "users_count": len(USER_STORE),
+            "categories_count": len(recommender.store.categories) if recommender else 0,
+            "catalog_version": recommender.catalog_version if recommender else None,
             "recommender_initialized": recommender is not None
-        }
+        },
+        "cache": QUERY_CACHE.stats(),
+        "search_results": SEARCH_RESULTS.stats(),
+        "scoring_pool": SCORING_POOL.stats(),
+        "popularity": POPULARITY.stats(),
+        "user_state": USER_STORE.stats()
     })
 
+METRICS.gauge('query_cache_hits_total', 'Số lần trúng query cache', lambda: QUERY_CACHE.hits, 'counter')
+METRICS.gauge('query_cache_misses_total', 'Số lần trượt query cache', lambda: QUERY_CACHE.misses, 'counter')
+METRICS.gauge('query_cache_size', 'Số entry trong query cache', lambda: len(QUERY_CACHE._data))
+METRICS.gauge('search_result_handles', 'Số ranking đang giữ cho phân trang', lambda: len(SEARCH_RESULTS._data))
+METRICS.gauge('user_state_cached_users', 'Số user đang giữ trong RAM', lambda: USER_STORE.stats()['cached_users'])
+METRICS.gauge('user_state_cached_bytes', 'Ước lượng byte trạng thái user trong RAM', lambda: USER_STORE.stats()['cached_bytes'])
+METRICS.gauge('popularity_events_total', 'Số sự kiện xem/tìm kiếm đã ghi nhận',
+              lambda: POPULARITY.stats()['events'], 'counter')
+METRICS.gauge('search_history_dropped_total', 'Số record lịch sử tìm kiếm bị bỏ do hàng đợi đầy',
+              lambda: SEARCH_HISTORY_LOG.dropped, 'counter')
+METRICS.gauge('log_sampled_out_total', 'Số dòng log debug/info bị bỏ do lấy mẫu', lambda: LOG.sampled_out, 'counter')
+METRICS.gauge('products_loaded', 'Số sản phẩm trong catalog',
+              lambda: len(recommender.store) if (recommender := get_recommender()) is not None else None)
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Metrics dạng Prometheus text"""
+    return app.response_class(METRICS.expose(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/debug/users', methods=['GET'])
 def debug_users():
     """Debug endpoint - xem users"""
+    users = list(USER_STORE.iter_users())
     return jsonify({
-        "users": {email: {"name": user["name"], "has_profile": user["profile"] is not None} 
-                 for email, user in USERS.items()},
-        "view_history_counts": {email: len(views) for email, views in USER_VIEW_HISTORY.items()},
-        "search_history_counts": {email: len(searches) for email, searches in USER_SEARCH_HISTORY.items()}
+        "users": {email: {"name": user["name"], "has_profile": user["profile"] is not None}
+                 for email, user, _, _ in users if user is not None},
+        "view_history_counts": {email: views for email, _, views, _ in users if views},
+        "search_history_counts": {email: searches for email, _, _, searches in users if searches}
     })
 
 @app.route('/debug/data', methods=['GET'])
 def debug_data():
     """Debug endpoint để kiểm tra dữ liệu"""
-    if PRODUCTS_DF is None:
-        return jsonify({"message": "PRODUCTS_DF is None"})
+    recommender = get_recommender()
+    if recommender is None:
+        return jsonify({"message": "Recommender not initialized"})
     
-    # Lấy thông tin chi tiết
+    # Lấy thông tin chi tiết từ store (DataFrame không được giữ lại sau khi dựng)
+    store = recommender.store
+    ids = np.asarray(store.ids)
+    row_of_id_1 = store.row_of(1)
     info = {
-        "total_rows": len(PRODUCTS_DF),
-        "columns": PRODUCTS_DF.columns.tolist(),
+        "total_rows": len(store),
+        "columns": sorted(store.records[0]) if len(store) > 0 else [],
         "id_column_info": {
-            "dtype": str(PRODUCTS_DF['id'].dtype),
-            "min": int(PRODUCTS_DF['id'].min()) if len(PRODUCTS_DF) > 0 else None,
-            "max": int(PRODUCTS_DF['id'].max()) if len(PRODUCTS_DF) > 0 else None,
-            "unique_count": PRODUCTS_DF['id'].nunique(),
-            "sample_values": PRODUCTS_DF['id'].head(20).tolist()
+            "dtype": str(ids.dtype),
+            "min": int(ids.min()) if len(ids) > 0 else None,
+            "max": int(ids.max()) if len(ids) > 0 else None,
+            "unique_count": int(len(np.unique(ids))),
+            "sample_values": ids[:20].tolist()
         },
-        "has_id_1": 1 in PRODUCTS_DF['id'].values,
-        "row_with_id_1": PRODUCTS_DF[PRODUCTS_DF['id'] == 1].to_dict('records') if len(PRODUCTS_DF[PRODUCTS_DF['id'] == 1]) > 0 else [],
-        "recommender_status": "initialized" if recommender else "not initialized"
+        "has_id_1": row_of_id_1 is not None,
+        "row_with_id_1": [store.product(row) for row in np.flatnonzero(ids == 1).tolist()],
+        "loaded_from_artifact": recommender.artifact_dir is not None,
+        "recommender_status": "initialized"
     }
     
     return jsonify(info)
@@ -854,16 +4614,18 @@ if __name__ == '__main__':
     print("=" * 60)
     print("Healthcare Product Recommendation API")
     print("=" * 60)
-    print(f"Products loaded: {len(PRODUCTS_DF)}")
+    store = recommender.store if recommender else None
+    print(f"Products loaded: {len(store) if store else 0}")
     
-    if len(PRODUCTS_DF) > 0:
-        print(f" Categories: {len(PRODUCTS_DF['category'].unique())}")
+    if store:
+        print(f" Categories: {len(recommender.get_categories())}")
         print(f"Sample products:")
-        for i in range(min(3, len(PRODUCTS_DF))):
-            print(f"   {i+1}. {PRODUCTS_DF.iloc[i]['name']} ({PRODUCTS_DF.iloc[i]['category']})")
+        for i in range(min(3, len(store))):
+            print(f"   {i+1}. {store.records[i]['name']} ({store.records[i]['category']})")
     
     print(f"Server running on: http://localhost:5000")
     print("=" * 60)
+    warm_up()
     print("\n Available APIs:")
     print("  AUTH:")
     print("    POST /auth/signup")
@@ -871,6 +4633,8 @@ if __name__ == '__main__':
     print("    POST /user/profile")
     print("\n  PRODUCTS:")
     print("    POST /api/products/search")
+    print("    POST /api/products/search/batch")
+    print("    GET  /api/products/suggest?q=")
     print("    POST /api/products/personalized")
     print("    GET  /api/products/landing")
     print("    GET  /api/products/<id>")
@@ -880,6 +4644,8 @@ if __name__ == '__main__':
     print("    GET  /api/products/categories")
     print("\n  UTILITY:")
     print("    GET  /health")
+    print("    GET  /metrics")
+    print("    POST /admin/reload")
     print("    GET  /debug/users")
     print("    GET  /debug/data")
     
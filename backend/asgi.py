@@ -0,0 +1,137 @@
+"""ASGI entry point cho production (thay cho dev server của `python app.py`).
+
+Đây không phải serving bất đồng bộ: app vẫn là Flask (WSGI). Event loop
+của uvicorn giữ kết nối, keep-alive và đọc body (body được đọc hết trước khi
+gọi route); các route Flask chạy trong thread pool (ASGI_THREADS), trừ các
+route rẻ trả dữ liệu tính sẵn (ASGI_INLINE_PATHS: landing, suggest,
+categories, health) chạy luôn trên event loop. Phần chấm điểm chạy trên
+chính thread của route, hoặc trong process worker nếu SCORING_POOL=process.
+
+Chạy từ thư mục backend:
+    pip install uvicorn
+    SCORING_POOL=process SCORING_WORKERS=4 uvicorn asgi:application --host 0.0.0.0 --port 5000
+
+Biến môi trường:
+    SCORING_POOL     none (mặc định) | process | thread (process: worker chạy bằng forkserver và
+                     tự load model, nên chạy build_model.py trước để chỉ phải memory-map artifact)
+    SCORING_WORKERS  số worker của pool (mặc định: số CPU)
+    SCORING_TIMEOUT  giây chờ tối đa cho một lệnh chấm điểm (mặc định 30)
+    ASGI_THREADS     số thread chạy các route Flask (mặc định 32)
+    ASGI_INLINE_PATHS  các path (phân cách bằng dấu phẩy) chạy trên event loop
+"""
+import asyncio
+import io
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from app import app, warm_up
+
+
+class WSGIAdapter:
+    """Bọc WSGI app thành ASGI app: body được đọc trên event loop, route chạy trong thread pool"""
+
+    def __init__(self, wsgi_app, threads=32, inline_paths=(), on_startup=None):
+        self.wsgi_app = wsgi_app
+        self.executor = ThreadPoolExecutor(threads, thread_name_prefix='wsgi')
+        self.inline_paths = frozenset(inline_paths)
+        self.on_startup = on_startup
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+
+        body = []
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            body.append(message.get('body', b''))
+            more_body = message.get('more_body', False)
+
+        environ = self._environ(scope, b''.join(body))
+        if scope['path'] in self.inline_paths:
+            # Route chỉ trả dữ liệu tính sẵn: không đáng một lần chuyển thread
+            status, headers, content = self._run(environ)
+        else:
+            loop = asyncio.get_running_loop()
+            status, headers, content = await loop.run_in_executor(self.executor, self._run, environ)
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': content})
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                if self.on_startup is not None:
+                    self.on_startup()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    @staticmethod
+    def _environ(scope, body):
+        server = scope.get('server') or ('localhost', 80)
+        client = scope.get('client') or ('', 0)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+            'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1] or 80),
+            'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+            'REMOTE_ADDR': client[0],
+            'REMOTE_PORT': str(client[1]),
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+        }
+        for name, value in scope.get('headers', []):
+            name = name.decode('latin-1').upper().replace('-', '_')
+            value = value.decode('latin-1')
+            if name == 'CONTENT_TYPE':
+                environ['CONTENT_TYPE'] = value
+            elif name != 'CONTENT_LENGTH':
+                key = f'HTTP_{name}'
+                environ[key] = f'{environ[key]},{value}' if key in environ else value
+        return environ
+
+    def _run(self, environ):
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = [
+                (name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers
+            ]
+
+        result = self.wsgi_app(environ, start_response)
+        try:
+            content = b''.join(result)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        return response['status'], response['headers'], content
+
+
+INLINE_PATHS = ('/api/products/landing', '/api/products/suggest', '/api/products/categories', '/health')
+
+application = WSGIAdapter(
+    app,
+    threads=int(os.environ.get('ASGI_THREADS', 32)),
+    inline_paths=[path for path in os.environ.get('ASGI_INLINE_PATHS', ','.join(INLINE_PATHS)).split(',') if path],
+    # Suggest index dựng ở background khi khởi động: /suggest chạy trên event loop, không được chờ dựng index
+    on_startup=warm_up,
+)
@@ -0,0 +1,98 @@
+"""Benchmark analyzer cho TF-IDF: tốc độ index, kích thước vocabulary/ma trận và độ liên quan.
+
+Độ liên quan được kiểm tra trên một bộ query cố định (có dấu và không dấu)
+với các sản phẩm liên quan đã gán tay trong healthcare_data.csv. Script trả
+về exit code 1 nếu analyzer tiếng Việt bỏ sót query nào trong top-k hoặc có
+recall trung bình thấp hơn analyzer mặc định.
+
+Chạy từ thư mục backend:
+    python benchmarks/bench_analyzer.py [--repeat 200]
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+
+import pandas as pd
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.chdir(BACKEND_DIR)
+
+from app import TEXT_ANALYZERS, ProductRecommender, VietnameseAnalyzer, load_healthcare_data  # noqa: E402
+
+# (query, id các sản phẩm liên quan)
+RELEVANCE_QUERIES = [
+    ('mất ngủ', {3, 7, 14, 19, 30}),
+    ('mat ngu', {3, 7, 14, 19, 30}),
+    ('mệt mỏi mãn tính', {1, 6, 24}),
+    ('met moi man tinh', {1, 6, 24}),
+    ('đau khớp', {5, 10, 22, 29}),
+    ('rung toc', {5, 8, 9, 15, 16, 23}),
+    ('tăng đề kháng', {1, 4}),
+    ('giai doc gan', {12, 27, 28}),
+    ('tim mạch', {2, 11}),
+    ('loang xuong', {5, 8, 17}),
+    ('trí nhớ', {2, 6, 18, 21}),
+    ('tieu hoa kem', {4, 16}),
+]
+
+
+def index_throughput(analyzer_name, documents, repeat=3):
+    """Số document/giây khi fit analyzer + TfidfVectorizer"""
+    best = float('inf')
+    for _ in range(repeat):
+        analyzer = TEXT_ANALYZERS[analyzer_name]()
+        start = time.perf_counter()
+        analyzer.fit(documents)
+        TfidfVectorizer(analyzer=analyzer).fit_transform(documents)
+        best = min(best, time.perf_counter() - start)
+    return len(documents) / best
+
+
+def relevance(recommender, k):
+    """(recall@k từng query, query không có sản phẩm liên quan nào trong top-k)"""
+    recalls = []
+    misses = []
+    for query, relevant in RELEVANCE_QUERIES:
+        rows, _ = recommender.search_rows(query, k)
+        found = {int(recommender.store.ids[row]) for row in rows} & relevant
+        recalls.append(len(found) / min(len(relevant), k))
+        if not found:
+            misses.append(query)
+    return recalls, misses
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', type=int, default=200, help='nhân bản catalog để đo tốc độ index')
+    parser.add_argument('--k', type=int, default=5)
+    args = parser.parse_args()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        products_df = load_healthcare_data()
+    documents = pd.concat([products_df['features']] * args.repeat, ignore_index=True)
+
+    results = {}
+    print(f"{'analyzer':>11} {'docs/s':>9} {'features':>9} {'nnz':>8} {'recall@k':>9} misses")
+    for name in TEXT_ANALYZERS:
+        docs_per_second = index_throughput(name, documents)
+        # Bỏ log của recommender để bảng kết quả dễ đọc
+        with contextlib.redirect_stdout(io.StringIO()):
+            recommender = ProductRecommender(products_df, analyzer=name, catalog_version=f'bench-{name}')
+            recalls, misses = relevance(recommender, args.k)
+        results[name] = (sum(recalls) / len(recalls), misses)
+        print(f"{name:>11} {docs_per_second:>9.0f} {recommender.feature_matrix.shape[1]:>9} "
+              f"{recommender.feature_matrix.nnz:>8} {results[name][0]:>9.3f} {misses}")
+
+    mean_recall, misses = results[VietnameseAnalyzer.name]
+    if misses or mean_recall < results['default'][0]:
+        print("Relevance regression in the vietnamese analyzer")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""Benchmark engine dense (LSA + IVF) so với inverted index (kết quả chính xác).
+
+Trên catalog giả lập (synthetic_catalog.py): thời gian build engine, latency
+p50/p99 mỗi query và recall@k của engine dense so với top-k chính xác, với
+nhiều giá trị nprobe. Dòng "all lists" duyệt mọi cụm: recall tối đa của phép
+chiếu LSA khi bỏ qua bước chọn cụm của IVF.
+
+Chạy từ thư mục backend:
+    python benchmarks/bench_dense.py --sizes 10000 100000 --nprobe 4 16 64
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import sys
+import time
+
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.chdir(BACKEND_DIR)
+
+with contextlib.redirect_stdout(io.StringIO()):
+    from app import DenseANNEngine, InvertedIndexEngine, VietnameseAnalyzer, load_healthcare_data  # noqa: E402
+from synthetic_catalog import load_vocabulary, write_catalog  # noqa: E402
+
+
+def fit_features(path):
+    """TF-IDF như ProductRecommender._fit_model (không dựng similarity index)"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        df = load_healthcare_data(path)
+    analyzer = VietnameseAnalyzer()
+    analyzer.fit(df['features'])
+    vectorizer = TfidfVectorizer(analyzer=analyzer)
+    return vectorizer, vectorizer.fit_transform(df['features'])
+
+
+def synthetic_queries(vocabulary, n_queries, seed=1):
+    """1-3 triệu chứng/mục tiêu ngẫu nhiên, một nửa viết không dấu"""
+    from app import fold_diacritics
+    rng = random.Random(seed)
+    phrases = vocabulary['symptoms'] + vocabulary['goals']
+    queries = []
+    for i in range(n_queries):
+        query = ' '.join(rng.sample(phrases, rng.randint(1, 3))).lower()
+        queries.append(fold_diacritics(query) if i % 2 else query)
+    return queries
+
+
+def run(engine, query_vectors, k):
+    results, samples = [], []
+    for vector in query_vectors:
+        start = time.perf_counter()
+        rows, _ = engine.search(vector, k)
+        samples.append(time.perf_counter() - start)
+        results.append(rows)
+    ms = np.asarray(samples) * 1000
+    return results, float(np.percentile(ms, 50)), float(np.percentile(ms, 99))
+
+
+def recall(results, exact):
+    values = [len(set(rows.tolist()) & set(truth.tolist())) / len(truth)
+              for rows, truth in zip(results, exact) if len(truth)]
+    return float(np.mean(values)) if values else 1.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--k', type=int, default=20)
+    parser.add_argument('--dimensions', type=int, default=256)
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[4, 16, 64])
+    parser.add_argument('--rerank', type=int, default=10)
+    args = parser.parse_args()
+
+    vocabulary = load_vocabulary()
+    queries = synthetic_queries(vocabulary, args.queries)
+    path = os.path.join('/tmp', 'bench_dense_catalog.csv')
+
+    print(f"{'products':>9} {'engine':>18} {'build s':>8} {'p50 ms':>8} {'p99 ms':>8} {f'recall@{args.k}':>10}")
+    for size in args.sizes:
+        write_catalog(size, path)
+        vectorizer, features = fit_features(path)
+        query_vectors = [vectorizer.transform([query]) for query in queries]
+
+        start = time.perf_counter()
+        exact_engine = InvertedIndexEngine(features)
+        build = time.perf_counter() - start
+        exact, p50, p99 = run(exact_engine, query_vectors, args.k)
+        print(f"{size:>9} {'inverted (exact)':>18} {build:>8.2f} {p50:>8.3f} {p99:>8.3f} {1.0:>10.3f}")
+
+        start = time.perf_counter()
+        dense = DenseANNEngine(features, dimensions=args.dimensions, rerank=args.rerank)
+        build = time.perf_counter() - start
+        for nprobe in args.nprobe + [len(dense.centroids)]:
+            dense.nprobe = nprobe
+            results, p50, p99 = run(dense, query_vectors, args.k)
+            label = 'dense all lists' if nprobe == len(dense.centroids) else f'dense nprobe={nprobe}'
+            print(f"{size:>9} {label:>18} {build:>8.2f} {p50:>8.3f} {p99:>8.3f} {recall(results, exact):>10.3f}")
+        print(f"{'':>9} ({features.shape[1]} features, {dense.embeddings.shape[1]} dims, "
+              f"{len(dense.centroids)} lists)")
+        sys.stdout.flush()
+    os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""Benchmark đếm facet bằng bitset (FacetIndex) so với groupby của pandas.
+
+Trên catalog giả lập (synthetic_catalog.py): thời gian dựng FacetIndex, thời
+gian lấy tập khớp đầy đủ của query (engine.match) và thời gian đếm bốn facet
+cho tập đó: bằng bitset (có và không có facet filter) và bằng pandas
+value_counts/explode trên cùng tập dòng. Số đếm của hai cách được so khớp.
+
+Chạy từ thư mục backend:
+    python benchmarks/bench_facets.py --sizes 10000 100000
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_dense import fit_features, synthetic_queries  # noqa: E402
+from synthetic_catalog import load_vocabulary, write_catalog  # noqa: E402
+from app import FacetIndex, InvertedIndexEngine, ProductStore, load_healthcare_data  # noqa: E402
+
+
+def pandas_counts(df, rows):
+    """Đếm category, target_gender và tag health_goal bằng pandas (cách làm không có index)"""
+    subset = df.iloc[rows]
+    goals = subset['health_goal'].str.split(',').explode().str.strip()
+    return {
+        'category': subset['category'].value_counts().to_dict(),
+        'target_gender': subset['target_gender'].value_counts().to_dict(),
+        'health_goal': goals[goals != ''].value_counts().to_dict(),
+    }
+
+
+def percentiles_us(samples):
+    us = np.asarray(samples) * 1e6
+    return np.percentile(us, 50), np.percentile(us, 99)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--queries', type=int, default=200)
+    args = parser.parse_args()
+
+    queries = synthetic_queries(load_vocabulary(), args.queries)
+    path = os.path.join('/tmp', 'bench_facets_catalog.csv')
+    print(f"{'products':>9} {'build ms':>9} {'matches':>8} {'match p50 us':>13} {'bitset p50 us':>14} "
+          f"{'p99 us':>8} {'filtered p50 us':>16} {'pandas p50 us':>14}")
+    for size in args.sizes:
+        write_catalog(size, path)
+        vectorizer, features = fit_features(path)
+        with contextlib.redirect_stdout(io.StringIO()):
+            df = load_healthcare_data(path)
+        store = ProductStore(df)
+        engine = InvertedIndexEngine(features)
+
+        start = time.perf_counter()
+        facets = FacetIndex(store)
+        build_ms = (time.perf_counter() - start) * 1000
+        category_filter = (('category', (str(store.categories[0]).lower(),)),)
+
+        match_times, bitset_times, filtered_times, pandas_times, matches = [], [], [], [], []
+        for query in queries:
+            query_vector = vectorizer.transform([query])
+            start = time.perf_counter()
+            rows, _ = engine.match(query_vector)
+            match_times.append(time.perf_counter() - start)
+            matches.append(len(rows))
+
+            start = time.perf_counter()
+            counts = facets.counts(facets.match_bits(rows), limit=10 ** 6)
+            bitset_times.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            facets.counts(facets.match_bits(rows), category_filter)
+            filtered_times.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            expected = pandas_counts(df, rows)
+            pandas_times.append(time.perf_counter() - start)
+
+            for name, values in expected.items():
+                got = {item['value']: item['count'] for item in counts[name]}
+                assert got == values, f'{name} counts differ for {query!r}'
+
+        match_p50, _ = percentiles_us(match_times)
+        bitset_p50, bitset_p99 = percentiles_us(bitset_times)
+        filtered_p50, _ = percentiles_us(filtered_times)
+        pandas_p50, _ = percentiles_us(pandas_times)
+        print(f"{size:>9} {build_ms:>9.1f} {int(np.median(matches)):>8} {match_p50:>13.1f} {bitset_p50:>14.1f} "
+              f"{bitset_p99:>8.1f} {filtered_p50:>16.1f} {pandas_p50:>14.1f}")
+        sys.stdout.flush()
+    os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,281 @@
+"""Benchmark ProductRecommender và các route Flask trên catalog giả lập.
+
+Với mỗi kích thước catalog (sinh bằng synthetic_catalog.py): thời gian fit,
+micro-benchmark từng method (cache kết quả bị xóa trước mỗi lần gọi để đo
+đường tính toán thật) và một kịch bản HTTP trộn nhiều endpoint qua Flask
+test client. Kết quả ghi ra JSON để so sánh giữa các lần chạy.
+
+Chạy từ thư mục backend:
+    python benchmarks/bench_recommender.py --sizes 10000 100000 --json bench.json
+    python benchmarks/bench_recommender.py --sizes 10000 --compare bench.json   # exit 1 nếu chậm hơn
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.chdir(BACKEND_DIR)
+os.environ.setdefault('LOG_LEVEL', 'warning')
+# fit_seconds gồm cả similarity index như artifact của build_model.py
+os.environ.setdefault('SIMILARITY_BUILD', 'eager')
+
+with contextlib.redirect_stdout(io.StringIO()):
+    import app as app_module  # noqa: E402
+from synthetic_catalog import load_vocabulary, write_catalog  # noqa: E402
+
+QUERIES = ['mất ngủ', 'mat ngu', 'đau khớp', 'tăng đề kháng', 'rụng tóc', 'giải độc gan', 'tim mạch',
+           'loãng xương', 'trí nhớ', 'tiêu hóa kém', 'mệt mỏi mãn tính', 'vitamin', 'omega 3 cholesterol']
+PREFIXES = ['ta', 'gi', 'vit', 'mat', 'đau', 'tim']
+
+# (tên, trọng số) của kịch bản HTTP
+SCENARIO = [
+    ('search', 30), ('product', 20), ('view', 15), ('personalized', 10),
+    ('similar', 10), ('suggest', 8), ('landing', 5), ('categories', 2),
+]
+
+
+def summarize(samples):
+    """mean/p50/p99/max (ms) của danh sách thời gian (giây)"""
+    ms = np.asarray(samples) * 1000
+    return {
+        'n': len(ms),
+        'mean_ms': round(float(ms.mean()), 4),
+        'p50_ms': round(float(np.percentile(ms, 50)), 4),
+        'p99_ms': round(float(np.percentile(ms, 99)), 4),
+        'max_ms': round(float(ms.max()), 4),
+    }
+
+
+def timed(fn, iterations, make_args, clear_cache=True):
+    samples = []
+    for i in range(iterations):
+        args = make_args(i)
+        if clear_cache:
+            app_module.QUERY_CACHE.clear()
+        start = time.perf_counter()
+        fn(*args)
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def build(n_rows, workdir, seed):
+    path = os.path.join(workdir, f'catalog_{n_rows}.csv')
+    write_catalog(n_rows, path, seed)
+    with contextlib.redirect_stdout(io.StringIO()):
+        df = app_module.load_healthcare_data(path)
+        start = time.perf_counter()
+        recommender = app_module.ProductRecommender(df)
+        fit_seconds = time.perf_counter() - start
+    return recommender, fit_seconds
+
+
+def user_inputs(vocabulary, rng):
+    goals, symptoms = vocabulary['goals'], vocabulary['symptoms']
+    return {
+        'health_goals': rng.sample(goals, 2),
+        'symptoms': rng.sample(symptoms, 2),
+        'gender': rng.choice(['Male', 'Female']),
+        'age': rng.randint(18, 70),
+    }
+
+
+def micro_benchmarks(recommender, vocabulary, iterations, seed):
+    rng = random.Random(seed)
+    n = len(recommender.store)
+    ids = [rng.randint(1, n) for _ in range(iterations)]
+    inputs = [user_inputs(vocabulary, rng) for _ in range(iterations)]
+    profiles = [
+        ({'age': rng.randint(18, 70), 'health_concerns': ', '.join(rng.sample(vocabulary['symptoms'], 2))},
+         rng.sample(range(1, n + 1), 10), rng.sample(QUERIES, 3))
+        for _ in range(iterations)
+    ]
+    with contextlib.redirect_stdout(io.StringIO()):
+        return {
+            'search_products': timed(recommender.search_products, iterations,
+                                     lambda i: (QUERIES[i % len(QUERIES)], 20)),
+            'recommend': timed(recommender.recommend, iterations, lambda i: (inputs[i], 20)),
+            'get_personalized_recommendations': timed(recommender.get_personalized_recommendations, iterations,
+                                                      lambda i: profiles[i] + (10,)),
+            'get_product_by_id': timed(recommender.get_product_by_id, iterations, lambda i: (ids[i],),
+                                       clear_cache=False),
+            'get_similar_rows': timed(recommender.get_similar_rows, iterations,
+                                      lambda i: (ids[i] - 1, 5), clear_cache=False),
+        }
+
+
+def http_scenario(recommender, requests_count, seed, workdir, accept_encoding):
+    """Chạy kịch bản trộn endpoint qua Flask test client (một thread, cache bật như production)"""
+    app_module.recommender = recommender
+    app_module.SEARCH_HISTORY_LOG.path = os.path.join(workdir, 'search_history.jsonl')
+    app_module.QUERY_CACHE.clear()
+    client = app_module.app.test_client()
+    client.environ_base['HTTP_ACCEPT_ENCODING'] = accept_encoding
+    rng = random.Random(seed)
+    n = len(recommender.store)
+
+    emails = [f'bench{i}@example.com' for i in range(20)]
+    for email in emails:
+        client.post('/auth/signup', json={'email': email, 'password': 'x', 'name': email})
+        client.post('/user/profile', json={'email': email, 'age': rng.randint(18, 70),
+                                           'health_concerns': rng.choice(QUERIES)})
+
+    def request(name):
+        email = rng.choice(emails)
+        if name == 'search':
+            return client.post('/api/products/search', json={'query': rng.choice(QUERIES), 'email': email})
+        if name == 'product':
+            return client.get(f'/api/products/{rng.randint(1, n)}')
+        if name == 'view':
+            return client.post('/api/products/view', json={'email': email, 'product_id': rng.randint(1, n)})
+        if name == 'personalized':
+            return client.post('/api/products/personalized', json={'email': email, 'limit': 10})
+        if name == 'similar':
+            return client.get(f'/api/products/similar/{rng.randint(1, n)}')
+        if name == 'suggest':
+            return client.get(f'/api/products/suggest?q={rng.choice(PREFIXES)}')
+        if name == 'landing':
+            return client.get('/api/products/landing')
+        return client.get('/api/products/categories')
+
+    names, weights = zip(*SCENARIO)
+    samples = {name: [] for name in names}
+    sizes = {name: [] for name in names}
+    errors = 0
+    with contextlib.redirect_stdout(io.StringIO()):
+        # Warm-up: suggest index, snapshot phổ biến
+        for name in names:
+            request(name)
+        start = time.perf_counter()
+        for name in rng.choices(names, weights, k=requests_count):
+            t = time.perf_counter()
+            response = request(name)
+            samples[name].append(time.perf_counter() - t)
+            sizes[name].append(len(response.data))
+            errors += response.status_code >= 400
+        elapsed = time.perf_counter() - start
+
+    return {
+        'requests': requests_count,
+        'errors': errors,
+        'rps': round(requests_count / elapsed, 1),
+        'accept_encoding': accept_encoding,
+        'endpoints': {name: dict(summarize(values), mean_bytes=round(float(np.mean(sizes[name]))))
+                      for name, values in samples.items() if values},
+    }
+
+
+def metadata():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=BACKEND_DIR).stdout.strip() or None
+    except OSError:
+        commit = None
+    import scipy
+    import sklearn
+    return {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'git_commit': commit,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'scipy': scipy.__version__,
+        'sklearn': sklearn.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'env': {name: os.environ.get(name) for name in ('TOPK_ENGINE', 'TEXT_ANALYZER', 'SCORING_POOL',
+                                                          'JSON_ENCODER', 'RESPONSE_COMPRESSION')},
+    }
+
+
+def print_result(result):
+    print(f"\n== {result['size']} products (fit {result['fit_seconds']:.2f}s, "
+          f"{result['features']} features) ==")
+    print(f"{'benchmark':>34} {'mean ms':>9} {'p50 ms':>9} {'p99 ms':>9} {'bytes':>8}")
+    for name, stats in result['micro'].items():
+        print(f"{name:>34} {stats['mean_ms']:>9.3f} {stats['p50_ms']:>9.3f} {stats['p99_ms']:>9.3f}")
+    http = result['http']
+    print(f"HTTP scenario: {http['requests']} requests, {http['rps']} req/s, {http['errors']} errors")
+    for name, stats in http['endpoints'].items():
+        print(f"{'http ' + name:>34} {stats['mean_ms']:>9.3f} {stats['p50_ms']:>9.3f} {stats['p99_ms']:>9.3f} "
+              f"{stats['mean_bytes']:>8}")
+
+
+def compare(results, baseline_path, threshold, min_delta_ms):
+    """So p50 với file baseline; trả về các benchmark chậm hơn `threshold` lần và hơn `min_delta_ms`"""
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = {item['size']: item for item in json.load(f)['results']}
+    regressions = []
+    for result in results:
+        base = baseline.get(result['size'])
+        if base is None:
+            continue
+        pairs = [(f"micro {name}", stats, base['micro'].get(name)) for name, stats in result['micro'].items()]
+        pairs += [(f"http {name}", stats, base['http']['endpoints'].get(name))
+                  for name, stats in result['http']['endpoints'].items()]
+        for name, stats, old in pairs:
+            if (old and old['p50_ms'] > 0 and stats['p50_ms'] / old['p50_ms'] > threshold
+                    and stats['p50_ms'] - old['p50_ms'] > min_delta_ms):
+                regressions.append((result['size'], name, old['p50_ms'], stats['p50_ms']))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000])
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--http-requests', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--accept-encoding', default='gzip, deflate, br',
+                        help="header Accept-Encoding của kịch bản HTTP ('identity' để tắt nén)")
+    parser.add_argument('--json', help='ghi kết quả ra file JSON')
+    parser.add_argument('--compare', help='file JSON của lần chạy trước để so sánh p50')
+    parser.add_argument('--threshold', type=float, default=1.25, help='tỉ lệ p50 mới/cũ bị coi là chậm hơn')
+    parser.add_argument('--min-delta-ms', type=float, default=0.1,
+                        help='bỏ qua chênh lệch p50 nhỏ hơn mức này (nhiễu ở benchmark dưới 1 ms)')
+    args = parser.parse_args()
+
+    vocabulary = load_vocabulary()
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for size in args.sizes:
+            recommender, fit_seconds = build(size, workdir, args.seed)
+            result = {
+                'size': size,
+                'fit_seconds': round(fit_seconds, 3),
+                'features': int(recommender.feature_matrix.shape[1]),
+                'micro': micro_benchmarks(recommender, vocabulary, args.iterations, args.seed),
+                'http': http_scenario(recommender, args.http_requests, args.seed, workdir, args.accept_encoding),
+            }
+            print_result(result)
+            sys.stdout.flush()
+            results.append(result)
+            app_module.SEARCH_HISTORY_LOG.flush()
+
+    report = {'meta': metadata(), 'config': vars(args), 'results': results}
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\nWrote {args.json}")
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.threshold, args.min_delta_ms)
+        for size, name, old, new in regressions:
+            print(f"REGRESSION {size} {name}: p50 {old:.3f} ms -> {new:.3f} ms")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
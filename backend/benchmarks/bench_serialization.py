@@ -0,0 +1,115 @@
+"""Benchmark serialize response: số byte và thời gian encode theo endpoint.
+
+Với mỗi endpoint trả về sản phẩm, lấy payload qua Flask test client rồi đo:
+số byte khi trả mọi trường (fields=all, như trước khi có projection), với
+projection mặc định, sau khi nén gzip/br; thời gian encode payload bằng json
+chuẩn (ensure_ascii như jsonify cũ) so với json_dumps của app (orjson nếu có)
+và thời gian nén.
+
+Chạy từ thư mục backend:
+    python benchmarks/bench_serialization.py --sizes 10000
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_recommender import QUERIES, app_module, build  # noqa: E402
+
+ENDPOINTS = ('search', 'search_batch', 'personalized', 'similar', 'product', 'view_history', 'landing')
+
+
+def timed_ms(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return float(np.percentile(np.asarray(samples) * 1000, 50))
+
+
+def make_requests(client, n_products):
+    email = 'bench_serialization@example.com'
+    client.post('/auth/signup', json={'email': email, 'password': 'x', 'name': email})
+    client.post('/user/profile', json={'email': email, 'age': 35, 'health_concerns': QUERIES[0]})
+    for product_id in range(1, min(n_products, 20) + 1):
+        client.post('/api/products/view', json={'email': email, 'product_id': product_id})
+
+    def request(name, fields=None, headers=None):
+        extra = {'fields': fields} if fields else {}
+        query = f'?fields={fields}' if fields else ''
+        if name == 'search':
+            return client.post('/api/products/search', json={'query': QUERIES[0], **extra}, headers=headers)
+        if name == 'search_batch':
+            return client.post('/api/products/search/batch', json={'queries': QUERIES[:5], **extra},
+                               headers=headers)
+        if name == 'personalized':
+            return client.post('/api/products/personalized', json={'email': email, 'limit': 10, **extra},
+                               headers=headers)
+        if name == 'similar':
+            return client.get(f'/api/products/similar/1{query}', headers=headers)
+        if name == 'product':
+            return client.get(f'/api/products/1{query}', headers=headers)
+        if name == 'view_history':
+            return client.post('/api/products/view-history', json={'email': email, **extra}, headers=headers)
+        return client.get('/api/products/landing', headers=headers)
+    return request
+
+
+def measure(request, name, repeat):
+    full = request(name, fields='all').get_json()
+    lean = request(name).get_json()
+    result = {
+        'full_bytes': len(json.dumps(full).encode('utf-8')),
+        'lean_bytes': len(request(name).data),
+        'json_encode_ms': timed_ms(lambda: json.dumps(lean, sort_keys=True), repeat),
+        'app_encode_ms': timed_ms(lambda: app_module.json_dumps(lean, sort_keys=True), repeat),
+    }
+    body = app_module.json_dumps(lean).encode('utf-8')
+    encodings = ['gzip'] + (['br'] if app_module.brotli is not None else [])
+    for encoding in encodings:
+        result[f'{encoding}_bytes'] = len(request(name, headers={'Accept-Encoding': encoding}).data)
+        result[f'{encoding}_ms'] = timed_ms(lambda: app_module.compress(body, encoding), repeat)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000])
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"encoder={app_module.JSON_ENCODER} brotli={'yes' if app_module.brotli is not None else 'no'} "
+          f"compress_min_bytes={app_module.COMPRESS_MIN_BYTES}")
+    with tempfile.TemporaryDirectory() as workdir:
+        for size in args.sizes:
+            recommender, _ = build(size, workdir, args.seed)
+            app_module.recommender = recommender
+            app_module.SEARCH_HISTORY_LOG.path = os.path.join(workdir, 'search_history.jsonl')
+            request = make_requests(app_module.app.test_client(), len(recommender.store))
+
+            print(f"\n== {size} products ==")
+            print(f"{'endpoint':>14} {'all B':>8} {'lean B':>8} {'gzip B':>8} {'br B':>8} "
+                  f"{'json ms':>8} {'app ms':>8} {'gzip ms':>8} {'br ms':>8}")
+            with contextlib.redirect_stdout(io.StringIO()):
+                results = {name: measure(request, name, args.repeat) for name in ENDPOINTS}
+            for name, result in results.items():
+                br_bytes = result.get('br_bytes', '-')
+                br_ms = f"{result['br_ms']:.3f}" if 'br_ms' in result else '-'
+                print(f"{name:>14} {result['full_bytes']:>8} {result['lean_bytes']:>8} {result['gzip_bytes']:>8} "
+                      f"{br_bytes:>8} {result['json_encode_ms']:>8.3f} {result['app_encode_ms']:>8.3f} "
+                      f"{result['gzip_ms']:>8.3f} {br_ms:>8}")
+            sys.stdout.flush()
+            app_module.SEARCH_HISTORY_LOG.flush()
+
+
+if __name__ == '__main__':
+    main()
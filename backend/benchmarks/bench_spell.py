@@ -0,0 +1,93 @@
+"""Benchmark sửa lỗi gõ (TermCorrector): độ chính xác và thời gian sửa một từ.
+
+Lỗi gõ được sinh từ term thật của vocabulary (xóa, thêm, thay, đảo hai ký tự
+liền nhau); một lần sửa đúng khi kết quả là term gốc. Vocabulary lấy từ catalog
+giả lập (synthetic_catalog.py) để có kích thước như production.
+
+Chạy từ thư mục backend:
+    python benchmarks/bench_spell.py --sizes 10000 100000
+"""
+import argparse
+import os
+import random
+import string
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_dense import fit_features  # noqa: E402
+from synthetic_catalog import write_catalog  # noqa: E402
+from app import TermCorrector  # noqa: E402
+
+ALPHABET = string.ascii_lowercase
+
+
+def make_typo(term, rng):
+    i = rng.randrange(len(term))
+    kind = rng.choice(['delete', 'insert', 'substitute', 'transpose'])
+    if kind == 'delete':
+        return term[:i] + term[i + 1:]
+    if kind == 'insert':
+        return term[:i] + rng.choice(ALPHABET) + term[i:]
+    if kind == 'substitute':
+        return term[:i] + rng.choice(ALPHABET.replace(term[i], '')) + term[i + 1:]
+    i = min(i, len(term) - 2)
+    return term[:i] + term[i + 1] + term[i] + term[i + 2:]
+
+
+def percentiles(samples):
+    us = np.asarray(samples) * 1e6
+    return np.percentile(us, 50), np.percentile(us, 99)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--typos', type=int, default=2000)
+    args = parser.parse_args()
+
+    path = os.path.join('/tmp', 'bench_spell_catalog.csv')
+    print(f"{'products':>9} {'terms':>7} {'build ms':>9} {'accuracy':>9} {'p50 us':>8} {'p99 us':>8} "
+          f"{'cached p50 us':>14}")
+    for size in args.sizes:
+        write_catalog(size, path)
+        vectorizer, _ = fit_features(path)
+        analyzer = vectorizer.analyzer
+
+        start = time.perf_counter()
+        corrector = TermCorrector(vectorizer.vocabulary_, vectorizer.idf_)
+        build_ms = (time.perf_counter() - start) * 1000
+
+        rng = random.Random(0)
+        words = [term for term in corrector.terms if len(term) >= 4 and term.isalpha()]
+        cases = []
+        while len(cases) < args.typos:
+            term = rng.choice(words)
+            typo = make_typo(term, rng)
+            if typo not in vectorizer.vocabulary_:
+                cases.append((typo, term))
+
+        samples, correct = [], 0
+        for typo, term in cases:
+            start = time.perf_counter()
+            fixed = corrector.correct_word(typo, analyzer)
+            samples.append(time.perf_counter() - start)
+            correct += fixed == term
+        cached = []
+        for typo, _ in cases:
+            start = time.perf_counter()
+            corrector.correct_word(typo, analyzer)
+            cached.append(time.perf_counter() - start)
+
+        p50, p99 = percentiles(samples)
+        cached_p50, _ = percentiles(cached)
+        print(f"{size:>9} {len(corrector.terms):>7} {build_ms:>9.1f} {correct / len(cases):>9.3f} "
+              f"{p50:>8.1f} {p99:>8.1f} {cached_p50:>14.2f}")
+        sys.stdout.flush()
+    os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
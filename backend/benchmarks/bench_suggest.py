@@ -0,0 +1,64 @@
+"""Benchmark suggest index: thời gian build và thời gian tra prefix.
+
+Chạy từ thư mục backend:
+    python benchmarks/bench_suggest.py --sizes 10000 1000000
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.chdir(BACKEND_DIR)
+
+from app import SuggestIndex  # noqa: E402
+
+SYLLABLES = ('tăng', 'giảm', 'mất', 'ngủ', 'đau', 'khớp', 'da', 'tóc', 'gan', 'tim', 'mạch', 'trí', 'nhớ',
+             'miễn', 'dịch', 'năng', 'lượng', 'tiêu', 'hóa', 'xương', 'vitamin', 'omega', 'kẽm', 'sắt')
+
+
+def synthetic_entries(n_entries, seed=0):
+    """Cụm 2-4 âm tiết ngẫu nhiên kèm số ngẫu nhiên để key không trùng, weight Zipf"""
+    rng = np.random.default_rng(seed)
+    words = rng.integers(0, len(SYLLABLES), size=(n_entries, 4))
+    lengths = rng.integers(2, 5, size=n_entries)
+    weights = rng.zipf(1.5, size=n_entries).astype(float)
+    return [
+        (' '.join(SYLLABLES[w] for w in words[i, :lengths[i]]) + f' {i}', 'query', weights[i])
+        for i in range(n_entries)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 1000000])
+    parser.add_argument('--lookups', type=int, default=20000)
+    args = parser.parse_args()
+
+    print(f"{'entries':>10} {'build s':>8} {'precomputed':>12} {'p50 us':>7} {'p99 us':>7} {'max us':>8}")
+    for n_entries in args.sizes:
+        entries = synthetic_entries(n_entries)
+        start = time.perf_counter()
+        index = SuggestIndex(entries)
+        build_seconds = time.perf_counter() - start
+
+        # Prefix lấy từ key thật, độ dài 1-8 ký tự (ngắn = vùng lớn nhất)
+        rng = np.random.default_rng(1)
+        prefixes = [
+            index.keys[rng.integers(len(index))][:rng.integers(1, 9)] for _ in range(args.lookups)
+        ]
+        timings = np.empty(len(prefixes))
+        for i, prefix in enumerate(prefixes):
+            start = time.perf_counter()
+            index.complete(prefix, 8)
+            timings[i] = time.perf_counter() - start
+        timings *= 1e6
+        print(f"{n_entries:>10} {build_seconds:>8.2f} {len(index._top_by_prefix):>12} "
+              f"{np.percentile(timings, 50):>7.1f} {np.percentile(timings, 99):>7.1f} {timings.max():>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""Benchmark top-k engine: brute force (cosine + argsort) vs inverted index.
+
+Chạy từ thư mục backend:
+    python benchmarks/bench_topk.py --sizes 1000 100000 1000000
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.metrics.pairwise import cosine_similarity
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.chdir(BACKEND_DIR)
+
+from app import BruteForceEngine, InvertedIndexEngine  # noqa: E402
+
+
+def synthetic_feature_matrix(n_products, vocab_size=20000, terms_per_product=40, seed=0):
+    """Tạo ma trận TF-IDF giả lập (CSR, dòng chuẩn hóa L2) với phân phối term Zipf"""
+    rng = np.random.default_rng(seed)
+    rows = np.repeat(np.arange(n_products), terms_per_product)
+    cols = (rng.zipf(1.3, size=n_products * terms_per_product) - 1) % vocab_size
+    data = rng.random(n_products * terms_per_product).astype(np.float64) + 0.1
+    matrix = sp.csr_matrix((data, (rows, cols)), shape=(n_products, vocab_size))
+    matrix.sum_duplicates()
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    return sp.csr_matrix(sp.diags(1.0 / norms) @ matrix)
+
+
+def synthetic_queries(n_queries, vocab_size=20000, seed=1):
+    """Query 2-5 term, ưu tiên term hiếm hơn giống truy vấn thực tế"""
+    rng = np.random.default_rng(seed)
+    queries = []
+    for _ in range(n_queries):
+        n_terms = rng.integers(2, 6)
+        cols = np.unique(rng.integers(0, vocab_size, size=n_terms))
+        data = rng.random(len(cols)) + 0.1
+        data /= np.linalg.norm(data)
+        queries.append(sp.csr_matrix((data, (np.zeros(len(cols), dtype=int), cols)), shape=(1, vocab_size)))
+    return queries
+
+
+def current_path(feature_matrix, query_vector, limit, min_score=0.01):
+    """Đường xử lý cũ của search_products: cosine + argsort toàn bộ"""
+    similarities = cosine_similarity(query_vector, feature_matrix).flatten()
+    top_indices = similarities.argsort(kind='stable')[-limit:][::-1]
+    return [idx for idx in top_indices if similarities[idx] > min_score]
+
+
+def time_per_query(fn, queries, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for query in queries:
+            fn(query)
+        best = min(best, (time.perf_counter() - start) / len(queries))
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 100000, 1000000])
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--limit', type=int, default=20)
+    args = parser.parse_args()
+
+    queries = synthetic_queries(args.queries)
+    print(f"{'products':>10} {'current ms':>11} {'brute ms':>9} {'inverted ms':>12} {'speedup':>8} identical")
+    for n_products in args.sizes:
+        matrix = synthetic_feature_matrix(n_products)
+        brute = BruteForceEngine(matrix)
+        inverted = InvertedIndexEngine(matrix)
+
+        identical = all(
+            current_path(matrix, q, args.limit) == list(inverted.search(q, args.limit)[0])
+            for q in queries
+        )
+        current_ms = time_per_query(lambda q: current_path(matrix, q, args.limit), queries)
+        brute_ms = time_per_query(lambda q: brute.search(q, args.limit), queries)
+        inverted_ms = time_per_query(lambda q: inverted.search(q, args.limit), queries)
+        print(f"{n_products:>10} {current_ms:>11.3f} {brute_ms:>9.3f} {inverted_ms:>12.3f} "
+              f"{current_ms / inverted_ms:>7.1f}x {identical}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""Kiểm tra incremental_update cho kết quả như dựng lại toàn bộ index.
+
+Sửa/xóa/thêm một phần nhỏ catalog giả lập rồi so recommender sau
+incremental_update với index dựng lại từ chính feature_matrix đó: bảng
+similar products (SimilarityIndex.build), postings đã vá (so với CSC của
+ma trận), kết quả search của engine và embedding/cụm của dense engine.
+In thời gian cập nhật so với dựng lại. Exit 1 nếu có khác biệt.
+
+Chạy từ thư mục backend:
+    python benchmarks/check_incremental_update.py --rows 5000 --changed 0.02
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_recommender import QUERIES, app_module  # noqa: E402
+from synthetic_catalog import generate_catalog  # noqa: E402
+
+
+def modified_catalog(catalog, ratio, seed):
+    """Catalog sau khi sửa mô tả, xóa và thêm mới tổng cộng khoảng `ratio` số dòng"""
+    rng = np.random.default_rng(seed)
+    n_each = max(1, int(len(catalog) * ratio / 3))
+    rows = rng.permutation(len(catalog))
+    edited, removed = rows[:n_each], rows[n_each:2 * n_each]
+
+    catalog = catalog.copy()
+    donors = rng.integers(0, len(catalog), n_each)
+    catalog.loc[catalog.index[edited], 'description'] = catalog['description'].to_numpy()[donors]
+    catalog.loc[catalog.index[edited[: n_each // 2]], 'category'] = catalog['category'].to_numpy()[donors[: n_each // 2]]
+    added = generate_catalog(n_each, seed=seed + 1)
+    added['id'] = added['id'] + int(catalog['id'].max())
+    return pd.concat([catalog.drop(catalog.index[removed]), added], ignore_index=True)
+
+
+def load(catalog, path):
+    catalog.to_csv(path, index=False, encoding='utf-8-sig')
+    with contextlib.redirect_stdout(io.StringIO()):
+        return app_module.load_healthcare_data(path)
+
+
+def same_neighbors(label, expected_rows, expected_scores, rows, scores):
+    """Cùng điểm ở mọi vị trí và cùng neighbour trừ các chỗ hòa điểm"""
+    if not np.allclose(expected_scores, scores, atol=1e-6):
+        bad = np.flatnonzero(~np.isclose(expected_scores, scores, atol=1e-6).all(axis=1))
+        print(f"MISMATCH {label} scores: {len(bad)} rows, first row {bad[0]}")
+        return 1
+    differs = (expected_rows != rows).any(axis=1)
+    for row in np.flatnonzero(differs):
+        tied = np.isin(expected_scores[row], expected_scores[row][expected_rows[row] != rows[row]])
+        if not np.array_equal(np.sort(expected_rows[row][tied]), np.sort(rows[row][tied])) \
+                and not np.all(np.diff(expected_scores[row][tied]) == 0):
+            print(f"MISMATCH {label} neighbors of row {row}")
+            return 1
+    return 0
+
+
+def check_engine(engine_name, catalog, updated_df, workdir):
+    failures = 0
+    with contextlib.redirect_stdout(io.StringIO()):
+        base = app_module.ProductRecommender(load(catalog, os.path.join(workdir, 'before.csv')), engine=engine_name)
+        start = time.perf_counter()
+        recommender = base.incremental_update(updated_df)
+        update_seconds = time.perf_counter() - start
+    if recommender is None:
+        print(f"{engine_name}: incremental update refused")
+        return 1
+
+    matrix = recommender.feature_matrix
+    start = time.perf_counter()
+    expected = app_module.SimilarityIndex.build(matrix, recommender.store.column('category'),
+                                                app_module.SIMILARITY_NEIGHBORS)
+    rebuild_seconds = time.perf_counter() - start
+    actual = recommender.similarity_index
+    failures += same_neighbors('neighbors', expected.neighbors, expected.scores, actual.neighbors, actual.scores)
+    failures += same_neighbors('category_neighbors', expected.category_neighbors, expected.category_scores,
+                               actual.category_neighbors, actual.category_scores)
+
+    engine = recommender.engine
+    if engine_name == app_module.InvertedIndexEngine.name:
+        reference = matrix.tocsc()
+        reference.sort_indices()
+        postings = engine.postings
+        if not (np.array_equal(reference.indptr, postings.indptr) and np.array_equal(reference.indices, postings.indices)
+                and np.array_equal(reference.data, postings.data)):
+            print("MISMATCH inverted postings")
+            failures += 1
+    if engine_name == app_module.DenseANNEngine.name:
+        embeddings = engine._normalize(matrix @ engine.projection)
+        if not np.allclose(embeddings, engine.embeddings, atol=1e-5):
+            print("MISMATCH dense embeddings")
+            failures += 1
+        if not np.array_equal(np.sort(engine.list_rows), np.arange(matrix.shape[0])):
+            print("MISMATCH dense lists")
+            failures += 1
+    else:
+        fresh = app_module.TOPK_ENGINES[engine_name](matrix)
+        for query in QUERIES:
+            query_vector = recommender.vectorizer.transform([query])
+            expected_rows, expected_scores = fresh.search(query_vector, 20)
+            rows, scores = engine.search(query_vector, 20)
+            if not np.allclose(expected_scores, scores):
+                print(f"MISMATCH {engine_name} search {query!r}")
+                failures += 1
+
+    print(f"{engine_name:>9}: update {update_seconds:.2f}s, similarity rebuild {rebuild_seconds:.2f}s, "
+          f"{failures} mismatches")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=5000)
+    parser.add_argument('--changed', type=float, default=0.02)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    workdir = '/tmp'
+    catalog = generate_catalog(args.rows, args.seed)
+    updated_df = load(modified_catalog(catalog, args.changed, args.seed), os.path.join(workdir, 'after.csv'))
+    failures = sum(check_engine(name, catalog, updated_df, workdir) for name in app_module.TOPK_ENGINES)
+    for name in ('before.csv', 'after.csv'):
+        os.remove(os.path.join(workdir, name))
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
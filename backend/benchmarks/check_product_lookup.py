@@ -0,0 +1,115 @@
+"""Kiểm tra tra cứu sản phẩm theo id (index id -> dòng) khớp với cách quét DataFrame cũ.
+
+So get_product_by_id và get_products_by_ids với bản cũ (mask `df['id'] == id`
+rồi iloc[0], kèm has_age_range/has_weight_range) cho mọi id của catalog, id
+trùng (giữ dòng đầu tiên), id không tồn tại và id không hợp lệ; chạy trên
+store dựng từ DataFrame và store load lại từ artifact (records lazy).
+Exit 1 nếu có khác biệt.
+
+Chạy từ thư mục backend:
+    python benchmarks/check_product_lookup.py --rows 2000
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_recommender import app_module  # noqa: E402
+from synthetic_catalog import write_catalog  # noqa: E402
+
+MISSING_IDS = [0, -1, 10 ** 9, '0', 'abc', None, 3.5]
+
+
+def legacy_product_by_id(df, product_id):
+    """get_product_by_id trước khi có index: quét DataFrame"""
+    try:
+        if isinstance(product_id, str):
+            product_id = int(product_id)
+        product_row = df[df['id'] == product_id]
+        if product_row.empty:
+            return None
+        product = product_row.iloc[0].to_dict()
+        product['id'] = int(product['id'])
+        product['has_age_range'] = 'age_range' in product and product['age_range'] != ''
+        product['has_weight_range'] = 'weight_range' in product and product['weight_range'] != ''
+        return product
+    except Exception:
+        return None
+
+
+def legacy_products_by_ids(df, product_ids):
+    """Vòng lặp của route view-history cũ"""
+    products = []
+    for product_id in product_ids:
+        product = legacy_product_by_id(df, product_id)
+        if product:
+            products.append(product)
+    return products
+
+
+def diff(expected, actual):
+    """Mô tả ngắn khác biệt đầu tiên giữa hai kết quả"""
+    if isinstance(expected, list) and isinstance(actual, list):
+        if len(expected) != len(actual):
+            return f'{len(expected)} products vs {len(actual)}'
+        i = next(i for i, (a, b) in enumerate(zip(expected, actual)) if a != b)
+        return f'product #{i}: {diff(expected[i], actual[i])}'
+    if isinstance(expected, dict) and isinstance(actual, dict):
+        keys = sorted(key for key in expected.keys() | actual.keys() if expected.get(key) != actual.get(key))
+        return ', '.join(f'{key}: {expected.get(key)!r} vs {actual.get(key)!r}' for key in keys)
+    return f'{expected!r} vs {actual!r}'
+
+
+def compare(label, expected, actual):
+    if expected != actual:
+        print(f"MISMATCH {label}: {diff(expected, actual)}")
+        return 1
+    return 0
+
+
+def check(recommender, df, ids):
+    failures = 0
+    for product_id in ids + MISSING_IDS:
+        failures += compare(f'get_product_by_id({product_id!r})',
+                            legacy_product_by_id(df, product_id), recommender.get_product_by_id(product_id))
+    batch = ids[::-1] + MISSING_IDS + ids[:10]
+    failures += compare('get_products_by_ids', legacy_products_by_ids(df, batch),
+                        recommender.get_products_by_ids(batch))
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=2000)
+    args = parser.parse_args()
+
+    path = os.path.join('/tmp', 'check_product_lookup.csv')
+    catalog = write_catalog(args.rows, path)
+    # Thêm dòng có id trùng và dòng thiếu age_range/weight_range
+    extra = catalog.iloc[:5].copy()
+    extra['name'] = extra['name'] + ' (bản trùng)'
+    blank = catalog.iloc[5:8].copy()
+    blank['id'] = blank['id'] + args.rows
+    blank[['age_range', 'weight_range']] = ''
+    pd.concat([catalog, extra, blank]).to_csv(path, index=False, encoding='utf-8-sig')
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        df = app_module.load_healthcare_data(path)
+        recommender = app_module.ProductRecommender(df)
+    ids = [int(product_id) for product_id in dict.fromkeys(df['id'].tolist())]
+
+    failures = check(recommender, df, ids)
+    print(f"DataFrame store: {len(ids)} ids, {failures} mismatches")
+    recommender.store = app_module.ProductStore.unpack(*recommender.store.pack())
+    artifact_failures = check(recommender, df, ids)
+    print(f"artifact store:  {len(ids)} ids, {artifact_failures} mismatches")
+    os.remove(path)
+    sys.exit(1 if failures or artifact_failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""Load test cho API: p50/p99 latency và RPS theo từng endpoint.
+
+Chạy server cần đo trước, ví dụ dev server và bản ASGI:
+    python app.py
+    uvicorn asgi:application --port 8000
+
+Rồi từ thư mục backend:
+    python benchmarks/load_test.py --targets http://localhost:5000 http://localhost:8000 --concurrency 32
+"""
+import argparse
+import http.client
+import json
+import random
+import threading
+import time
+from collections import defaultdict
+from urllib.parse import urlsplit
+
+import numpy as np
+
+QUERIES = ['mất ngủ', 'mat ngu', 'đau khớp', 'tăng đề kháng', 'rụng tóc', 'giải độc gan', 'tim mạch',
+           'loãng xương', 'trí nhớ', 'tiêu hóa kém', 'mệt mỏi mãn tính', 'vitamin', 'omega 3 cholesterol']
+
+# (tên, method, path, body) — body là hàm sinh payload cho mỗi request
+ENDPOINTS = [
+    ('search', 'POST', '/api/products/search', lambda rng: {'query': rng.choice(QUERIES), 'limit': 20}),
+    ('batch', 'POST', '/api/products/search/batch',
+     lambda rng: {'queries': rng.sample(QUERIES, 5), 'limit': 10}),
+    ('suggest', 'GET', lambda rng: f'/api/products/suggest?q={rng.choice(["ta", "gi", "vit", "mat"])}', None),
+    ('similar', 'GET', lambda rng: f'/api/products/similar/{rng.randint(1, 30)}', None),
+    ('landing', 'GET', '/api/products/landing', None),
+    ('health', 'GET', '/health', None),
+]
+
+
+def worker(target, deadline, max_requests, counter, results, errors, seed):
+    rng = random.Random(seed)
+    parts = urlsplit(target)
+    connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+    while time.perf_counter() < deadline:
+        with counter['lock']:
+            if counter['sent'] >= max_requests:
+                break
+            counter['sent'] += 1
+        name, method, path, body = rng.choice(ENDPOINTS)
+        path = path(rng) if callable(path) else path
+        payload = json.dumps(body(rng)) if body else None
+        headers = {'Content-Type': 'application/json'} if payload else {}
+        start = time.perf_counter()
+        try:
+            connection.request(method, path, body=payload, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            if response.status >= 400:
+                errors[name] += 1
+        except (OSError, http.client.HTTPException):
+            errors[name] += 1
+            connection.close()
+            connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+            continue
+        results[name].append(time.perf_counter() - start)
+    connection.close()
+
+
+def run(target, concurrency, duration, max_requests):
+    results = defaultdict(list)
+    errors = defaultdict(int)
+    counter = {'sent': 0, 'lock': threading.Lock()}
+    deadline = time.perf_counter() + duration
+    threads = [
+        threading.Thread(target=worker, args=(target, deadline, max_requests, counter, results, errors, seed))
+        for seed in range(concurrency)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, errors, time.perf_counter() - start
+
+
+def report(target, results, errors, elapsed):
+    print(f"\n{target}")
+    print(f"{'endpoint':>10} {'requests':>9} {'errors':>7} {'p50 ms':>8} {'p99 ms':>8}")
+    everything = []
+    for name, _, _, _ in ENDPOINTS:
+        timings = np.array(results.get(name, [])) * 1000
+        everything.extend(timings)
+        if len(timings):
+            print(f"{name:>10} {len(timings):>9} {errors[name]:>7} "
+                  f"{np.percentile(timings, 50):>8.2f} {np.percentile(timings, 99):>8.2f}")
+    if everything:
+        print(f"{'total':>10} {len(everything):>9} {sum(errors.values()):>7} "
+              f"{np.percentile(everything, 50):>8.2f} {np.percentile(everything, 99):>8.2f}"
+              f"   {len(everything) / elapsed:.1f} RPS")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--targets', nargs='+', default=['http://localhost:5000'])
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=20.0, help='giây chạy cho mỗi target')
+    parser.add_argument('--requests', type=int, default=10 ** 9, help='giới hạn tổng số request')
+    args = parser.parse_args()
+
+    for target in args.targets:
+        report(target, *run(target.rstrip('/'), args.concurrency, args.duration, args.requests))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""Sinh catalog sản phẩm giả lập cùng schema với healthcare_data.csv.
+
+Từ vựng (category, triệu chứng, mục tiêu sức khỏe, khoảng tuổi/cân nặng) lấy
+từ catalog thật; triệu chứng và mục tiêu được chọn theo phân phối Zipf nên
+posting list có độ dài lệch như dữ liệu thật. Cùng `seed` cho cùng catalog.
+
+Chạy từ thư mục backend:
+    python benchmarks/synthetic_catalog.py --rows 100000 --out /tmp/catalog_100k.csv
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SOURCE_FILE = os.path.join(BACKEND_DIR, 'healthcare_data.csv')
+
+COLUMNS = ['id', 'name', 'category', 'description', 'target_gender', 'health_goal', 'age_range', 'weight_range']
+BRANDS = ('Nature', 'Vita', 'Bio', 'Pharma', 'Health', 'Pure', 'Viet', 'Green', 'Gold', 'Life',
+          'Care', 'Well', 'Max', 'Prime', 'Daily', 'Ocean', 'Herbal', 'Sun', 'Lotus', 'Sao')
+FORMS = ('Plus', 'Forte', 'Complex', 'Extra', 'Gold', 'Max', 'Premium', 'Kids', 'Women', 'Men', '')
+DOSES = ('100mg', '250mg', '500mg', '1000mg', '5000IU', '30 viên', '60 viên', '120 viên', '')
+
+
+def _split_values(series):
+    values = []
+    for text in series.dropna():
+        values.extend(part.strip() for part in str(text).split(',') if part.strip())
+    return sorted(set(values))
+
+
+def load_vocabulary(path=SOURCE_FILE):
+    """Các giá trị dùng để sinh catalog, lấy từ catalog thật"""
+    df = pd.read_csv(path, encoding='utf-8-sig').fillna('')
+    return {
+        'bases': sorted(set(df['name'].str.split().str[0])),
+        'categories': sorted(set(df['category'])),
+        'symptoms': _split_values(df['description']),
+        'goals': _split_values(df['health_goal']),
+        'genders': sorted(set(df['target_gender'])),
+        'age_ranges': sorted(set(df['age_range'].astype(str))),
+        'weight_ranges': sorted(set(df['weight_range'].astype(str))),
+    }
+
+
+def _zipf_choice(rng, n_values, size, exponent=1.1):
+    """Chỉ số trong [0, n_values) với tần suất giảm dần theo thứ hạng"""
+    weights = 1.0 / np.arange(1, n_values + 1) ** exponent
+    order = rng.permutation(n_values)
+    return order[rng.choice(n_values, size=size, p=weights / weights.sum())]
+
+
+def _join_picks(values, picks, lengths):
+    """Ghép values[picks[i, :lengths[i]]] thành chuỗi ', ' cho từng dòng"""
+    values = np.asarray(values, dtype=object)
+    return [', '.join(dict.fromkeys(values[row[:length]])) for row, length in zip(picks, lengths)]
+
+
+def generate_catalog(n_rows, seed=0, vocabulary=None):
+    """DataFrame `n_rows` sản phẩm với các cột như healthcare_data.csv"""
+    vocabulary = vocabulary or load_vocabulary()
+    rng = np.random.default_rng(seed)
+
+    max_symptoms, max_goals = 12, 4
+    symptoms = _zipf_choice(rng, len(vocabulary['symptoms']), n_rows * max_symptoms).reshape(n_rows, max_symptoms)
+    goals = _zipf_choice(rng, len(vocabulary['goals']), n_rows * max_goals).reshape(n_rows, max_goals)
+
+    bases = np.asarray(vocabulary['bases'], dtype=object)[rng.integers(0, len(vocabulary['bases']), n_rows)]
+    brands = np.asarray(BRANDS, dtype=object)[rng.integers(0, len(BRANDS), n_rows)]
+    forms = np.asarray(FORMS, dtype=object)[rng.integers(0, len(FORMS), n_rows)]
+    doses = np.asarray(DOSES, dtype=object)[rng.integers(0, len(DOSES), n_rows)]
+    # Số series giữ tên sản phẩm gần như không trùng (như mã SKU)
+    series = rng.integers(1, max(n_rows // 10, 10), n_rows)
+    names = [' '.join(part for part in (brand, base, form, dose) if part) + f' S{number}'
+             for brand, base, form, dose, number in zip(brands, bases, forms, doses, series)]
+
+    def pick(key):
+        values = np.asarray(vocabulary[key], dtype=object)
+        return values[_zipf_choice(rng, len(values), n_rows, exponent=0.8)]
+
+    return pd.DataFrame({
+        'id': np.arange(1, n_rows + 1),
+        'name': names,
+        'category': pick('categories'),
+        'description': _join_picks(vocabulary['symptoms'], symptoms, rng.integers(5, max_symptoms + 1, n_rows)),
+        'target_gender': pick('genders'),
+        'health_goal': _join_picks(vocabulary['goals'], goals, rng.integers(2, max_goals + 1, n_rows)),
+        'age_range': pick('age_ranges'),
+        'weight_range': pick('weight_ranges'),
+    }, columns=COLUMNS)
+
+
+def write_catalog(n_rows, path, seed=0):
+    """Sinh catalog và ghi CSV (utf-8-sig như healthcare_data.csv)"""
+    df = generate_catalog(n_rows, seed)
+    df.to_csv(path, index=False, encoding='utf-8-sig')
+    return df
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', required=True)
+    args = parser.parse_args()
+
+    df = write_catalog(args.rows, args.out, args.seed)
+    print(f"Wrote {len(df)} products to {args.out}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
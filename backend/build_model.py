@@ -0,0 +1,32 @@
+"""Build model artifact (TF-IDF + product store + similarity index) để server load bằng memory-map.
+
+Chạy từ thư mục backend:
+    python build_model.py [--source healthcare_data.csv] [--model-dir model]
+"""
+import argparse
+
+import app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--source', default=app.DATA_FILE)
+    parser.add_argument('--model-dir', default=app.MODEL_DIR)
+    args = parser.parse_args()
+
+    # Dùng lại model app vừa fit từ CSV nếu cùng nguồn, tránh fit hai lần
+    if app.recommender is not None and app.recommender.artifact_dir is None and args.source == app.DATA_FILE:
+        recommender = app.recommender
+    else:
+        products_df = app.load_healthcare_data(args.source)
+        if products_df.empty:
+            raise SystemExit(f"No products loaded from {args.source}")
+        recommender = app.ProductRecommender(
+            products_df, catalog_version=app.source_fingerprint(args.source)['sha256'][:12]
+        )
+
+    app.save_model_artifact(recommender, args.model_dir, args.source)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+"""Chạy nhiều worker dùng chung một model qua shared memory.
+
+Process cha build (hoặc load) model một lần, chuyển ma trận CSR/CSC, các cột
+sản phẩm và similarity index vào multiprocessing.shared_memory, rồi fork N
+worker cùng nghe trên một socket. Worker chỉ đọc các view numpy trỏ vào
+segment chung nên bộ nhớ không tăng tuyến tính theo số worker.
+
+Chạy từ thư mục backend (Linux/macOS, cần fork):
+    python serve.py --workers 4 --port 5000
+    python serve.py --workers 4 --memory-report                      # RSS/PSS từng worker
+    python serve.py --workers 4 --memory-report --no-shared-memory   # mỗi worker tự load model
+
+Reload catalog (SIGHUP, /admin/reload) trong một worker tạo model riêng cho
+worker đó; khởi động lại launcher để dùng chung model mới.
+"""
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+
+from werkzeug.serving import make_server
+
+
+def read_memory(pid):
+    """(RSS, PSS, shared) của process theo KiB, đọc từ /proc/<pid>/smaps_rollup"""
+    values = {}
+    try:
+        with open(f'/proc/{pid}/smaps_rollup', encoding='ascii') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[1].isdigit():
+                    values[parts[0].rstrip(':')] = int(parts[1])
+    except OSError:
+        return None
+    shared = values.get('Shared_Clean', 0) + values.get('Shared_Dirty', 0)
+    return values.get('Rss', 0), values.get('Pss', 0), shared
+
+
+def memory_report(parent_pid, worker_pids, label):
+    print(f"\nMemory ({label})")
+    print(f"{'process':>10} {'pid':>8} {'RSS MiB':>9} {'PSS MiB':>9} {'shared MiB':>11}")
+    total_pss = 0
+    for name, pid in [('parent', parent_pid)] + [(f'worker {i}', pid) for i, pid in enumerate(worker_pids)]:
+        memory = read_memory(pid)
+        if memory is None:
+            print(f"{name:>10} {pid:>8}   (không đọc được /proc/{pid}/smaps_rollup)")
+            continue
+        rss, pss, shared = memory
+        total_pss += pss
+        print(f"{name:>10} {pid:>8} {rss / 1024:>9.1f} {pss / 1024:>9.1f} {shared / 1024:>11.1f}")
+    print(f"{'total PSS':>10} {'':>8} {'':>9} {total_pss / 1024:>9.1f}")
+
+
+def run_worker(app_module, listener, host, port, own_model, ready_fd):
+    """Thân của process worker: (tùy chọn) load model riêng rồi phục vụ trên socket chung"""
+    def stop(signum, frame):
+        raise SystemExit(0)
+
+    for name in ('SIGTERM', 'SIGINT'):
+        signal.signal(getattr(signal, name), stop)
+    # Thread nền của process cha không đi theo fork: worker dựng lại lock/hàng đợi và chạy thread ghi riêng
+    app_module.reset_after_fork()
+    if own_model:
+        app_module.recommender = app_module.build_recommender()
+    app_module.warm_up()
+    server = make_server(host, port, app_module.app, threaded=True, fd=listener.fileno())
+    os.write(ready_fd, b'1')
+    os.close(ready_fd)
+    try:
+        server.serve_forever()
+    finally:
+        # Worker thoát bằng os._exit (không chạy atexit): ghi nốt lịch sử đang chờ
+        app_module.flush_background_writers()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2)
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--no-shared-memory', action='store_true',
+                        help='mỗi worker tự build model (để so sánh bộ nhớ)')
+    parser.add_argument('--memory-report', action='store_true',
+                        help='in RSS/PSS từng worker sau khi khởi động')
+    args = parser.parse_args()
+
+    import app as app_module
+
+    shared = None
+    if app_module.recommender is not None:
+        # Chờ similarity index đang tính ở background: không fork khi thread đó còn chạy, và bảng
+        # tính xong được đưa vào shared memory thay vì mỗi worker tính từng dòng
+        print("Waiting for the similarity index before forking workers")
+        app_module.recommender.ensure_similarity_index()
+        if not args.no_shared_memory:
+            shared = app_module.recommender.to_shared_memory()
+    app_module.flush_background_writers()
+    # Đưa các object hiện có ra khỏi GC để worker không chạm (copy-on-write) vào chúng
+    gc.collect()
+    gc.freeze()
+
+    listener = socket.create_server((args.host, args.port))
+    listener.set_inheritable(True)
+    ready_read, ready_write = os.pipe()
+
+    worker_pids = []
+    for _ in range(args.workers):
+        pid = os.fork()
+        if pid == 0:
+            os.close(ready_read)
+            try:
+                run_worker(app_module, listener, args.host, args.port, args.no_shared_memory, ready_write)
+            finally:
+                os._exit(0)
+        worker_pids.append(pid)
+    os.close(ready_write)
+
+    def stop(signum, frame):
+        for pid in worker_pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    started = 0
+    while started < len(worker_pids):
+        chunk = os.read(ready_read, len(worker_pids) - started)
+        if not chunk:
+            break
+        started += len(chunk)
+    print(f"{started} workers serving on http://{args.host}:{args.port} "
+          f"({'shared memory' if shared else 'one model per worker'})")
+    if args.memory_report:
+        time.sleep(0.5)
+        memory_report(os.getpid(), worker_pids, 'shared memory' if shared else 'one model per worker')
+        sys.stdout.flush()
+
+    try:
+        for _ in worker_pids:
+            os.wait()
+    finally:
+        stop(None, None)
+        if shared is not None:
+            shared.unlink()
+
+
+if __name__ == '__main__':
+    main()
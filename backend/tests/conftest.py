@@ -0,0 +1,11 @@
+"""Cấu hình chung cho test: import app và các script trong benchmarks/ từ thư mục backend."""
+import os
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.join(BACKEND_DIR, 'benchmarks'))
+# app.py đọc healthcare_data.csv và data/ theo đường dẫn tương đối
+os.chdir(BACKEND_DIR)
+os.environ.setdefault('LOG_LEVEL', 'warning')
+os.environ.setdefault('USER_STATE_BACKEND', 'memory')
@@ -0,0 +1,29 @@
+"""Analyzer tiếng Việt không làm giảm chất lượng tìm kiếm so với analyzer mặc định (như bench_analyzer.py)."""
+import contextlib
+import io
+
+import pytest
+
+from bench_analyzer import ProductRecommender, VietnameseAnalyzer, load_healthcare_data, relevance
+
+K = 5
+
+
+@pytest.fixture(scope='module')
+def products_df():
+    with contextlib.redirect_stdout(io.StringIO()):
+        return load_healthcare_data()
+
+
+def mean_recall(products_df, analyzer):
+    with contextlib.redirect_stdout(io.StringIO()):
+        recommender = ProductRecommender(products_df, analyzer=analyzer, catalog_version=f'test-{analyzer}')
+    recalls, misses = relevance(recommender, K)
+    return sum(recalls) / len(recalls), misses
+
+
+def test_vietnamese_analyzer_relevance(products_df):
+    recall, misses = mean_recall(products_df, VietnameseAnalyzer.name)
+    assert misses == []
+    default_recall, _ = mean_recall(products_df, 'default')
+    assert recall >= default_recall
@@ -0,0 +1,72 @@
+"""get_product_by_id / get_products_by_ids qua index id -> dòng khớp với cách quét DataFrame cũ."""
+import contextlib
+import io
+
+import pandas as pd
+import pytest
+
+from check_product_lookup import MISSING_IDS, app_module, legacy_product_by_id, legacy_products_by_ids
+from synthetic_catalog import write_catalog
+
+ROWS = 500
+
+
+@pytest.fixture(scope='module')
+def catalog(tmp_path_factory):
+    """(DataFrame đã load, danh sách id không trùng) của catalog giả lập có id trùng và dòng thiếu range"""
+    path = str(tmp_path_factory.mktemp('catalog') / 'catalog.csv')
+    products = write_catalog(ROWS, path)
+    duplicates = products.iloc[:5].copy()
+    duplicates['name'] = duplicates['name'] + ' (bản trùng)'
+    blank = products.iloc[5:8].copy()
+    blank['id'] = blank['id'] + ROWS
+    blank[['age_range', 'weight_range']] = ''
+    pd.concat([products, duplicates, blank]).to_csv(path, index=False, encoding='utf-8-sig')
+    with contextlib.redirect_stdout(io.StringIO()):
+        df = app_module.load_healthcare_data(path)
+    return df, [int(product_id) for product_id in dict.fromkeys(df['id'].tolist())]
+
+
+@pytest.fixture(scope='module', params=['dataframe', 'artifact'])
+def recommender(request, catalog):
+    """Recommender với store dựng từ DataFrame hoặc load lại từ artifact (records lazy)"""
+    df, _ = catalog
+    with contextlib.redirect_stdout(io.StringIO()):
+        recommender = app_module.ProductRecommender(df)
+    if request.param == 'artifact':
+        recommender.store = app_module.ProductStore.unpack(*recommender.store.pack())
+    return recommender
+
+
+def test_catalog_has_duplicate_ids(catalog):
+    df, ids = catalog
+    assert len(df) == len(ids) + 5
+
+
+def test_product_by_id_matches_dataframe_scan(catalog, recommender):
+    df, ids = catalog
+    for product_id in ids:
+        assert recommender.get_product_by_id(product_id) == legacy_product_by_id(df, product_id), product_id
+        assert recommender.get_product_by_id(str(product_id)) == legacy_product_by_id(df, product_id), product_id
+
+
+def test_duplicate_id_returns_first_row(catalog, recommender):
+    df, ids = catalog
+    for product_id in ids[:5]:
+        product = recommender.get_product_by_id(product_id)
+        assert not product['name'].endswith('(bản trùng)')
+        assert product == legacy_product_by_id(df, product_id)
+
+
+@pytest.mark.parametrize('product_id', MISSING_IDS)
+def test_missing_or_invalid_id(catalog, recommender, product_id):
+    df, _ = catalog
+    assert legacy_product_by_id(df, product_id) is None
+    assert recommender.get_product_by_id(product_id) is None
+
+
+def test_products_by_ids_matches_loop(catalog, recommender):
+    df, ids = catalog
+    batch = ids[::-1] + MISSING_IDS + ids[:10]
+    assert recommender.get_products_by_ids(batch) == legacy_products_by_ids(df, batch)
+    assert recommender.get_products_by_ids([]) == []